@@ -4,6 +4,7 @@ import pyodbc
 import json
 import os
 import re
+import time
 from decimal import Decimal
 
 # Configure the function app
@@ -52,14 +53,24 @@ if SQL_CONNECTION_STRING:
 else:
     raise ValueError("SQL_CONNECTION_STRING environment variable is not set")
 
-def run_query(query: str, params=None):
-    """Execute a SQL query and return the results"""
+def run_query(query: str, params=None, timings=None):
+    """Execute a SQL query and return the results.
+
+    If a timings dict is passed, the duration in milliseconds of the connect, execute and fetch
+    phases is added to it.
+    """
     results = []
+    timings = {} if timings is None else timings
     
     try:
+        started = time.perf_counter()
         with pyodbc.connect(conn_string, timeout=30) as conn:
+            timings["connect"] = (time.perf_counter() - started) * 1000
             with conn.cursor() as cursor:
+                started = time.perf_counter()
                 cursor.execute(query, params or [])
+                timings["execute"] = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
                 if cursor.description:
                     columns = [c[0] for c in cursor.description]
                     for row in cursor.fetchall():
@@ -71,11 +82,39 @@ def run_query(query: str, params=None):
                                 value = float(value)
                             row_dict[columns[i]] = value
                         results.append(row_dict)
+                timings["fetch"] = (time.perf_counter() - started) * 1000
         return results
     except Exception as e:
         logging.error(f"Database error: {str(e)}")
         raise
 
+def parse_request_id(value: str):
+    """Split a hierarchical Request-Id (|<trace_id>.<span_id>.) into trace and parent span ids."""
+    parts = [part for part in (value or "").strip("|").split(".") if part]
+    if not parts:
+        return None, None
+    return parts[0], parts[-1] if len(parts) > 1 else None
+
+def json_response(req: func.HttpRequest, results, timings) -> func.HttpResponse:
+    """
+    Build the JSON response for a query.
+
+    The phase timings are returned in the Server-Timing header, so the caller can add them to its
+    trace, and logged together with the caller's Request-Id for correlation in Application Insights.
+    """
+    started = time.perf_counter()
+    body = json.dumps({"results": results})
+    timings["serialize"] = (time.perf_counter() - started) * 1000
+
+    request_id = req.headers.get("Request-Id")
+    trace_id, parent_id = parse_request_id(request_id)
+    logging.info(json.dumps({"trace_id": trace_id, "parent_id": parent_id, "url": req.url, "phases_ms": timings}))
+
+    headers = {"Server-Timing": ", ".join(f"{name};dur={duration:.2f}" for name, duration in timings.items())}
+    if request_id:
+        headers["Request-Id"] = request_id
+    return func.HttpResponse(body, mimetype="application/json", headers=headers)
+
 @app.route(route="sql/sales/regions", auth_level=func.AuthLevel.ANONYMOUS)
 def get_sales_by_region(req: func.HttpRequest) -> func.HttpResponse:
     """Get sales data by region"""
@@ -121,8 +160,9 @@ def get_sales_by_region(req: func.HttpRequest) -> func.HttpResponse:
             """
             params = []
 
-        results = run_query(query, params)
-        return func.HttpResponse(json.dumps({"results": results}), mimetype="application/json")
+        timings = {}
+        results = run_query(query, params, timings)
+        return json_response(req, results, timings)
 
     except Exception as e:
         logging.error(f"Error getting sales by region: {str(e)}")
@@ -150,10 +190,9 @@ def get_sales_by_category(req: func.HttpRequest) -> func.HttpResponse:
     ORDER BY 
         TotalRevenue DESC
     """
-    results = run_query(query)
-    return func.HttpResponse(
-        json.dumps({"results": results}), mimetype="application/json"
-    )
+    timings = {}
+    results = run_query(query, timings=timings)
+    return json_response(req, results, timings)
 
 
 # Function to get sales data by customer segment
@@ -172,10 +211,9 @@ def get_sales_by_channel(req: func.HttpRequest) -> func.HttpResponse:
     ORDER BY 
         TotalRevenue DESC
     """
-    results = run_query(query)
-    return func.HttpResponse(
-        json.dumps({"results": results}), mimetype="application/json"
-    )
+    timings = {}
+    results = run_query(query, timings=timings)
+    return json_response(req, results, timings)
 
 # Function to get top customers based on sales
 @app.route(route="sql/customers/top", auth_level=func.AuthLevel.ANONYMOUS)
@@ -204,10 +242,9 @@ def get_top_customers(req: func.HttpRequest) -> func.HttpResponse:
         OFFSET 0 ROWS
         FETCH NEXT ? ROWS ONLY
         """
-        results = run_query(query, [limit])
-        return func.HttpResponse(
-            json.dumps({"results": results}), mimetype="application/json"
-        )
+        timings = {}
+        results = run_query(query, [limit], timings)
+        return json_response(req, results, timings)
     except Exception as e:
         return func.HttpResponse(
             json.dumps({"error": "Error getting top customers", "details": str(e)}),
@@ -235,5 +272,82 @@ def get_product_performance(req: func.HttpRequest) -> func.HttpResponse:
     ORDER BY 
         TotalRevenue DESC
     """
-    results = run_query(query)
-    return func.HttpResponse(json.dumps({"results": results}), mimetype="application/json")
\ No newline at end of file
+    timings = {}
+    results = run_query(query, timings=timings)
+    return json_response(req, results, timings)
+
+
+# Function to describe the tables, so the agent's schema prompt is generated from the live database
+@app.route(route="sql/schema", auth_level=func.AuthLevel.ANONYMOUS)
+def get_schema(req: func.HttpRequest) -> func.HttpResponse:
+    columns_query = """
+    SELECT 
+        c.TABLE_NAME, t.TABLE_TYPE, c.COLUMN_NAME, c.DATA_TYPE,
+        c.CHARACTER_MAXIMUM_LENGTH, c.NUMERIC_PRECISION, c.NUMERIC_SCALE, c.IS_NULLABLE
+    FROM 
+        INFORMATION_SCHEMA.COLUMNS c
+        JOIN INFORMATION_SCHEMA.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+    WHERE 
+        c.TABLE_SCHEMA = 'dbo'
+    ORDER BY 
+        c.TABLE_NAME, c.ORDINAL_POSITION
+    """
+    keys_query = """
+    SELECT 
+        OBJECT_NAME(ic.object_id) as TABLE_NAME,
+        COL_NAME(ic.object_id, ic.column_id) as COLUMN_NAME,
+        NULL as REFERENCED_TABLE
+    FROM 
+        sys.index_columns ic
+        JOIN sys.indexes i ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+    WHERE 
+        i.is_primary_key = 1
+    UNION ALL
+    SELECT 
+        OBJECT_NAME(fkc.parent_object_id),
+        COL_NAME(fkc.parent_object_id, fkc.parent_column_id),
+        OBJECT_NAME(fkc.referenced_object_id)
+    FROM 
+        sys.foreign_key_columns fkc
+    """
+    try:
+        timings = {}
+        columns = run_query(columns_query, timings=timings)
+        key_timings = {}
+        keys = run_query(keys_query, timings=key_timings)
+        for phase, duration in key_timings.items():
+            timings[phase] += duration
+
+        primary_keys = {(k["TABLE_NAME"], k["COLUMN_NAME"]) for k in keys if k["REFERENCED_TABLE"] is None}
+        references = {(k["TABLE_NAME"], k["COLUMN_NAME"]): k["REFERENCED_TABLE"] for k in keys if k["REFERENCED_TABLE"]}
+
+        tables = {}
+        for column in columns:
+            data_type = column["DATA_TYPE"].upper()
+            if column["CHARACTER_MAXIMUM_LENGTH"]:
+                length = column["CHARACTER_MAXIMUM_LENGTH"]
+                data_type = f"{data_type}({'MAX' if length == -1 else length})"
+            elif data_type in ("DECIMAL", "NUMERIC"):
+                data_type = f"{data_type}({column['NUMERIC_PRECISION']},{column['NUMERIC_SCALE']})"
+
+            key = (column["TABLE_NAME"], column["COLUMN_NAME"])
+            table = tables.setdefault(
+                column["TABLE_NAME"],
+                {"name": column["TABLE_NAME"], "view": column["TABLE_TYPE"] == "VIEW", "columns": []},
+            )
+            table["columns"].append(
+                {
+                    "name": column["COLUMN_NAME"],
+                    "type": data_type,
+                    "nullable": column["IS_NULLABLE"] == "YES",
+                    "primary_key": key in primary_keys,
+                    "references": references.get(key),
+                }
+            )
+        return json_response(req, list(tables.values()), timings)
+    except Exception as e:
+        return func.HttpResponse(
+            json.dumps({"error": "Error getting the schema", "details": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
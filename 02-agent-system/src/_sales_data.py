@@ -1,283 +1,253 @@
-import os
-import json
 import logging
-import requests
-from typing import Dict, Any, List, Optional
+import os
+import sqlite3
+from typing import Any, Dict, Optional
+
+import httpx
+
+from sql_cache import QueryResultCache, append_query_log, cache_key, canonicalize_sql, rename_columns
+from sqlite_engine import QueryTimeoutError, SQLiteEngine
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# Connection pool and timeouts of the shared HTTP client
+MAX_CONNECTIONS = int(os.getenv("SQL_API_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SQL_API_MAX_KEEPALIVE_CONNECTIONS", "10"))
+REQUEST_TIMEOUT = float(os.getenv("SQL_API_TIMEOUT", "30"))
+CONNECT_TIMEOUT = float(os.getenv("SQL_API_CONNECT_TIMEOUT", "5"))
+
+
 class SQLData:
     """Class to interact with sales data through the SQL API."""
 
-    def __init__(self, utilities=None):
+    def __init__(
+        self, utilities=None, engine: Optional[SQLiteEngine] = None, cache: Optional[QueryResultCache] = None
+    ):
         """Initialize the SQLData class."""
         self.utilities = utilities
         self.apim_gateway_url = os.getenv("APIM_GATEWAY_URL")
         self.apim_subscription_key = os.getenv("APIM_SUBSCRIPTION_KEY")
-        
+        self.engine = engine or SQLiteEngine()
+        self.cache = cache or QueryResultCache()
+        self._client: Optional[httpx.AsyncClient] = None
+
         # Check if the required environment variables are set
         if not self.apim_gateway_url or not self.apim_subscription_key:
-            logger.warning("APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set. SQL query functionality will not work.")
+            logger.warning("APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set. The APIM sales routes will not work.")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled HTTP client shared by all requests, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.apim_gateway_url,
+                headers={"api-key": self.apim_subscription_key, "Content-Type": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Close the pooled HTTP client and the local query engine."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await self.engine.close()
+
+    async def _post(self, route: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Post a request to an APIM route and return the parsed JSON response.
+
+        Raises:
+            httpx.HTTPError: If the request fails or returns a non-2xx status code
+        """
+        with tracer.span(f"http POST /{route}") as http_span:
+            response = await self.client.post(
+                f"/{route}", json=payload, headers={"Request-Id": tracer.request_id(http_span)}
+            )
+            http_span.attributes["status"] = response.status_code
+            tracer.record_server_timing(http_span, response.headers.get("Server-Timing"))
+            response.raise_for_status()
+            with tracer.span("parse"):
+                return response.json()
 
     async def execute_sql_query(self, query: str, parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """Execute a SQL query against the database.
-        
+        """Execute a read-only SQL query against the local SQLite sales database.
+
         Args:
-            query: The SQL query to execute
-            parameters: Optional parameters for the SQL query
-            
+            query: The SQLite query to execute
+            parameters: Optional named parameters for the SQL query
+
         Returns:
             A dictionary with the query results
         """
-        if self.utilities:
-            self.utilities.append_log("Executing SQL query: " + query)
-        
-        if not self.apim_gateway_url or not self.apim_subscription_key:
-            error_msg = "Cannot execute SQL query: APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set."
-            logger.error(error_msg)
-            return {"error": error_msg}
-        
-        # Prepare the request
-        url = f"{self.apim_gateway_url}/sql/query"
-        headers = {
-            "api-key": self.apim_subscription_key,
-            "Content-Type": "application/json"
-        }
-        
-        # Create request payload
-        payload = {
-            "query": query
-        }
-        
-        if parameters:
-            payload["parameters"] = parameters
-        
+        logger.info("Executing SQL query: %s", query)
+        append_query_log(query, parameters)
+
         try:
-            # Make the request
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()  # Raise an exception for non-2xx status codes
-            
-            # Parse and return the response
-            result = response.json()
-            
-            if self.utilities:
-                self.utilities.append_log(f"SQL query executed successfully. Returned {len(result.get('results', []))} records.")
-            
+            await self.engine.start()
+            canonical = canonicalize_sql(query)
+            key = cache_key(canonical, parameters, self.engine.data_version)
+            # Cached results carry canonical column aliases; give them this query's alias names, as spelled
+            # where they are defined (their first appearance)
+            to_query_aliases: Dict[str, str] = {}
+            for name, canonical_name in canonical.aliases.items():
+                to_query_aliases.setdefault(canonical_name, name)
+
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("SQL query answered from cache (hit rate %.1f%%)", self.cache.hit_rate * 100)
+                return rename_columns(cached, to_query_aliases)
+
+            with tracer.span("sqlite query"):
+                result = await self.engine.execute(query, parameters)
+            logger.info("SQL query executed successfully. Returned %d records.", len(result["results"]))
+            self.cache.put(key, rename_columns(result, canonical.aliases))
             return result
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Error executing SQL query: {str(e)}"
-            if self.utilities:
-                self.utilities.append_log(error_msg)
+        except QueryTimeoutError as e:
+            error_msg = f"Error executing SQL query: {e!s}. Aggregate or filter the data further."
+            logger.error(error_msg)
+            return {"error": error_msg}
+        except sqlite3.Error as e:
+            error_msg = f"Error executing SQL query: {e!s}"
             logger.error(error_msg)
-            
-            # Try to parse error response if available
-            try:
-                error_details = response.json()
-                return {"error": error_msg, "details": error_details}
-            except:
-                return {"error": error_msg}
+            return {"error": error_msg}
 
     async def get_sales_by_region(self, region_name: Optional[str] = None) -> Dict[str, Any]:
         """Get sales data by region.
-        
+
         Args:
             region_name: Optional name of the region to filter by
-            
+
         Returns:
             Sales data for the specified region or all regions if not specified
         """
-        if self.utilities:
-            self.utilities.append_log(f"Getting sales data for region: {region_name if region_name else 'all regions'}")
-        
+        logger.info("Getting sales data for region: %s", region_name if region_name else "all regions")
+
         if not self.apim_gateway_url or not self.apim_subscription_key:
             error_msg = "Cannot execute SQL query: APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set."
             logger.error(error_msg)
             return {"error": error_msg}
-        
-        # Prepare the request
-        url = f"{self.apim_gateway_url}/sql/sales/regions"
-        headers = {
-            "api-key": self.apim_subscription_key,
-            "Content-Type": "application/json"
-        }
-        
+
         # Create request payload
         payload = {}
         if region_name:
             payload["region_name"] = region_name
-        
+
         try:
-            # Make the request
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            # Parse and return the response
-            result = response.json()
-            
-            if self.utilities:
-                self.utilities.append_log(f"Retrieved sales data for {region_name if region_name else 'all regions'}")
-            
+            result = await self._post("sql/sales/regions", payload)
+            logger.info("Retrieved sales data for %s", region_name if region_name else "all regions")
             return result
-            
+
         except Exception as e:
-            error_msg = f"Error getting sales by region: {str(e)}"
-            if self.utilities:
-                self.utilities.append_log(error_msg)
+            error_msg = f"Error getting sales by region: {e!s}"
             logger.error(error_msg)
             return {"error": error_msg}
-    
+
     async def get_product_sales(self, product_category: Optional[str] = None) -> Dict[str, Any]:
         """Get sales data by product category.
-        
+
         Args:
             product_category: Optional product category to filter by
-            
+
         Returns:
             Sales data for the specified product category or all categories if not specified
         """
-        if self.utilities:
-            self.utilities.append_log(f"Getting sales data for product category: {product_category if product_category else 'all categories'}")
-        
+        logger.info(
+            "Getting sales data for product category: %s", product_category if product_category else "all categories"
+        )
+
         if not self.apim_gateway_url or not self.apim_subscription_key:
             error_msg = "Cannot execute SQL query: APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set."
             logger.error(error_msg)
             return {"error": error_msg}
-        
-        # Prepare the request
-        url = f"{self.apim_gateway_url}/sql/sales/products"
-        headers = {
-            "api-key": self.apim_subscription_key,
-            "Content-Type": "application/json"
-        }
-        
+
         # Create request payload
         payload = {}
         if product_category:
             payload["product_category"] = product_category
-        
+
         try:
-            # Make the request
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            # Parse and return the response
-            result = response.json()
-            
-            if self.utilities:
-                self.utilities.append_log(f"Retrieved product sales data for {product_category if product_category else 'all categories'}")
-            
+            result = await self._post("sql/sales/products", payload)
+            logger.info(
+                "Retrieved product sales data for %s", product_category if product_category else "all categories"
+            )
             return result
-            
+
         except Exception as e:
-            error_msg = f"Error getting product sales: {str(e)}"
-            if self.utilities:
-                self.utilities.append_log(error_msg)
+            error_msg = f"Error getting product sales: {e!s}"
             logger.error(error_msg)
             return {"error": error_msg}
-    
+
     async def get_customer_sales(self, customer_type: Optional[str] = None) -> Dict[str, Any]:
         """Get sales data by customer type.
-        
+
         Args:
             customer_type: Optional customer type to filter by
-            
+
         Returns:
             Sales data for the specified customer type or all types if not specified
         """
-        if self.utilities:
-            self.utilities.append_log(f"Getting sales data for customer type: {customer_type if customer_type else 'all types'}")
-        
+        logger.info("Getting sales data for customer type: %s", customer_type if customer_type else "all types")
+
         if not self.apim_gateway_url or not self.apim_subscription_key:
             error_msg = "Cannot execute SQL query: APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set."
             logger.error(error_msg)
             return {"error": error_msg}
-        
-        # Prepare the request
-        url = f"{self.apim_gateway_url}/sql/sales/customers"
-        headers = {
-            "api-key": self.apim_subscription_key,
-            "Content-Type": "application/json"
-        }
-        
+
         # Create request payload
         payload = {}
         if customer_type:
             payload["customer_type"] = customer_type
-        
+
         try:
-            # Make the request
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            # Parse and return the response
-            result = response.json()
-            
-            if self.utilities:
-                self.utilities.append_log(f"Retrieved customer sales data for {customer_type if customer_type else 'all types'}")
-            
+            result = await self._post("sql/sales/customers", payload)
+            logger.info("Retrieved customer sales data for %s", customer_type if customer_type else "all types")
             return result
-            
+
         except Exception as e:
-            error_msg = f"Error getting customer sales: {str(e)}"
-            if self.utilities:
-                self.utilities.append_log(error_msg)
+            error_msg = f"Error getting customer sales: {e!s}"
             logger.error(error_msg)
             return {"error": error_msg}
-        
+
     async def get_sales_over_time(self, period_type: str = "month") -> Dict[str, Any]:
         """Get sales data over time.
-        
+
         Args:
             period_type: The time period to group by ('month' or 'quarter')
-            
+
         Returns:
             Sales data grouped by the specified time period
         """
-        if self.utilities:
-            self.utilities.append_log(f"Getting sales data over time by {period_type}")
-        
+        logger.info("Getting sales data over time by %s", period_type)
+
         if not self.apim_gateway_url or not self.apim_subscription_key:
             error_msg = "Cannot execute SQL query: APIM_GATEWAY_URL or APIM_SUBSCRIPTION_KEY not set."
             logger.error(error_msg)
             return {"error": error_msg}
-        
-        # Prepare the request
-        url = f"{self.apim_gateway_url}/sql/sales/time-series"
-        headers = {
-            "api-key": self.apim_subscription_key,
-            "Content-Type": "application/json"
-        }
-        
+
         # Create request payload
         payload = {"period_type": period_type}
-        
+
         try:
-            # Make the request
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            # Parse and return the response
-            result = response.json()
-            
-            if self.utilities:
-                self.utilities.append_log(f"Retrieved sales time series data by {period_type}")
-            
+            result = await self._post("sql/sales/time-series", payload)
+            logger.info("Retrieved sales time series data by %s", period_type)
             return result
-            
+
         except Exception as e:
-            error_msg = f"Error getting sales over time: {str(e)}"
-            if self.utilities:
-                self.utilities.append_log(error_msg)
+            error_msg = f"Error getting sales over time: {e!s}"
             logger.error(error_msg)
             return {"error": error_msg}
-        
+
     async def run_custom_query(self, query: str, parameters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """Run a custom SQL query.
-        
+
         Args:
             query: The SQL query to execute
             parameters: Optional parameters for the SQL query
-            
+
         Returns:
             The query results
         """
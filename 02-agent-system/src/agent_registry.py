@@ -0,0 +1,137 @@
+import contextlib
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import Agent, AsyncToolSet
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_FILE = Path(__file__).parent / ".cache" / "agents.json"
+
+
+def agent_fingerprint(*, name: str, model: str, instructions: str, toolset: AsyncToolSet, temperature: float) -> str:
+    """Hash everything that defines the agent, so any change to it produces a new fingerprint."""
+    definition = {
+        "name": name,
+        "model": model,
+        "instructions": instructions,
+        # AsyncFunctionTool lists its functions in set order, which differs between processes
+        "tools": sorted(
+            (tool.as_dict() for tool in toolset.definitions), key=lambda tool: json.dumps(tool, sort_keys=True)
+        ),
+        "tool_resources": toolset.resources.as_dict() if toolset.resources else None,
+        "temperature": temperature,
+    }
+    return hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def register_toolset(project_client: AIProjectClient, agent_id: str, toolset: AsyncToolSet) -> bool:
+    """
+    Let the SDK execute function calls for an agent this process did not create.
+
+    The SDK keeps the toolset of each agent created or updated through the client in a private map and
+    uses it to run function calls while streaming; a reused agent has to be added to that map. Returns
+    False if the map is not there, in which case the agent has to be updated to register its toolset.
+    """
+    # AgentsOperations._toolset of azure-ai-projects 1.0.0b8 (pinned in shared/requirements.txt), which has no
+    # public way to attach a toolset to an existing agent. Check this when upgrading the SDK.
+    toolsets = getattr(project_client.agents, "_toolset", None)
+    if not isinstance(toolsets, dict):
+        logger.warning("This SDK version cannot register the toolset of a reused agent; updating the agent instead")
+        return False
+    toolsets[agent_id] = toolset
+    return True
+
+
+class AgentRegistry:
+    """Local record of the agents created by this app, so an unchanged agent is reused across launches."""
+
+    def __init__(self, path: Path = DEFAULT_REGISTRY_FILE) -> None:
+        self.path = Path(path)
+        self._entries: dict[str, dict[str, Any]] = self._load()
+
+    async def get_or_create(
+        self,
+        project_client: AIProjectClient,
+        *,
+        name: str,
+        model: str,
+        instructions: str,
+        toolset: AsyncToolSet,
+        temperature: float,
+        headers: Optional[dict[str, str]] = None,
+    ) -> tuple[Agent, str]:
+        """
+        Return the registered agent if its definition is unchanged, update it if it changed, or create it.
+
+        Returns:
+            The agent and how it was obtained: "reused", "updated" or "created".
+        """
+        fingerprint = agent_fingerprint(
+            name=name, model=model, instructions=instructions, toolset=toolset, temperature=temperature
+        )
+        entry = self._entries.get(name)
+        agent = None
+
+        if entry:
+            try:
+                agent = await project_client.agents.get_agent(entry["agent_id"])
+            except ResourceNotFoundError:
+                logger.info("Registered agent %s no longer exists", entry["agent_id"])
+
+        if agent and entry["fingerprint"] == fingerprint and register_toolset(project_client, agent.id, toolset):
+            return agent, "reused"
+
+        if agent:
+            agent = await project_client.agents.update_agent(
+                agent.id,
+                model=model,
+                name=name,
+                instructions=instructions,
+                toolset=toolset,
+                temperature=temperature,
+                headers=headers,
+            )
+            outcome = "updated"
+        else:
+            agent = await project_client.agents.create_agent(
+                model=model,
+                name=name,
+                instructions=instructions,
+                toolset=toolset,
+                temperature=temperature,
+                headers=headers,
+            )
+            outcome = "created"
+
+        self._entries[name] = {"agent_id": agent.id, "fingerprint": fingerprint, "updated_at": time.time()}
+        self._save()
+        return agent, outcome
+
+    async def delete(self, project_client: AIProjectClient, name: str) -> None:
+        """Delete the registered agent and forget it."""
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return
+        with contextlib.suppress(ResourceNotFoundError):
+            await project_client.agents.delete_agent(entry["agent_id"])
+        self._save()
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable agent registry %s: %s", self.path, e)
+            return {}
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self._entries, indent=2), encoding="utf-8")
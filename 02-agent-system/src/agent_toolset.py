@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from azure.ai.projects.models import AsyncFunctionTool, AsyncToolSet, RequiredFunctionToolCall, RequiredToolCall
+
+from tool_output_store import ToolOutputStore
+from tracing import tracer
+from utilities import Utilities
+
+logger = logging.getLogger(__name__)
+
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", "30"))
+
+
+class AgentToolSet(AsyncToolSet):
+    """
+    Tool set that runs the function tool calls of a run step concurrently and traces each of them.
+
+    With an output store, outputs over its size limit are spilled to files and replaced by a summary.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = TOOL_CONCURRENCY,
+        timeout_s: float = TOOL_TIMEOUT_S,
+        *,
+        timeouts: Optional[dict[str, float]] = None,
+        utilities: Optional[Utilities] = None,
+        output_store: Optional[ToolOutputStore] = None,
+    ) -> None:
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self.timeout_s = timeout_s
+        self.timeouts = timeouts or {}
+        self.util = utilities
+        self.output_store = output_store
+        self.step_stats: list[dict[str, Any]] = []
+
+    async def execute_tool_calls(self, tool_calls: list[RequiredToolCall]) -> list[dict[str, str]]:
+        """Execute the function tool calls of a run step and return their outputs once all are ready."""
+        received = time.time()
+        function_calls = [tool_call for tool_call in tool_calls if isinstance(tool_call, RequiredFunctionToolCall)]
+        if not function_calls:
+            return []
+
+        tool = self.get_tool(AsyncFunctionTool)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        durations: list[float] = []
+
+        async def run(tool_call: RequiredFunctionToolCall) -> dict[str, str]:
+            name = tool_call.function.name
+            timeout_s = self.timeouts.get(name, self.timeout_s)
+            with tracer.span(f"tool {name}", start=received, tool_call_id=tool_call.id) as span:
+                async with semaphore:
+                    # Time spent waiting for a free slot
+                    tracer.record_span("queue", received, time.time(), span)
+                    started = time.perf_counter()
+                    try:
+                        output = await asyncio.wait_for(tool.execute(tool_call), timeout_s)
+                    except asyncio.TimeoutError:
+                        span.status = "error"
+                        logger.error("Tool call %s timed out after %ss", name, timeout_s)
+                        output = json.dumps({"error": f"The function {name} timed out after {timeout_s}s"})
+                    except Exception as e:
+                        span.status = "error"
+                        logger.error("Failed to execute tool call %s: %s", tool_call, e)
+                        output = json.dumps({"error": f"The function {name} failed: {e!s}"})
+                    durations.append(time.perf_counter() - started)
+                span.attributes["output_chars"] = len(output)
+                if self.output_store:
+                    output = await self.output_store.apply(name, tool_call.id, output)
+                    span.attributes["sent_chars"] = len(output)
+            return {"tool_call_id": tool_call.id, "output": output}
+
+        started = time.perf_counter()
+        tool_outputs = await asyncio.gather(*(run(tool_call) for tool_call in function_calls))
+        self._report_step(len(function_calls), sum(durations), time.perf_counter() - started)
+        return tool_outputs
+
+    def _report_step(self, calls: int, sequential_s: float, wall_s: float) -> None:
+        """Record how much wall-clock time running the step's calls concurrently saved."""
+        stats = {
+            "calls": calls,
+            "sequential_ms": round(sequential_s * 1000, 1),
+            "wall_ms": round(wall_s * 1000, 1),
+            "saved_ms": round(max(sequential_s - wall_s, 0) * 1000, 1),
+        }
+        self.step_stats.append(stats)
+        if span := tracer.current_span():
+            span.attributes.setdefault("tool_steps", []).append(stats)
+        logger.info("Tool step: %s", stats)
+
+        if self.util and calls > 1:
+            self.util.log_msg_purple(
+                f"\nRan {calls} tool calls in {stats['wall_ms']:.0f} ms "
+                f"(sequential {stats['sequential_ms']:.0f} ms, saved {stats['saved_ms']:.0f} ms)"
+            )
@@ -0,0 +1,251 @@
+"""
+Answer cache for repeated and near-duplicate questions.
+
+Prompts are compared after dropping punctuation and filler words and folding plurals. A prompt with the same
+words and numbers as a cached one, such as "Sales by region?" and "show me the sales per regions", is found
+directly by its word set. Other prompts with the same numbers match when the cosine similarity of their
+character trigram counts is at least ANSWER_CACHE_THRESHOLD, which catches near-misses such as a typo in
+"product catgory" but not "camping" and "climbing". Either way the answer must be for the same data
+version (the sales data, instructions and model) and younger than ANSWER_CACHE_TTL_S. Prompts that refer to
+earlier turns ("show that as a pie chart") are never cached.
+
+    python answer_cache.py similarity "sales by region" "show me sales per region"
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = Path(__file__).parent / ".cache" / "answers.json"
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.9"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+
+# Prompts that refer to earlier turns depend on the conversation, not just on the question
+_CONTEXT_WORDS = re.compile(
+    r"\b(it|its|that|this|these|those|them|they|above|previous|same|again|instead|also|more)\b", re.IGNORECASE
+)
+
+
+# Words that do not change what a question asks for
+_FILLER_WORDS = {
+    "a", "an", "are", "can", "could", "do", "give", "is", "list", "me", "of", "our", "please", "show", "tell",
+    "the", "us", "we", "what", "whats", "which", "who", "you",
+}  # fmt: skip
+_SYNONYMS = {"per": "by", "across": "by", "clients": "customers", "client": "customer", "revenues": "revenue"}
+
+
+def normalize(prompt: str) -> str:
+    """Lowercase prompt and drop punctuation and filler words."""
+    words = re.sub(r"[^\w\s]", " ", prompt.lower()).split()
+    return " ".join(_SYNONYMS.get(word, word) for word in words if word not in _FILLER_WORDS)
+
+
+def trigrams(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[index : index + 3] for index in range(len(padded) - 2))
+
+
+def cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+def similarity(a: str, b: str) -> float:
+    """Similarity of two prompts between 0 and 1."""
+    return cosine(trigrams(normalize(a)), trigrams(normalize(b)))
+
+
+def data_version(*parts: str) -> str:
+    """Version string for the inputs an answer depends on; any change invalidates the cached answers."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def numbers(prompt: str) -> list[str]:
+    return re.findall(r"\d+(?:\.\d+)?", prompt)
+
+
+def content_words(prompt: str) -> set[str]:
+    """The words left after normalization, with plurals folded, so "customer" and "customers" are the same word."""
+    return {word.removesuffix("s") if len(word) > 3 else word for word in normalize(prompt).split()}
+
+
+def word_key(prompt: str, version: str) -> tuple[str, tuple[str, ...], frozenset[str]]:
+    """Key of the prompts that ask the same question in different spellings, for the same data version."""
+    return version, tuple(numbers(prompt)), frozenset(content_words(prompt))
+
+
+def is_cacheable(prompt: str) -> bool:
+    """Whether a prompt stands on its own, so its answer does not depend on earlier turns."""
+    return not _CONTEXT_WORDS.search(prompt)
+
+
+@dataclass
+class CachedAnswer:
+    prompt: str
+    answer: str
+    data_version: str
+    created: float = field(default_factory=time.time)
+    hits: int = 0
+    similarity: float = field(default=1.0, compare=False)
+
+
+class AnswerCache:
+    """Persistent cache of agent answers, looked up by prompt similarity."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_CACHE_FILE,
+        *,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_s: float = ANSWER_CACHE_TTL_S,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._entries: list[CachedAnswer] = self._load()
+        self._vectors = [trigrams(normalize(entry.prompt)) for entry in self._entries]
+        self._by_words = {word_key(entry.prompt, entry.data_version): entry for entry in self._entries}
+
+    @property
+    def entries(self) -> list[CachedAnswer]:
+        return list(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, prompt: str, version: str) -> Optional[CachedAnswer]:
+        """
+        Return the cached answer of a prompt with the same words and numbers for this data version, or else of
+        the most similar prompt with the same numbers, if similar enough.
+        """
+        if not is_cacheable(prompt):
+            return None
+
+        vector = trigrams(normalize(prompt))
+        now = time.time()
+        best = self._by_words.get(word_key(prompt, version))
+        if best is not None and now - best.created <= self.ttl_s:
+            best_score = cosine(vector, trigrams(normalize(best.prompt)))
+        else:
+            prompt_numbers = numbers(prompt)
+            best, best_score = None, 0.0
+            for entry, entry_vector in zip(self._entries, self._vectors, strict=True):
+                if entry.data_version != version or now - entry.created > self.ttl_s:
+                    continue
+                # "top 5 customers" and "top 10 customers" are different questions however similar the text
+                if numbers(entry.prompt) != prompt_numbers:
+                    continue
+                score = cosine(vector, entry_vector)
+                if score > best_score:
+                    best, best_score = entry, score
+            if best_score < self.threshold:
+                best = None
+
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        best.hits += 1
+        best.similarity = best_score
+        self._save()
+        logger.info("Answer cache hit (similarity %.3f, hit rate %.1f%%)", best_score, self.hit_rate * 100)
+        return best
+
+    def store(self, prompt: str, answer: str, version: str) -> None:
+        """Cache the answer to a prompt, replacing the entry of an identical prompt."""
+        if not answer.strip() or not is_cacheable(prompt):
+            return
+        key = normalize(prompt)
+        now = time.time()
+        kept = [
+            (entry, vector)
+            for entry, vector in zip(self._entries, self._vectors, strict=True)
+            if normalize(entry.prompt) != key and entry.data_version == version and now - entry.created <= self.ttl_s
+        ]
+        kept.append((CachedAnswer(prompt, answer, version), trigrams(key)))
+        kept = kept[-self.max_entries :]
+        self._entries = [entry for entry, _ in kept]
+        self._vectors = [vector for _, vector in kept]
+        self._by_words = {word_key(entry.prompt, entry.data_version): entry for entry in self._entries}
+        self._save()
+
+    def clear(self) -> None:
+        self._entries, self._vectors, self._by_words = [], [], {}
+        self._save()
+
+    def _load(self) -> list[CachedAnswer]:
+        if not self.path:
+            return []
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+            return [CachedAnswer(**entry) for entry in entries]
+        except FileNotFoundError:
+            return []
+        except (OSError, TypeError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable answer cache %s: %s", self.path, e)
+            return []
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            entries = [{k: v for k, v in asdict(entry).items() if k != "similarity"} for entry in self._entries]
+            self.path.write_text(json.dumps(entries, indent=1), encoding="utf-8")
+        except OSError as e:
+            logger.error("Could not write the answer cache %s: %s", self.path, e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the answer cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    similarity_parser = commands.add_parser("similarity", help="Print the similarity of two prompts.")
+    similarity_parser.add_argument("a")
+    similarity_parser.add_argument("b")
+    commands.add_parser("list", help="List the cached prompts.")
+    commands.add_parser("clear", help="Remove all cached answers.")
+    args = parser.parse_args()
+
+    if args.command == "similarity":
+        score = similarity(args.a, args.b)
+        print(f"{score:.3f} (threshold {ANSWER_CACHE_THRESHOLD})")
+        if numbers(args.a) != numbers(args.b):
+            print("No match, the numbers differ")
+        elif content_words(args.a) == content_words(args.b):
+            print("Match, the words are the same")
+        else:
+            print("Match" if score >= ANSWER_CACHE_THRESHOLD else "No match, not similar enough")
+        return
+
+    cache = AnswerCache()
+    if args.command == "clear":
+        cache.clear()
+        print("Answer cache cleared.")
+    else:
+        for entry in cache.entries:
+            print(f"{entry.hits:>4} hits  {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.created))}  {entry.prompt}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Headless batch runs: answer a file of prompts concurrently and report throughput and latency.
+
+Each prompt runs in its own thread. Live runs go through the agent (python main.py --batch prompts.jsonl);
+offline runs replace the model with a local stand-in that calls the data tools against the mock server:
+
+    python batch.py batch_prompts.jsonl --concurrency 8 --profile azure
+
+The prompt file has one JSON object per line with a "prompt" (and optionally an "id"), or one prompt per line.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections.abc import Awaitable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from azure.ai.projects.models import MessageDeltaChunk, RunStep, ThreadMessage, ThreadRun
+
+from benchmark import is_error, percentile
+from stream_event_handler import StreamEventHandler
+
+if TYPE_CHECKING:
+    from enza_data import EnzaData
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULTS_FILE = Path(__file__).parent / ".cache" / "batch_results.jsonl"
+
+
+@dataclass
+class PromptResult:
+    """What one prompt produced and how long it took."""
+
+    id: str
+    prompt: str
+    answer: str = ""
+    tool_calls: list[str] = field(default_factory=list)
+    ttft_ms: Optional[float] = None
+    latency_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: Optional[str] = None
+    started: float = field(default=0.0, repr=False)
+
+    def first_token(self) -> None:
+        """Record the time to first token, once."""
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self.started) * 1000
+
+
+# Answer one prompt, filling in its result
+RunPrompt = Callable[[PromptResult], Awaitable[None]]
+
+
+class BatchEventHandler(StreamEventHandler):
+    """Stream handler that records the answer, tool calls, first token time and usage instead of printing."""
+
+    # kwargs are passed on to StreamEventHandler as they are
+    def __init__(self, result: PromptResult, **kwargs: Any) -> None:  # noqa: ANN401
+        kwargs.setdefault("show_perf", False)
+        super().__init__(**kwargs)
+        self.result = result
+
+    async def on_message_delta(self, delta: MessageDeltaChunk) -> None:
+        await super().on_message_delta(delta)
+        self.result.first_token()
+        self.result.answer += delta.text
+
+    def write_token(self, text: str) -> None:
+        pass
+
+    async def on_thread_message(self, message: ThreadMessage) -> None:
+        # Generated files are not downloaded in batch runs
+        pass
+
+    async def on_thread_run(self, run: ThreadRun) -> None:
+        # The base handler writes the run's performance record and reports a failed run through on_error
+        await super().on_thread_run(run)
+        if run.usage:
+            self.result.prompt_tokens = run.usage.prompt_tokens
+            self.result.completion_tokens = run.usage.completion_tokens
+
+    async def on_run_step(self, step: RunStep) -> None:
+        await super().on_run_step(step)
+        if step.type == "tool_calls" and step.status == "completed":
+            for tool_call in step.step_details.tool_calls:
+                self.result.tool_calls.append(tool_call.function.name if tool_call.type == "function" else tool_call.type)
+
+    async def on_error(self, data: str) -> None:
+        self.result.error = data
+
+
+@dataclass
+class BatchReport:
+    """Aggregate throughput and latency of a batch run."""
+
+    concurrency: int
+    wall_s: float
+    results: list[PromptResult]
+
+    @property
+    def completed(self) -> list[PromptResult]:
+        return [result for result in self.results if result.error is None]
+
+    def summary(self) -> dict[str, Any]:
+        completed = self.completed
+        latencies = [result.latency_ms for result in completed]
+        ttfts = [result.ttft_ms for result in completed if result.ttft_ms is not None]
+        completion_tokens = sum(result.completion_tokens for result in completed)
+        return {
+            "prompts": len(self.results),
+            "errors": len(self.results) - len(completed),
+            "concurrency": self.concurrency,
+            "wall_s": round(self.wall_s, 3),
+            "prompts_per_min": round(len(completed) / self.wall_s * 60, 1) if self.wall_s else 0.0,
+            "latency_p50_ms": round(percentile(latencies, 50), 1),
+            "latency_p95_ms": round(percentile(latencies, 95), 1),
+            "latency_p99_ms": round(percentile(latencies, 99), 1),
+            "ttft_p50_ms": round(percentile(ttfts, 50), 1),
+            "ttft_p95_ms": round(percentile(ttfts, 95), 1),
+            "prompt_tokens": sum(result.prompt_tokens for result in completed),
+            "completion_tokens": completion_tokens,
+            "completion_tokens_per_s": round(completion_tokens / self.wall_s, 1) if self.wall_s else 0.0,
+            "tool_calls": sum(len(result.tool_calls) for result in completed),
+        }
+
+    def report(self) -> str:
+        s = self.summary()
+        return "\n".join(
+            [
+                f"Batch: {s['prompts']} prompts, concurrency {s['concurrency']}, {s['errors']} errors, "
+                f"{s['wall_s']} s ({s['prompts_per_min']} prompts/min)",
+                f"  latency p50 {s['latency_p50_ms']} ms, p95 {s['latency_p95_ms']} ms, p99 {s['latency_p99_ms']} ms",
+                f"  first token p50 {s['ttft_p50_ms']} ms, p95 {s['ttft_p95_ms']} ms",
+                f"  tokens: {s['prompt_tokens']} prompt, {s['completion_tokens']} completion "
+                f"({s['completion_tokens_per_s']} completion tokens/s), {s['tool_calls']} tool calls",
+            ]
+        )
+
+
+def load_prompts(path: Path) -> list[PromptResult]:
+    """Read a prompt file: JSON lines with a "prompt" field, or plain text with one prompt per line."""
+    prompts = []
+    with path.open("r", encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"prompt": line}
+            prompts.append(PromptResult(id=str(entry.get("id", number)), prompt=entry["prompt"]))
+    return prompts
+
+
+def save_results(results: list[PromptResult], path: Path = DEFAULT_RESULTS_FILE) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as file:
+        for result in results:
+            record = asdict(result)
+            del record["started"]
+            file.write(json.dumps(record) + "\n")
+
+
+async def run_batch(prompts: list[PromptResult], run_prompt: RunPrompt, concurrency: int = 4) -> BatchReport:
+    """Answer all prompts with at most concurrency in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(result: PromptResult) -> None:
+        async with semaphore:
+            result.started = time.perf_counter()
+            try:
+                await run_prompt(result)
+            except Exception as e:
+                logger.error("Prompt %s failed: %s", result.id, e)
+                result.error = str(e)
+            result.latency_ms = (time.perf_counter() - result.started) * 1000
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(result) for result in prompts))
+    return BatchReport(concurrency, time.perf_counter() - started, prompts)
+
+
+class OfflineModel:
+    """
+    Local stand-in for the model, for load tests without the agent service.
+
+    It picks data tools by keyword, calls them through EnzaData (normally against the mock server), and
+    streams a short answer at a fixed token rate after a simulated time to first token.
+    """
+
+    # Keyword -> EnzaData method, checked in order
+    TOOLS = (
+        (r"\bregion", "get_sales_by_region"),
+        (r"\bcategor", "get_sales_by_category"),
+        (r"\bchannel", "get_sales_by_channel"),
+        (r"\bcustomer", "get_top_customers"),
+        (r"\bproduct", "get_product_performance"),
+    )
+
+    def __init__(self, enza_data: "EnzaData", ttft_ms: float = 800, tokens_per_s: float = 60, seed: int = 0) -> None:
+        self.enza_data = enza_data
+        self.ttft_ms = ttft_ms
+        self.tokens_per_s = tokens_per_s
+        self._random = random.Random(seed)
+
+    async def __call__(self, result: PromptResult) -> None:
+        names = [name for pattern, name in self.TOOLS if re.search(pattern, result.prompt, re.IGNORECASE)]
+        outputs = await asyncio.gather(*(getattr(self.enza_data, name)() for name in names))
+        result.tool_calls.extend(names)
+        if any(is_error(output) for output in outputs):
+            result.error = next(output for output in outputs if is_error(output))
+            return
+
+        await asyncio.sleep(self.ttft_ms * self._random.uniform(0.7, 1.3) / 1000)
+        words = self._answer(names, outputs).split(" ")
+        for index, word in enumerate(words):
+            result.first_token()
+            result.answer += f" {word}" if index else word
+            await asyncio.sleep(1 / self.tokens_per_s)
+
+        # Roughly four characters per token
+        result.prompt_tokens = (len(result.prompt) + sum(len(output) for output in outputs)) // 4
+        result.completion_tokens = len(words)
+
+    @staticmethod
+    def _answer(names: list[str], outputs: list[str]) -> str:
+        if not names:
+            return "I can only answer questions about the Enza Zaden sales data."
+        parts = []
+        for name, output in zip(names, outputs, strict=True):
+            rows = json.loads(output)
+            rows = rows if isinstance(rows, list) else rows.get("results", [rows])
+            parts.append(f"{name.removeprefix('get_').replace('_', ' ')} returned {len(rows)} rows.")
+        return " ".join(parts)
+
+
+async def run_offline(args: argparse.Namespace) -> BatchReport:
+    from enza_data import EnzaData
+    from mock_server import PROFILES, MockServer
+    from utilities import Utilities
+
+    async with MockServer(PROFILES[args.profile]) as server:
+        os.environ["APIM_GATEWAY_URL"] = server.url
+        os.environ.setdefault("APIM_SUBSCRIPTION_KEY", "batch")
+        enza_data = EnzaData(Utilities())
+        try:
+            model = OfflineModel(enza_data, ttft_ms=args.ttft_ms, tokens_per_s=args.tokens_per_s)
+            return await run_batch(load_prompts(args.prompts), model, args.concurrency)
+        finally:
+            await enza_data.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a prompt file against a local stand-in for the model.")
+    parser.add_argument("prompts", type=Path)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--profile", default="fast", help="Mock server profile for the data tools.")
+    parser.add_argument("--ttft-ms", type=float, default=800, help="Simulated time to first token.")
+    parser.add_argument("--tokens-per-s", type=float, default=60, help="Simulated completion token rate.")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS_FILE, help="Where to write the results.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_offline(args))
+    print(report.report())
+    save_results(report.results, args.output)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+End-to-end benchmark of the data clients against the local mock server (or a live APIM gateway).
+
+    python benchmark.py --operation get_sales_by_region --requests 500 --concurrency 16 --profile azure
+    python benchmark.py --save-baseline .cache/baseline.json
+    python benchmark.py --baseline .cache/baseline.json   # exits with status 1 on a regression
+    python benchmark.py --check-overlap                   # exits with status 1 if concurrent calls serialize
+
+run_benchmark(), check_regression() and check_overlap() can also be used directly from regression tests.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from collections.abc import Awaitable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Union
+
+from mock_server import PROFILES, MockProfile, MockServer
+
+if TYPE_CHECKING:
+    from _sales_data import SQLData
+    from enza_data import EnzaData
+
+# Arguments used for operations that need them
+OPERATION_ARGS: dict[str, dict[str, Any]] = {
+    "get_weather": {"location": "Amsterdam", "unit": "celsius"},
+    "get_top_customers": {"limit": 10},
+    "execute_sql_query": {"query": "SELECT region, SUM(revenue) FROM sales_data GROUP BY region"},
+    "run_custom_query": {"query": "SELECT region, SUM(revenue) FROM sales_data GROUP BY region"},
+}
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return the pct-th percentile (nearest rank) of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(max(math.ceil(pct / 100 * len(ordered)) - 1, 0), len(ordered) - 1)]
+
+
+@dataclass
+class BenchmarkResult:
+    """Latency and throughput of one benchmark run."""
+
+    name: str
+    concurrency: int
+    requests: int
+    errors: int
+    wall_s: float
+    latencies_ms: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def p50_ms(self) -> float:
+        return percentile(self.latencies_ms, 50)
+
+    @property
+    def p95_ms(self) -> float:
+        return percentile(self.latencies_ms, 95)
+
+    @property
+    def p99_ms(self) -> float:
+        return percentile(self.latencies_ms, 99)
+
+    @property
+    def requests_per_s(self) -> float:
+        return self.requests / self.wall_s if self.wall_s else 0.0
+
+    @property
+    def overlap(self) -> float:
+        """Summed request latency divided by wall time; about 1.0 means the requests ran one after another."""
+        return sum(self.latencies_ms) / 1000 / self.wall_s if self.wall_s else 0.0
+
+    def summary(self) -> dict[str, Any]:
+        """Aggregate numbers, without the raw latencies."""
+        return {
+            "name": self.name,
+            "concurrency": self.concurrency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "wall_s": round(self.wall_s, 3),
+            "p50_ms": round(self.p50_ms, 2),
+            "p95_ms": round(self.p95_ms, 2),
+            "p99_ms": round(self.p99_ms, 2),
+            "requests_per_s": round(self.requests_per_s, 1),
+            "overlap": round(self.overlap, 2),
+        }
+
+    def report(self) -> str:
+        """One line human readable report."""
+        s = self.summary()
+        return (
+            f"{s['name']}: {s['requests']} requests, concurrency {s['concurrency']}, {s['errors']} errors | "
+            f"p50 {s['p50_ms']} ms, p95 {s['p95_ms']} ms, p99 {s['p99_ms']} ms | "
+            f"{s['requests_per_s']} req/s, overlap {s['overlap']}x"
+        )
+
+
+def is_error(result: object) -> bool:
+    """Detect the error results EnzaData (JSON strings) and SQLData (dicts) return instead of raising."""
+    if isinstance(result, dict):
+        return "error" in result
+    return isinstance(result, str) and result.startswith('{"error"')
+
+
+async def run_benchmark(
+    call: Callable[[], Awaitable[Any]], *, requests: int, concurrency: int, name: str = "benchmark"
+) -> BenchmarkResult:
+    """Issue requests calls with at most concurrency in flight and measure each one."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                failed = is_error(await call())
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return BenchmarkResult(name, concurrency, requests, errors, time.perf_counter() - started, latencies)
+
+
+def check_regression(result: BenchmarkResult, baseline: dict[str, Any], tolerance: float = 0.2) -> list[str]:
+    """Compare result to a saved summary; return a description of every metric worse than tolerance allows."""
+    problems = []
+    for metric in ("p50_ms", "p95_ms", "p99_ms"):
+        current, reference = getattr(result, metric), baseline.get(metric, 0)
+        if reference and current > reference * (1 + tolerance):
+            problems.append(f"{metric} {current:.2f} > {reference:.2f} (+{tolerance:.0%})")
+    if baseline.get("requests_per_s") and result.requests_per_s < baseline["requests_per_s"] * (1 - tolerance):
+        problems.append(f"requests_per_s {result.requests_per_s:.1f} < {baseline['requests_per_s']:.1f}")
+    return problems
+
+
+async def check_overlap(target: str, operation: str, *, concurrency: int = 8, latency_ms: float = 100) -> list[str]:
+    """
+    Run concurrency calls at once against a mock server with a fixed latency; return what shows they serialized.
+
+    Calls that overlap finish in about one latency. Calls that block the event loop or share one connection
+    take concurrency latencies, so all calls must finish within half that. The overlap figure alone does not
+    show this: calls started together that block the loop in turn all end late and still seem to overlap.
+    """
+    async with MockServer(MockProfile(latency_ms=latency_ms, jitter_ms=0)) as server:
+        os.environ["APIM_GATEWAY_URL"] = server.url
+        os.environ.setdefault("APIM_SUBSCRIPTION_KEY", "benchmark")
+        client = create_client(target)
+        call = getattr(client, operation)
+        kwargs = OPERATION_ARGS.get(operation, {})
+        try:
+            await call(**kwargs)
+            result = await run_benchmark(
+                lambda: call(**kwargs), requests=concurrency, concurrency=concurrency, name=f"{target}.{operation}"
+            )
+        finally:
+            await client.close()
+
+    problems = []
+    if result.errors:
+        problems.append(f"{result.name}: {result.errors} of {result.requests} calls failed")
+    limit_ms = concurrency * latency_ms / 2
+    if result.wall_s * 1000 > limit_ms:
+        problems.append(
+            f"{result.name}: {concurrency} concurrent calls of {latency_ms:.0f} ms took "
+            f"{result.wall_s * 1000:.0f} ms, more than {limit_ms:.0f} ms"
+        )
+    return problems
+
+
+def create_client(target: str) -> Union["SQLData", "EnzaData"]:
+    """Create the data client to benchmark, configured from APIM_GATEWAY_URL."""
+    if target == "sqldata":
+        from _sales_data import SQLData
+
+        return SQLData()
+
+    from enza_data import EnzaData
+    from utilities import Utilities
+
+    return EnzaData(Utilities())
+
+
+async def benchmark(args: argparse.Namespace) -> BenchmarkResult:
+    profile = MockProfile(**vars(PROFILES[args.profile]))
+    server = None
+    if not args.url:
+        server = MockServer(profile)
+        await server.start()
+        os.environ["APIM_GATEWAY_URL"] = server.url
+        os.environ.setdefault("APIM_SUBSCRIPTION_KEY", "benchmark")
+    else:
+        os.environ["APIM_GATEWAY_URL"] = args.url
+
+    client = create_client(args.target)
+    operation = getattr(client, args.operation)
+    kwargs = OPERATION_ARGS.get(args.operation, {})
+    try:
+        # Warm up connections and lazy initialization before measuring
+        await operation(**kwargs)
+        return await run_benchmark(
+            lambda: operation(**kwargs),
+            requests=args.requests,
+            concurrency=args.concurrency,
+            name=f"{args.target}.{args.operation}",
+        )
+    finally:
+        if hasattr(client, "close"):
+            await client.close()
+        if server:
+            await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the data clients against a mock or live APIM.")
+    parser.add_argument("--target", choices=["enza", "sqldata"], default="enza")
+    parser.add_argument("--operation", default="get_sales_by_region")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="Mock server profile.")
+    parser.add_argument("--url", help="Benchmark this gateway instead of a local mock server.")
+    parser.add_argument("--baseline", type=Path, help="Fail if worse than this saved summary.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline.")
+    parser.add_argument("--save-baseline", type=Path, help="Save the summary of this run.")
+    parser.add_argument(
+        "--check-overlap", action="store_true", help="Check that concurrent calls of both clients overlap."
+    )
+    args = parser.parse_args()
+
+    if args.check_overlap:
+        problems = []
+        for target in ("sqldata", "enza"):
+            problems += asyncio.run(check_overlap(target, "get_sales_by_region"))
+        for problem in problems:
+            print(f"Serialized: {problem}")
+        print(f"Concurrent calls overlap: {'FAILED' if problems else 'OK'}")
+        raise SystemExit(1 if problems else 0)
+
+    result = asyncio.run(benchmark(args))
+    print(result.report())
+
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(result.summary(), indent=2), encoding="utf-8")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        problems = check_regression(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for problem in problems:
+            print(f"Regression: {problem}")
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
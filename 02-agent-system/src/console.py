@@ -0,0 +1,71 @@
+import asyncio
+import signal
+import sys
+import threading
+from collections.abc import Awaitable
+from typing import Any, Optional, TextIO
+
+
+class AsyncConsole:
+    """
+    Console input that does not block the event loop.
+
+    Lines are read on a background thread and handed to the loop, so downloads and other background
+    tasks keep running while the user types.
+    """
+
+    def __init__(self, stream: TextIO = sys.stdin) -> None:
+        self.stream = stream
+        self._lines: Optional[asyncio.Queue[Optional[str]]] = None
+
+    def start(self) -> None:
+        """Start the reader thread. The thread is a daemon, so it never keeps the program alive."""
+        loop = asyncio.get_running_loop()
+        self._lines = asyncio.Queue()
+        threading.Thread(target=self._read, args=(loop, self._lines), name="console reader", daemon=True).start()
+
+    def _read(self, loop: asyncio.AbstractEventLoop, lines: asyncio.Queue) -> None:
+        while True:
+            line = self.stream.readline()
+            # An empty string means end of input
+            loop.call_soon_threadsafe(lines.put_nowait, line or None)
+            if not line:
+                return
+
+    async def input(self, prompt: str = "") -> Optional[str]:
+        """Show prompt and wait for a line. Returns None at end of input."""
+        if self._lines is None:
+            self.start()
+        print(prompt, end="", flush=True)
+        line = await self._lines.get()
+        if line is None:
+            # Leave the marker for later calls
+            self._lines.put_nowait(None)
+            return None
+        return line.rstrip("\r\n")
+
+    @staticmethod
+    async def run_cancellable(coro: Awaitable[Any]) -> bool:
+        """
+        Run coro, cancelling only it when the user presses Ctrl-C.
+
+        Returns:
+            False if the user cancelled it, otherwise True.
+        """
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(coro)
+
+        def cancel(*_args: object) -> None:
+            loop.call_soon_threadsafe(task.cancel)
+
+        previous = signal.signal(signal.SIGINT, cancel)
+        try:
+            await task
+            return True
+        except asyncio.CancelledError:
+            # Re-raise when the caller itself was cancelled rather than the task
+            if not task.cancelled() or asyncio.current_task().cancelling():
+                raise
+            return False
+        finally:
+            signal.signal(signal.SIGINT, previous)
@@ -0,0 +1,348 @@
+"""
+Local BM25 search over the product documents in shared/datasheet, a fast stand-in for the remote vector store.
+
+The documents are split into overlapping chunks of words and indexed in an inverted index that is kept in
+.cache/documents.json together with the content hash of every document, so it is rebuilt only when a
+document is added, removed or changed. PDF text is extracted with pypdf when it is installed, otherwise with
+a minimal extractor for FlateDecode content streams and ToUnicode font maps, which covers the data sheets.
+
+    python document_index.py "how waterproof is the alpine tent"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Optional
+
+from upload_manifest import file_hash
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_DIR = Path(__file__).parent / "shared" / "datasheet"
+DEFAULT_INDEX_FILE = Path(__file__).parent / ".cache" / "documents.json"
+DOCUMENT_SUFFIXES = {".pdf", ".txt", ".md"}
+
+# Words per chunk and words shared by consecutive chunks
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 30
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Bump when the extraction, chunking or index layout changes, so cached indexes are rebuilt
+INDEX_VERSION = 1
+
+_STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of", "on", "or",
+    "the", "this", "to", "what", "which", "with",
+}  # fmt: skip
+
+
+def terms(text: str) -> list[str]:
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in _STOP_WORDS]
+
+
+# Minimal PDF text extraction
+
+
+_OBJECT = re.compile(rb"(\d+)\s+\d+\s+obj\b(.*?)\bendobj", re.DOTALL)
+_CONTENT_TOKEN = re.compile(
+    rb"\((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)"  # literal string, one level of nested parentheses
+    rb"|<[0-9A-Fa-f\s]*>"  # hex string
+    rb"|/[^\s/\[\]()<>{}%]+"  # name
+    rb"|[\[\]]"
+    rb"|[-+]?(?:\d+\.?\d*|\.\d+)"  # number
+    rb"|[A-Za-z'\"*]+",  # operator
+    re.DOTALL,
+)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+
+def _pdf_objects(data: bytes) -> dict[int, tuple[bytes, Optional[bytes]]]:
+    """Object number -> (dictionary, decoded stream or None)."""
+    objects = {}
+    for match in _OBJECT.finditer(data):
+        body = match.group(2)
+        start = re.search(rb"\bstream\r?\n", body)
+        if not start:
+            objects[int(match.group(1))] = (body, None)
+            continue
+        dictionary, raw = body[: start.start()], body[start.end() :]
+        stream: Optional[bytes] = raw
+        if b"/FlateDecode" in dictionary:
+            try:
+                # decompressobj stops at the end of the deflate data and ignores the trailing endstream
+                stream = zlib.decompressobj().decompress(raw)
+            except zlib.error:
+                stream = None
+        objects[int(match.group(1))] = (dictionary, stream)
+    return objects
+
+
+def _references(dictionary: bytes, key: bytes) -> list[int]:
+    if match := re.search(rb"/" + key + rb"\s+(\d+)\s+\d+\s+R", dictionary):
+        return [int(match.group(1))]
+    if match := re.search(rb"/" + key + rb"\s*\[([^\]]*)\]", dictionary):
+        return [int(number) for number in re.findall(rb"(\d+)\s+\d+\s+R", match.group(1))]
+    return []
+
+
+def _parse_cmap(cmap: bytes) -> tuple[int, dict[int, str]]:
+    """Code width in bytes and code -> text of a ToUnicode CMap."""
+    mapping: dict[int, str] = {}
+    width = 1
+
+    def text(hex_string: bytes) -> str:
+        return bytes.fromhex(hex_string.decode("ascii")).decode("utf-16-be", errors="ignore")
+
+    for section in re.findall(rb"beginbfchar(.*?)endbfchar", cmap, re.DOTALL):
+        for source, target in re.findall(rb"<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>", section):
+            width = len(source) // 2
+            mapping[int(source, 16)] = text(target)
+    for section in re.findall(rb"beginbfrange(.*?)endbfrange", cmap, re.DOTALL):
+        for low, high, target in re.findall(rb"<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>", section):
+            width = len(low) // 2
+            first = int(target, 16)
+            for offset, code in enumerate(range(int(low, 16), int(high, 16) + 1)):
+                mapping[code] = chr(first + offset)
+    return width, mapping
+
+
+def _unescape(literal: bytes) -> bytes:
+    out, index = bytearray(), 0
+    while index < len(literal):
+        char = literal[index : index + 1]
+        if char != b"\\":
+            out += char
+            index += 1
+            continue
+        following = literal[index + 1 : index + 2]
+        if octal := re.match(rb"[0-7]{1,3}", literal[index + 1 : index + 4]):
+            out.append(int(octal.group(0), 8) & 0xFF)
+            index += 1 + len(octal.group(0))
+        else:
+            out += _ESCAPES.get(following, following if following != b"\n" else b"")
+            index += 2
+    return bytes(out)
+
+
+def _decode(token: bytes, font: Optional[tuple[int, dict[int, str]]]) -> str:
+    if token.startswith(b"("):
+        raw = _unescape(token[1:-1])
+    else:
+        digits = re.sub(rb"\s", b"", token[1:-1])
+        raw = bytes.fromhex((digits + b"0" * (len(digits) % 2)).decode("ascii"))
+    if not font or not font[1]:
+        return raw.decode("latin-1")
+    width, mapping = font
+    codes = (int.from_bytes(raw[index : index + width], "big") for index in range(0, len(raw), width))
+    return "".join(mapping.get(code, "") for code in codes)
+
+
+def _page_text(content: bytes, fonts: dict[bytes, tuple[int, dict[int, str]]]) -> str:
+    """Text of a content stream, with a line break wherever the text moves to another line."""
+    lines: list[str] = [""]
+    operands: list[bytes] = []
+    font = None
+    last_y: Optional[float] = None
+
+    def new_line() -> None:
+        if lines[-1].strip():
+            lines.append("")
+
+    for token in _CONTENT_TOKEN.findall(content):
+        if not (token[:1].isalpha() or token in (b"'", b'"', b"*")) or token in (b"true", b"false", b"null"):
+            operands.append(token)
+            continue
+        if token == b"Tf" and len(operands) >= 2:
+            font = fonts.get(operands[-2].lstrip(b"/"))
+        elif token in (b"Tj", b"'", b'"', b"TJ"):
+            if token != b"Tj" and token != b"TJ":
+                new_line()
+            for operand in operands:
+                if operand[:1] in (b"(", b"<"):
+                    lines[-1] += _decode(operand, font)
+                elif token == b"TJ" and operand[:1] not in (b"[", b"]", b"/") and float(operand) < -200:
+                    # A large negative adjustment inside a TJ array is a word gap
+                    lines[-1] += " "
+        elif token == b"Tm" and len(operands) >= 6:
+            y = float(operands[-1])
+            if last_y is not None and abs(y - last_y) > 0.01:
+                new_line()
+            last_y = y
+        elif (token in (b"Td", b"TD") and len(operands) >= 2 and float(operands[-1]) != 0) or token == b"T*":
+            new_line()
+        operands = []
+    return "\n".join(line.strip() for line in lines if line.strip())
+
+
+def extract_pdf_pages_fallback(data: bytes) -> list[str]:
+    """Page texts of a PDF with FlateDecode content streams, decoded through the fonts' ToUnicode maps."""
+    objects = _pdf_objects(data)
+
+    # Font resource name -> decoding; names are taken from every font dictionary in the file
+    fonts: dict[bytes, tuple[int, dict[int, str]]] = {}
+    for dictionary, _ in objects.values():
+        for font_dictionary in re.findall(rb"/Font\s*<<(.*?)>>", dictionary, re.DOTALL):
+            for name, number in re.findall(rb"/([^\s/<>\[\]]+)\s+(\d+)\s+\d+\s+R", font_dictionary):
+                font = objects.get(int(number), (b"", None))[0]
+                cmaps = _references(font, b"ToUnicode")
+                stream = objects.get(cmaps[0], (b"", None))[1] if cmaps else None
+                fonts[name] = _parse_cmap(stream) if stream else (1, {})
+
+    pages = []
+    for dictionary, _ in objects.values():
+        if not re.search(rb"/Type\s*/Page\b", dictionary):
+            continue
+        streams = (objects.get(number, (b"", None))[1] for number in _references(dictionary, b"Contents"))
+        content = b"\n".join(stream or b"" for stream in streams)
+        pages.append(_page_text(content, fonts))
+    return pages
+
+
+def extract_pages(path: Path) -> list[str]:
+    """Text of each page of a document; text files are one page."""
+    if path.suffix.lower() != ".pdf":
+        return [path.read_text(encoding="utf-8", errors="ignore")]
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return extract_pdf_pages_fallback(path.read_bytes())
+    return [page.extract_text() or "" for page in PdfReader(path).pages]
+
+
+def chunk_pages(source: str, pages: list[str], size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> list[dict]:
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        words = text.split()
+        for start in range(0, max(len(words) - overlap, 1), size - overlap):
+            chunks.append({"source": source, "page": page_number, "text": " ".join(words[start : start + size])})
+    return [chunk for chunk in chunks if chunk["text"]]
+
+
+class DocumentIndex:
+    """BM25 index over the documents of a directory, persisted on disk and rebuilt when a document changes."""
+
+    def __init__(self, directory: Path = DOCUMENTS_DIR, path: Optional[Path] = DEFAULT_INDEX_FILE) -> None:
+        self.directory = Path(directory)
+        self.path = Path(path) if path else None
+        self.chunks: list[dict[str, Any]] = []
+        self.postings: dict[str, list[list[int]]] = {}
+        self.lengths: list[int] = []
+        self.source: Optional[str] = None
+        self.last_query_ms: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    async def search(self, query: str, top_k: int = 5) -> list[dict[str, Any]]:
+        """Return the top_k chunks for the query, best first, with their BM25 score."""
+        async with self._lock:
+            if not self._loaded:
+                await asyncio.to_thread(self.load)
+        started = time.perf_counter()
+        results = self.query(query, top_k)
+        self.last_query_ms = (time.perf_counter() - started) * 1000
+        logger.info("Document search for %r: %d results in %.2f ms", query, len(results), self.last_query_ms)
+        return results
+
+    def query(self, query: str, top_k: int = 5) -> list[dict[str, Any]]:
+        if not self.chunks:
+            return []
+        average_length = sum(self.lengths) / len(self.lengths)
+        scores: Counter = Counter()
+        for term in set(terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk, frequency in postings:
+                norm = K1 * (1 - B + B * self.lengths[chunk] / average_length)
+                scores[chunk] += idf * frequency * (K1 + 1) / (frequency + norm)
+        return [{**self.chunks[chunk], "score": round(score, 3)} for chunk, score in scores.most_common(top_k)]
+
+    def load(self) -> None:
+        """Load the cached index if the documents are unchanged, otherwise build and cache it."""
+        documents = sorted(
+            path for path in self.directory.glob("*") if path.is_file() and path.suffix.lower() in DOCUMENT_SUFFIXES
+        )
+        hashes = {path.name: file_hash(path) for path in documents}
+        if not self._load_cache(hashes):
+            started = time.perf_counter()
+            self.build(documents)
+            self.source = f"built in {(time.perf_counter() - started) * 1000:.0f} ms"
+            self._save_cache(hashes)
+        self._loaded = True
+        logger.info("Document index %s: %d chunks from %d documents", self.source, len(self.chunks), len(documents))
+
+    def build(self, documents: list[Path]) -> None:
+        self.chunks = [chunk for path in documents for chunk in chunk_pages(path.name, extract_pages(path))]
+        self.postings, self.lengths = {}, []
+        for index, chunk in enumerate(self.chunks):
+            counts = Counter(terms(chunk["text"]))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings.setdefault(term, []).append([index, frequency])
+
+    def _load_cache(self, hashes: dict[str, str]) -> bool:
+        if not self.path:
+            return False
+        try:
+            cached = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return False
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable document index %s: %s", self.path, e)
+            return False
+        if cached.get("version") != INDEX_VERSION or cached.get("documents") != hashes:
+            return False
+        self.chunks, self.postings, self.lengths = cached["chunks"], cached["postings"], cached["lengths"]
+        self.source = "cached"
+        return True
+
+    def _save_cache(self, hashes: dict[str, str]) -> None:
+        if not self.path:
+            return
+        cached = {
+            "version": INDEX_VERSION,
+            "documents": hashes,
+            "chunks": self.chunks,
+            "postings": self.postings,
+            "lengths": self.lengths,
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(cached), encoding="utf-8")
+        except OSError as e:
+            logger.error("Could not write the document index %s: %s", self.path, e)
+
+
+async def _search(query: str, top_k: int) -> None:
+    index = DocumentIndex()
+    started = time.perf_counter()
+    results = await index.search(query, top_k)
+    first_ms = (time.perf_counter() - started) * 1000
+    print(f"Index {index.source}, {len(index.chunks)} chunks, first query including loading {first_ms:.1f} ms")
+    for result in results:
+        print(f"\n{result['score']:6.2f}  {result['source']} page {result['page']}\n{result['text']}")
+    await index.search(query, top_k)
+    print(f"\nQuery latency once loaded: {index.last_query_ms:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search the product documents.")
+    parser.add_argument("query")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(_search(args.query, args.top_k))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 import json
 import logging
 import os
+from pathlib import Path
+
 import aiohttp
-import pandas as pd
-import sys
 
+from _sales_data import SQLData
+from document_index import DocumentIndex
+from schema_prompt import SchemaPrompt
 from terminal_colors import TerminalColors as tc
+from tracing import tracer
 from utilities import Utilities
 
 logging.basicConfig(level=logging.ERROR)
@@ -21,6 +25,9 @@ class EnzaData:
         self.utilities = utilities
         self.apim_gateway_url = os.getenv("APIM_GATEWAY_URL")
         self.apim_subscription_key = os.getenv("APIM_SUBSCRIPTION_KEY")
+        self.sql_data = SQLData(utilities)
+        self.document_index = DocumentIndex()
+        self.schema_prompt = SchemaPrompt(lambda: self._post("sql/schema", {}, "database schema"), self._sqlite_database)
 
         # Validate essential environment variables
         if not self.apim_gateway_url or not self.apim_subscription_key:
@@ -29,82 +36,49 @@ class EnzaData:
             logger.debug("EnzaData initialized with APIM endpoint: %s", self.apim_gateway_url)
 
     async def close(self):
-        """Cleanup resources if needed (placeholder for future resource management)."""
-        pass
+        """Cleanup resources held by the SQL data client."""
+        await self.sql_data.close()
 
     async def get_database_info(self) -> str:
-        """Get the database schema information."""
-        # Provide the actual sales database schema
-        schema = {
-            "Tables": [
-                {
-                    "Name": "SalesRegions",
-                    "Columns": [
-                        "RegionID: INT",
-                        "RegionName: NVARCHAR(50)",
-                        "RegionManager: NVARCHAR(100)",
-                        "HeadquartersLocation: NVARCHAR(100)",
-                    ],
-                },
-                {
-                    "Name": "Products",
-                    "Columns": [
-                        "ProductID: INT",
-                        "ProductName: NVARCHAR(100)",
-                        "ProductCategory: NVARCHAR(50)",
-                        "UnitPrice: DECIMAL(10,2)",
-                        "ProductLine: NVARCHAR(50)",
-                        "LaunchDate: DATE",
-                    ],
-                },
-                {
-                    "Name": "Customers",
-                    "Columns": [
-                        "CustomerID: INT",
-                        "CustomerName: NVARCHAR(100)",
-                        "ContactName: NVARCHAR(100)",
-                        "CustomerType: NVARCHAR(50)",
-                        "RegionID: INT",
-                        "Country: NVARCHAR(50)",
-                        "City: NVARCHAR(50)",
-                    ],
-                },
-                {
-                    "Name": "SalesData",
-                    "Columns": [
-                        "SalesID: INT",
-                        "ProductID: INT",
-                        "CustomerID: INT",
-                        "SalesDate: DATE",
-                        "Quantity: INT",
-                        "UnitsSold: INT",
-                        "TotalAmount: DECIMAL(15,2)",
-                        "DiscountApplied: DECIMAL(5,2)",
-                        "SalesChannel: NVARCHAR(50)",
-                        "PromotionID: INT",
-                    ],
-                },
-            ],
-            "Functions": [
-                {
-                    "Name": "get_sales_by_region",
-                    "Description": "Get sales data grouped by region or for a specific region",
-                    "Parameters": ["region_name (optional)"],
-                },
-                {"Name": "get_sales_by_category", "Description": "Get sales data grouped by product category"},
-                {"Name": "get_sales_by_channel", "Description": "Get sales data grouped by sales channel"},
-                {
-                    "Name": "get_top_customers",
-                    "Description": "Get top customers by total spend",
-                    "Parameters": ["limit (optional, default: 10)"],
-                },
-                {"Name": "get_product_performance", "Description": "Get performance metrics for all products"},
-            ],
-        }
-
-        # Format the schema as a string
-        schema_string = json.dumps(schema, indent=2)
-        return schema_string
+        """Get the database schema information as compact DDL, introspected from the databases."""
+        return await self.schema_prompt.get()
+
+    async def _sqlite_database(self) -> Path:
+        """Build the local SQLite database if needed and return its path."""
+        await self.sql_data.engine.start()
+        return self.sql_data.engine.database_path
+
+    async def _post(self, route: str, data: dict, subject: str) -> str:
+        """
+        Post a request to an APIM route and return the response body.
+
+        The call is traced as an HTTP span whose id travels in the Request-Id header, so the Function App
+        phases reported in the Server-Timing response header line up under it.
+        """
+        url = f"{self.apim_gateway_url}/{route}"
+
+        with tracer.span(f"http POST /{route}") as http_span:
+            headers = {
+                "api-key": self.apim_subscription_key,
+                "Request-Id": tracer.request_id(http_span),
+                "Content-Type": "application/json",
+            }
+
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, headers=headers, json=data) as response:
+                    http_span.attributes["status"] = response.status
+                    with tracer.span("parse"):
+                        result = await response.text()
+                    tracer.record_server_timing(http_span, response.headers.get("Server-Timing"))
+
+            if response.status == 200:
+                logger.debug("Retrieved %s successfully", subject)
+                return result
+
+            http_span.status = "error"
+            error_msg = f"Error retrieving {subject}: {response.status} - {result}"
+            logger.error(error_msg)
+            return json.dumps({"error": error_msg})
 
     async def get_sales_by_region(
         self, region_name: str = None, *, description: str = "Get sales data grouped by region"
@@ -119,29 +93,11 @@ class EnzaData:
             A JSON string containing the sales data.
         """
         try:
-            request_id = self.utilities.generate_uuid()
-            url = f"{self.apim_gateway_url}/sql/sales/regions"
-            headers = {
-                "api-key": self.apim_subscription_key,
-                "Request-Id": request_id,
-                "Content-Type": "application/json",
-            }
-
             data = {}
             if region_name:
                 data["region_name"] = region_name
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.debug("Retrieved sales data by region successfully")
-                        return result
-                    else:
-                        error_msg = f"Error retrieving sales data: {response.status} - {await response.text()}"
-                        logger.error(error_msg)
-                        return json.dumps({"error": error_msg})
-
+            return await self._post("sql/sales/regions", data, "sales data by region")
         except Exception as e:
             logger.exception("Exception retrieving sales data by region", exc_info=e)
             return json.dumps({"error": str(e)})
@@ -154,25 +110,7 @@ class EnzaData:
             A JSON string containing the sales data by category.
         """
         try:
-            request_id = self.utilities.generate_uuid()
-            url = f"{self.apim_gateway_url}/sql/sales/by-category"
-            headers = {
-                "api-key": self.apim_subscription_key,
-                "Request-Id": request_id,
-                "Content-Type": "application/json",
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json={}) as response:
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.debug("Retrieved sales data by category successfully")
-                        return result
-                    else:
-                        error_msg = f"Error retrieving sales data: {response.status} - {await response.text()}"
-                        logger.error(error_msg)
-                        return json.dumps({"error": error_msg})
-
+            return await self._post("sql/sales/by-category", {}, "sales data by category")
         except Exception as e:
             logger.exception("Exception retrieving sales data by category", exc_info=e)
             return json.dumps({"error": str(e)})
@@ -185,24 +123,7 @@ class EnzaData:
             A JSON string containing the sales data by channel.
         """
         try:
-            request_id = self.utilities.generate_uuid()
-            url = f"{self.apim_gateway_url}/sql/sales/by-channel"
-            headers = {
-                "api-key": self.apim_subscription_key,
-                "Request-Id": request_id,
-                "Content-Type": "application/json",
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json={}) as response:
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.debug("Retrieved sales data by channel successfully")
-                        return result
-                    else:
-                        error_msg = f"Error retrieving sales data: {response.status} - {await response.text()}"
-                        logger.error(error_msg)
-                        return json.dumps({"error": error_msg})
+            return await self._post("sql/sales/by-channel", {}, "sales data by channel")
         except Exception as e:
             logger.exception("Exception retrieving sales data by channel", exc_info=e)
             return json.dumps({"error": str(e)})
@@ -218,26 +139,7 @@ class EnzaData:
             A JSON string containing the top customers data.
         """
         try:
-            request_id = self.utilities.generate_uuid()
-            url = f"{self.apim_gateway_url}/sql/customers/top"
-            headers = {
-                "api-key": self.apim_subscription_key,
-                "Request-Id": request_id,
-                "Content-Type": "application/json",
-            }
-
-            data = {"limit": limit}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.debug("Retrieved top customers data successfully")
-                        return result
-                    else:
-                        error_msg = f"Error retrieving customer data: {response.status} - {await response.text()}"
-                        logger.error(error_msg)
-                        return json.dumps({"error": error_msg})
+            return await self._post("sql/customers/top", {"limit": limit}, "top customers data")
         except Exception as e:
             logger.exception("Exception retrieving top customers data", exc_info=e)
             return json.dumps({"error": str(e)})
@@ -250,28 +152,46 @@ class EnzaData:
             A JSON string containing the product performance data.
         """
         try:
-            request_id = self.utilities.generate_uuid()
-            url = f"{self.apim_gateway_url}/sql/products/performance"
-            headers = {
-                "api-key": self.apim_subscription_key,
-                "Request-Id": request_id,
-                "Content-Type": "application/json",
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json={}) as response:
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.debug("Retrieved product performance data successfully")
-                        return result
-                    else:
-                        error_msg = f"Error retrieving product data: {response.status} - {await response.text()}"
-                        logger.error(error_msg)
-                        return json.dumps({"error": error_msg})
+            return await self._post("sql/products/performance", {}, "product performance data")
         except Exception as e:
             logger.exception("Exception retrieving product performance data", exc_info=e)
             return json.dumps({"error": str(e)})
 
+    async def fetch_sales_data_using_sqlite_query(self, sqlite_query: str) -> str:
+        """
+        This function is used to answer user questions about Contoso sales data by executing SQLite queries against the database.
+
+        :param sqlite_query: The input should be a well-formed SQLite query to extract information based on the user's question. The query result will be returned as a JSON object.
+        :return: Return data in JSON serializable format.
+        :rtype: str
+        """
+        try:
+            result = await self.sql_data.execute_sql_query(sqlite_query)
+            return json.dumps(result)
+        except Exception as e:
+            logger.exception("Exception executing SQLite query", exc_info=e)
+            return json.dumps({"error": str(e)})
+
+    async def search_documents(self, query: str, top_k: int = 5) -> str:
+        """
+        Search the product data sheets, such as the Contoso tents data sheet, for passages about the query.
+
+        Args:
+            query: Keywords or a question about the products.
+            top_k: Number of passages to return (default: 5).
+
+        Returns:
+            A JSON string with the best matching passages, best first, with their source document and page.
+        """
+        try:
+            with tracer.span("search documents", query_chars=len(query)) as span:
+                results = await self.document_index.search(query, top_k)
+                span.attributes["latency_ms"] = round(self.document_index.last_query_ms, 2)
+            return json.dumps({"results": results})
+        except Exception as e:
+            logger.exception("Exception searching the documents", exc_info=e)
+            return json.dumps({"error": str(e)})
+
     async def get_weather(
         self,
         location: str,
@@ -291,26 +211,8 @@ class EnzaData:
             A JSON string containing the weather information.
         """
         try:
-            request_id = self.utilities.generate_uuid()
-            url = f"{self.apim_gateway_url}/weather"
-            headers = {
-                "api-key": self.apim_subscription_key,
-                "Request-Id": request_id,
-                "Content-Type": "application/json",
-            }
-
             data = {"location": location, "unit": unit}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.debug("Weather data retrieved successfully for %s", location)
-                        return result
-                    else:
-                        error_msg = f"Error retrieving weather: {response.status} - {await response.text()}"
-                        logger.error(error_msg)
-                        return json.dumps({"error": error_msg})
+            return await self._post("weather", data, f"weather for {location}")
         except Exception as e:
             logger.exception("Exception retrieving weather via APIM", exc_info=e)
             return json.dumps({"error": str(e)})
@@ -0,0 +1,202 @@
+"""
+Deterministic fast path for canonical questions.
+
+Questions such as "sales by region" or "top 10 products" map one-to-one onto a query of the local SQLite
+sales_data table. The fast path recognizes them with anchored patterns over the normalized prompt, runs the
+query through fetch_sales_data_using_sqlite_query, the function the agent answers them with, and renders the
+result as a markdown table, without an agent run. The figures are the ones the agent would report, and the
+query shares its result cache. Anything that does not match a pattern in full falls through to the agent,
+including questions about customers and channels, which only the APIM EnzaData routes (Azure SQL) know about.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
+
+from answer_cache import normalize
+
+if TYPE_CHECKING:
+    from enza_data import EnzaData
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+# Rows rendered before the table is cut off
+MAX_TABLE_ROWS = 50
+
+# Region names of the sales_data table, by their normalized spelling
+REGION_NAMES = {
+    "africa": "AFRICA",
+    "asia pacific": "ASIA-PACIFIC",
+    "apac": "ASIA-PACIFIC",
+    "europe": "EUROPE",
+    "middle east": "MIDDLE EAST",
+    "north america": "NORTH AMERICA",
+    "latin america": "LATIN AMERICA",
+    "latam": "LATIN AMERICA",
+}
+
+
+@dataclass
+class Intent:
+    """
+    A canonical question: a pattern the whole normalized prompt must match and the SQLite query that answers
+    it, with placeholders for the named groups of the pattern.
+    """
+
+    name: str
+    pattern: re.Pattern
+    query: str
+    title: str
+    defaults: dict[str, Any] = field(default_factory=dict)
+
+    def sql(self, match: re.Match) -> str:
+        """The query with the named groups of the match filled in. Only digits and known region names match."""
+        values = dict(self.defaults)
+        for name, value in match.groupdict().items():
+            if value:
+                value = value.strip()
+                values[name] = int(value) if value.isdigit() else REGION_NAMES[value]
+        return self.query.format(**values)
+
+
+INTENTS = [
+    Intent(
+        "sales_by_region",
+        re.compile(r"(total )?(sales|revenue) by regions?( data)?"),
+        "SELECT region, SUM(revenue) AS revenue, SUM(number_of_orders) AS orders FROM sales_data "
+        "GROUP BY region ORDER BY revenue DESC",
+        "Sales by region",
+    ),
+    Intent(
+        "sales_for_region",
+        re.compile(rf"(total )?(sales|revenue) (in|for) (region )?(?P<region>{'|'.join(REGION_NAMES)})( region)?"),
+        "SELECT region, SUM(revenue) AS revenue, SUM(number_of_orders) AS orders FROM sales_data "
+        "WHERE region = '{region}' GROUP BY region",
+        "Sales for the region",
+    ),
+    Intent(
+        "sales_by_category",
+        re.compile(r"(total )?(sales|revenue) by (product )?(category|categories)"),
+        "SELECT main_category, SUM(revenue) AS revenue, SUM(number_of_orders) AS orders FROM sales_data "
+        "GROUP BY main_category ORDER BY revenue DESC",
+        "Sales by product category",
+    ),
+    Intent(
+        "sales_by_year",
+        re.compile(r"(total )?(sales|revenue) by years?"),
+        "SELECT CAST(year AS TEXT) AS year, SUM(revenue) AS revenue, SUM(number_of_orders) AS orders FROM sales_data "
+        "GROUP BY year ORDER BY year",
+        "Sales by year",
+    ),
+    Intent(
+        "top_products",
+        re.compile(
+            r"top (?P<limit>\d{1,3} )?(selling )?products( by (revenue|sales))?|(product|products) performance"
+            r"( metrics)?|best selling products"
+        ),
+        "SELECT main_category, product_type, SUM(revenue) AS revenue, SUM(number_of_orders) AS orders "
+        "FROM sales_data GROUP BY main_category, product_type ORDER BY revenue DESC LIMIT {limit}",
+        "Top products by revenue",
+        {"limit": 10},
+    ),
+]
+
+
+def match_intent(prompt: str, intents: list[Intent] = INTENTS) -> Optional[tuple[Intent, str]]:
+    """Return the intent whose pattern matches the whole prompt, with the query that answers it."""
+    text = normalize(prompt)
+    for intent in intents:
+        if match := intent.pattern.fullmatch(text):
+            return intent, intent.sql(match)
+    return None
+
+
+def format_value(value: object) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    return "" if value is None else str(value).replace("|", "\\|")
+
+
+def render_table(rows: list[dict[str, Any]], max_rows: int = MAX_TABLE_ROWS) -> str:
+    """Render result rows as a markdown table."""
+    if not rows:
+        return "No data found."
+    columns = list(rows[0])
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join("---:" if isinstance(rows[0][column], (int, float)) else "---" for column in columns) + " |",
+    ]
+    for row in rows[:max_rows]:
+        lines.append("| " + " | ".join(format_value(row.get(column)) for column in columns) + " |")
+    if len(rows) > max_rows:
+        lines.append(f"\n{len(rows) - max_rows} more rows not shown.")
+    return "\n".join(lines)
+
+
+class FastPath:
+    """Answer canonical questions by running their query directly, and track what that saves."""
+
+    def __init__(self, data: "EnzaData", *, intents: list[Intent] = INTENTS) -> None:
+        self.data = data
+        self.intents = intents
+        self.hits = self.misses = 0
+        self.saved_ms = 0.0
+        self._agent_turn_ms: Optional[float] = None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def record_agent_turn(self, duration_ms: float) -> None:
+        """Track the duration of agent turns (exponential moving average) to estimate the latency saved."""
+        if self._agent_turn_ms is None:
+            self._agent_turn_ms = duration_ms
+        else:
+            self._agent_turn_ms = 0.8 * self._agent_turn_ms + 0.2 * duration_ms
+
+    async def answer(self, prompt: str) -> Optional[str]:
+        """Return the answer to a canonical question, or None when the agent has to answer it."""
+        matched = match_intent(prompt, self.intents)
+        if matched is None:
+            self.misses += 1
+            return None
+
+        intent, query = matched
+        started = time.perf_counter()
+        try:
+            result = json.loads(await self.data.fetch_sales_data_using_sqlite_query(query))
+            if "error" in result:
+                raise RuntimeError(result["error"])
+        except Exception as e:
+            logger.info("Fast path %s failed, falling back to the agent: %s", intent.name, e)
+            self.misses += 1
+            return None
+
+        answer = f"**{intent.title}**\n\n{render_table(result.get('results', []))}"
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.hits += 1
+        saved_ms = max((self._agent_turn_ms or 0) - duration_ms, 0)
+        self.saved_ms += saved_ms
+        logger.info(
+            "Fast path %s answered in %.0f ms (saved about %.0f ms, hit rate %.1f%%)",
+            intent.name,
+            duration_ms,
+            saved_ms,
+            self.hit_rate * 100,
+        )
+        return answer
+
+    def summary(self) -> str:
+        return (
+            f"Fast path: {self.hits} of {self.hits + self.misses} questions answered without the agent "
+            f"({self.hit_rate:.0%}), about {self.saved_ms / 1000:.1f} s saved"
+        )
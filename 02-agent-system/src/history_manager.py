@@ -0,0 +1,259 @@
+"""
+Keep the prompt of long conversations flat by moving them to a compacted thread.
+
+Every run resends the thread history, so prompt tokens (and latency and cost) grow with each turn. The
+HistoryManager records the prompt of the last model call of every run, which holds the whole thread; the
+run's own usage adds up the prompts of all its model calls, so a run with tool calls would count the history
+several times. Once that prompt passes the threshold, the older turns are replaced by a short local summary
+on a fresh thread and only the last turns are kept verbatim.
+Tool outputs and generated files of earlier runs are not carried over.
+
+Prompt tokens per turn are appended to .cache/history.jsonl; plot them with:
+
+    python history_manager.py report
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import AgentThread, ThreadMessage, ThreadRun
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_LOG = Path(__file__).parent / ".cache" / "history.jsonl"
+
+HISTORY_COMPACT_TOKENS = int(os.getenv("HISTORY_COMPACT_TOKENS", "8000"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+# Characters of each older answer kept in the summary
+HISTORY_SUMMARY_CHARS = int(os.getenv("HISTORY_SUMMARY_CHARS", "300"))
+
+# The service lists at most this many messages per page
+_PAGE_SIZE = 100
+# Latest run steps searched for the usage of the run's last model call
+_LAST_STEPS = 5
+
+
+@dataclass
+class Turn:
+    """A user message and the agent's answer to it."""
+
+    question: str
+    answer: str = ""
+
+
+def message_text(message: ThreadMessage) -> str:
+    return "\n".join(content.text.value for content in message.text_messages)
+
+
+def group_turns(messages: list[ThreadMessage]) -> list[Turn]:
+    """Group thread messages, oldest first, into question and answer turns."""
+    turns: list[Turn] = []
+    for message in messages:
+        text = message_text(message)
+        if message.role == "user" or not turns:
+            turns.append(Turn(question=text if message.role == "user" else ""))
+            if message.role == "user":
+                continue
+        turns[-1].answer = f"{turns[-1].answer}\n{text}".strip()
+    return turns
+
+
+def summarize_turns(turns: list[Turn], max_answer_chars: int = HISTORY_SUMMARY_CHARS) -> str:
+    """
+    Extractive summary of earlier turns: each question in full and the start of its answer.
+
+    Markdown tables and code in the answers are dropped, as they are the bulk of the tokens and can be
+    regenerated by asking again.
+    """
+    lines = ["Summary of the earlier conversation, oldest first:"]
+    for number, turn in enumerate(turns, start=1):
+        kept = []
+        in_code = False
+        for line in turn.answer.splitlines():
+            if line.strip().startswith("```"):
+                in_code = not in_code
+                continue
+            if in_code or line.lstrip().startswith("|") or not line.strip():
+                continue
+            kept.append(line.strip())
+        answer = " ".join(kept) if turn.answer else "(no answer)"
+        if len(answer) > max_answer_chars:
+            answer = answer[:max_answer_chars].rsplit(" ", 1)[0] + " ..."
+        lines.append(f"{number}. User asked: {turn.question}\n   Answer: {answer or '(table or chart)'}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """Track the prompt size of each thread and continue on a compacted thread once it grows too large."""
+
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        *,
+        compact_tokens: int = HISTORY_COMPACT_TOKENS,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        log_path: Optional[Path] = DEFAULT_HISTORY_LOG,
+    ) -> None:
+        self.project_client = project_client
+        self.compact_tokens = compact_tokens
+        self.keep_turns = keep_turns
+        self.log_path = log_path
+        self.session = f"{int(time.time())}"
+        self.turn = 0
+        self.compactions = 0
+        self._cleanup: set[asyncio.Task] = set()
+
+    async def after_turn(self, thread: AgentThread, run: Optional[ThreadRun]) -> AgentThread:
+        """
+        Record the prompt size of a completed run and return the thread to use for the next turn.
+
+        The returned thread is a new, compacted one when the prompt of the run's last model call passed the
+        threshold.
+        """
+        self.turn += 1
+        prompt_tokens = await self.last_prompt_tokens(run) if run else 0
+        self._log(thread.id, prompt_tokens, compacted=False)
+        if prompt_tokens < self.compact_tokens:
+            return thread
+
+        try:
+            compacted = await self.compact(thread)
+        except Exception as e:
+            logger.error("Failed to compact thread %s: %s", thread.id, e)
+            return thread
+        if compacted is thread:
+            return thread
+        self.compactions += 1
+        self._log(compacted.id, 0, compacted=True)
+        return compacted
+
+    async def last_prompt_tokens(self, run: ThreadRun) -> int:
+        """Prompt tokens of the run's last model call, or 0 if its run steps cannot be listed."""
+        try:
+            steps = await self.project_client.agents.list_run_steps(
+                thread_id=run.thread_id, run_id=run.id, order="desc", limit=_LAST_STEPS
+            )
+        except Exception as e:
+            logger.error("Failed to list the steps of run %s: %s", run.id, e)
+            return 0
+        return next((step.usage.prompt_tokens for step in steps.data if step.usage), 0)
+
+    async def compact(self, thread: AgentThread) -> AgentThread:
+        """
+        Create a thread with a summary of the older turns and the last turns verbatim, and delete the old one.
+
+        Returns the thread unchanged when there are no turns older than the ones kept verbatim.
+        """
+        turns = group_turns(await self._list_messages(thread.id))
+        split = max(len(turns) - self.keep_turns, 0)
+        older, recent = turns[:split], turns[split:]
+        if not older:
+            return thread
+
+        compacted = await self.project_client.agents.create_thread()
+        await self.project_client.agents.create_message(
+            thread_id=compacted.id, role="user", content=summarize_turns(older)
+        )
+        for turn in recent:
+            if turn.question:
+                await self.project_client.agents.create_message(
+                    thread_id=compacted.id, role="user", content=turn.question
+                )
+            if turn.answer:
+                await self.project_client.agents.create_message(
+                    thread_id=compacted.id, role="assistant", content=turn.answer
+                )
+        logger.info("Compacted thread %s (%d turns) into %s", thread.id, len(turns), compacted.id)
+
+        # The old thread is not needed anymore; delete it without holding up the next turn
+        task = asyncio.create_task(self.project_client.agents.delete_thread(thread.id))
+        self._cleanup.add(task)
+        task.add_done_callback(self._cleanup.discard)
+        return compacted
+
+    async def close(self) -> None:
+        """Wait for the deletion of replaced threads."""
+        await asyncio.gather(*self._cleanup, return_exceptions=True)
+
+    async def _list_messages(self, thread_id: str) -> list[ThreadMessage]:
+        messages: list[ThreadMessage] = []
+        after = None
+        while True:
+            page = await self.project_client.agents.list_messages(
+                thread_id=thread_id, order="asc", limit=_PAGE_SIZE, after=after
+            )
+            messages.extend(page.data)
+            if not page.has_more:
+                return messages
+            after = page.last_id
+
+    def _log(self, thread_id: str, prompt_tokens: int, *, compacted: bool) -> None:
+        if not self.log_path:
+            return
+        entry = {
+            "session": self.session,
+            "turn": self.turn,
+            "thread_id": thread_id,
+            "prompt_tokens": prompt_tokens,
+            "compacted": compacted,
+            "time": time.time(),
+        }
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.debug("Could not write the history log: %s", e)
+
+
+def load_sessions(path: Path) -> dict[str, list[dict[str, Any]]]:
+    sessions: dict[str, list[dict[str, Any]]] = {}
+    with path.open("r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                sessions.setdefault(entry["session"], []).append(entry)
+    return sessions
+
+
+def print_report(path: Path, width: int = 50) -> None:
+    """Print the prompt tokens of every turn per session, marking where the history was compacted."""
+    sessions = load_sessions(path)
+    if not sessions:
+        print("The history log is empty.")
+        return
+
+    for session, entries in sessions.items():
+        turns = [entry for entry in entries if not entry["compacted"]]
+        compacted_after = {entry["turn"] for entry in entries if entry["compacted"]}
+        peak = max((entry["prompt_tokens"] for entry in turns), default=0) or 1
+        print(f"Session {session}: {len(turns)} turns, {len(compacted_after)} compactions")
+        for entry in turns:
+            bar = "#" * max(int(entry["prompt_tokens"] / peak * width), 1)
+            marker = "  <- compacted" if entry["turn"] in compacted_after else ""
+            print(f"  turn {entry['turn']:>3} {entry['prompt_tokens']:>7} tokens |{bar:<{width}}|{marker}")
+        print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report prompt tokens per turn and the effect of compaction.")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--file", type=Path, default=DEFAULT_HISTORY_LOG)
+    args = parser.parse_args()
+
+    if not args.file.exists():
+        print(f"History log not found: {args.file}")
+    else:
+        print_report(args.file)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,42 @@
+import argparse
 import asyncio
+import contextlib
 import logging
 import os
 import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from azure.ai.projects.aio import AIProjectClient
-from azure.ai.projects.models import (
-    Agent,
-    AgentThread,
-    AsyncFunctionTool,
-    AsyncToolSet,
-    CodeInterpreterTool,
-)
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 
-from enza_data import EnzaData
-from stream_event_handler import StreamEventHandler
-from terminal_colors import TerminalColors as tc
-from utilities import Utilities
+# Time to the first prompt is measured from here
+STARTED = time.perf_counter()
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
-# Look for .env in the same directory as this script file
+# Look for .env in the same directory as this script file. It is loaded before any of the modules below is
+# imported, as they read their settings from the environment.
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(script_dir, ".env")
 found = load_dotenv(env_path)
 
-if not found:
-    logger.error("Failed to load .env file. Please ensure it exists in the same directory as this script.")
-    sys.exit(1)
+from terminal_colors import TerminalColors as tc
+
+# The Azure SDK and the feature modules are imported by setup() and the modes that use them, so --help and
+# --profile-startup do not load them
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.ai.projects.models import Agent, AgentThread, AsyncFunctionTool, OpenAIFile, VectorStore
+
+    from agent_registry import AgentRegistry
+    from agent_toolset import AgentToolSet
+    from enza_data import EnzaData
+    from quota_scheduler import Priority, QuotaScheduler
+    from stream_event_handler import StreamEventHandler
+    from tool_output_store import ToolOutputStore
+    from utilities import Utilities
 
 AGENT_NAME = "Enza Zaden Analysis Agent"
 API_DEPLOYMENT_NAME = os.getenv("MODEL_DEPLOYMENT_NAME")
@@ -43,12 +50,24 @@ MAX_PROMPT_TOKENS = 20480
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.1"))
 TOP_P = float(os.getenv("TOP_P", "0.1"))
 
-# Create utilities and data instances
-toolset = AsyncToolSet()
-utilities = Utilities()
-enza_data = EnzaData(utilities)
-async_enza_functions, sync_enza_functions = utilities.collect_api_functions(enza_data)
-all_functions = {**sync_enza_functions, **{f.__name__: f for f in async_enza_functions}}
+# Reuse the agent across launches while its instructions, model, tools and temperature are unchanged
+REUSE_AGENT = os.getenv("REUSE_AGENT", "true").lower() == "true"
+
+# Milliseconds spent on each startup phase, for the time to the first prompt
+startup_ms = {"imports": (time.perf_counter() - STARTED) * 1000}
+
+# Stands in for PROJECT_CONNECTION_STRING when setup() skips the checks; setup() sends nothing to the service
+PLACEHOLDER_CONNECTION_STRING = "localhost;00000000-0000-0000-0000-000000000000;placeholder;placeholder"
+
+# Created by setup() once the command line has been handled, so --help builds nothing
+utilities: "Utilities"
+quota: "QuotaScheduler"
+tool_outputs: "ToolOutputStore"
+toolset: "AgentToolSet"
+agent_registry: "AgentRegistry"
+enza_data: "EnzaData"
+project_client: "AIProjectClient"
+functions: "AsyncFunctionTool"
 
 # # Add the SQL query tool references
 # ENZA_FUNCTIONS = {
@@ -62,19 +81,64 @@ all_functions = {**sync_enza_functions, **{f.__name__: f for f in async_enza_fun
 #     "get_weather": enza_data.get_weather,
 # }
 
-# Validate required environment variables
-if not PROJECT_CONNECTION_STRING:
-    logger.error("PROJECT_CONNECTION_STRING environment variable not set. Please set this in your .env file.")
-    exit(1)
 
-# Initialize the AI Project Client
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(),
-    conn_str=PROJECT_CONNECTION_STRING,
-)
+def setup(check_env: bool = True) -> None:
+    """
+    Create the utilities, data access, tool set and project client. Nothing is sent to the service yet.
+
+    With check_env=False, as in the startup profile, a missing .env file or connection string is not an error
+    and a placeholder connection string is used.
+    """
+    global utilities, quota, tool_outputs, toolset, agent_registry, enza_data, project_client, functions
+
+    if check_env and not found:
+        logger.error("Failed to load .env file. Please ensure it exists in the same directory as this script.")
+        sys.exit(1)
+
+    # Validate required environment variables
+    if check_env and not PROJECT_CONNECTION_STRING:
+        logger.error("PROJECT_CONNECTION_STRING environment variable not set. Please set this in your .env file.")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.ai.projects.models import AsyncFunctionTool
+    from azure.identity import DefaultAzureCredential
+
+    from agent_registry import AgentRegistry
+    from agent_toolset import AgentToolSet
+    from enza_data import EnzaData
+    from quota_scheduler import QuotaScheduler
+    from tool_output_store import ToolOutputStore
+    from utilities import Utilities
+
+    # Create utilities and data instances
+    utilities = Utilities()
+    quota = QuotaScheduler(max_completion_tokens=MAX_COMPLETION_TOKENS, max_prompt_tokens=MAX_PROMPT_TOKENS)
+    # Large results are spilled to files, and the model pages through them with read_tool_output
+    tool_outputs = ToolOutputStore()
+    toolset = AgentToolSet(utilities=utilities, output_store=tool_outputs)
+    agent_registry = AgentRegistry()
+    enza_data = EnzaData(utilities)
+    async_enza_functions, _ = utilities.collect_api_functions(enza_data)
+
+    # Initialize the AI Project Client
+    project_client = AIProjectClient.from_connection_string(
+        credential=DefaultAzureCredential(),
+        conn_str=PROJECT_CONNECTION_STRING or PLACEHOLDER_CONNECTION_STRING,
+    )
+
+    # Define the functions tool with our API functions
+    functions = AsyncFunctionTool({*async_enza_functions, tool_outputs.read_tool_output})
+    startup_ms["setup"] = (time.perf_counter() - started) * 1000
+
+
+def startup_report() -> str:
+    """Time from the start of the program to the first prompt, by phase."""
+    total_ms = (time.perf_counter() - STARTED) * 1000
+    phases = ", ".join(f"{name} {ms:.0f} ms" for name, ms in startup_ms.items())
+    return f"Ready for the first prompt after {total_ms:.0f} ms ({phases})"
 
-# Define the functions tool with our API functions
-functions = AsyncFunctionTool(async_enza_functions)
 
 instructions_dir = os.path.join(script_dir, "shared", "instructions")
 
@@ -86,117 +150,272 @@ INSTRUCTIONS_FILE = os.path.join(instructions_dir, "function_calling.txt")
 # INSTRUCTIONS_FILE = os.path.join(instructions_dir, "bing_grounding.txt")
 
 
-async def add_agent_tools() -> None:
+async def create_datasheet_vector_store() -> Optional["VectorStore"]:
+    """Add the tents data sheet to a new vector data store (off: the data sheet is searched locally)."""
+    # return await utilities.create_vector_store(
+    #     project_client,
+    #     files=[TENTS_DATA_SHEET_FILE],
+    #     vector_store_name="Contoso Product Information Vector Store",
+    # )
+    return None
+
+
+async def upload_fonts() -> Optional["OpenAIFile"]:
+    """Upload the fonts that add multilingual support to the code interpreter (off by default)."""
+    # return await utilities.upload_file(project_client, utilities.shared_files_path / FONTS_ZIP)
+    return None
+
+
+async def add_agent_tools(
+    vector_store: Optional["VectorStore"], font_file_info: Optional["OpenAIFile"]
+) -> "AgentToolSet":
     """Add tools for the agent."""
-    font_file_info = None
+    from azure.ai.projects.models import CodeInterpreterTool, FileSearchTool
 
     # Add the functions tool
     toolset.add(functions)
 
-    # Add the tents data sheet to a new vector data store
-    # vector_store = await utilities.create_vector_store(
-    #     project_client,
-    #     files=[TENTS_DATA_SHEET_FILE],
-    #     vector_store_name="Contoso Product Information Vector Store",
-    # )
-    # file_search_tool = FileSearchTool(vector_store_ids=[vector_store.id])
-    # toolset.add(file_search_tool)
+    # Add the file search tool over the tents data sheet
+    if vector_store:
+        toolset.add(FileSearchTool(vector_store_ids=[vector_store.id]))
 
     # Add the code interpreter tool
     code_interpreter = CodeInterpreterTool()
     toolset.add(code_interpreter)
 
     # Add multilingual support to the code interpreter
-    # font_file_info = await utilities.upload_file(project_client, utilities.shared_files_path / FONTS_ZIP)
-    # code_interpreter.add_file(file_id=font_file_info.id)
+    if font_file_info:
+        code_interpreter.add_file(file_id=font_file_info.id)
 
     # Add the Bing grounding tool
     # bing_connection = await project_client.connections.get(connection_name=BING_CONNECTION_NAME)
     # bing_grounding = BingGroundingTool(connection_id=bing_connection.id)
     # toolset.add(bing_grounding)
 
-    return font_file_info
+    return toolset
 
 
-async def initialize() -> tuple[Agent, AgentThread]:
-    """Initialize the agent with the sales data schema and instructions."""
+async def get_schema() -> str:
+    """Get the database schema for the instructions."""
+    schema = await enza_data.get_database_info()
+    print(enza_data.schema_prompt.report())
+    return schema
 
-    if not INSTRUCTIONS_FILE:
-        return None, None
 
-    font_file_info = await add_agent_tools()
-    database_schema_string = await enza_data.get_database_info()
+async def build_instructions(schema: str, font_file_info: Optional["OpenAIFile"]) -> str:
+    """Load the instructions and fill in the database schema and font file placeholders."""
+    instructions = utilities.load_instructions(INSTRUCTIONS_FILE)
+    # Replace the placeholder with the database schema string
+    instructions = instructions.replace("{database_schema_string}", schema)
 
-    try:
-        instructions = utilities.load_instructions(INSTRUCTIONS_FILE)
-        # Replace the placeholder with the database schema string
-        instructions = instructions.replace("{database_schema_string}", database_schema_string)
+    if font_file_info:
+        # Replace the placeholder with the font file ID
+        instructions = instructions.replace("{font_file_id}", font_file_info.id)
+    return instructions
 
-        if font_file_info:
-            # Replace the placeholder with the font file ID
-            instructions = instructions.replace("{font_file_id}", font_file_info.id)
 
-        print("Creating agent...")
-        agent = await project_client.agents.create_agent(
-            model=API_DEPLOYMENT_NAME,
+async def get_agent(instructions: str, tools: "AgentToolSet") -> "Agent":
+    """Reuse, update or create the agent."""
+    if REUSE_AGENT:
+        print("Getting agent...")
+        agent, outcome = await agent_registry.get_or_create(
+            project_client,
             name=AGENT_NAME,
+            model=API_DEPLOYMENT_NAME,
             instructions=instructions,
-            toolset=toolset,
+            toolset=tools,
             temperature=TEMPERATURE,
             headers={"x-ms-enable-preview": "true"},
         )
-        print(f"Created agent, ID: {agent.id}")
+        print(f"Agent {outcome}, ID: {agent.id}")
+        return agent
+
+    print("Creating agent...")
+    agent = await project_client.agents.create_agent(
+        model=API_DEPLOYMENT_NAME,
+        name=AGENT_NAME,
+        instructions=instructions,
+        toolset=tools,
+        temperature=TEMPERATURE,
+        headers={"x-ms-enable-preview": "true"},
+    )
+    print(f"Created agent, ID: {agent.id}")
+    return agent
+
+
+async def create_thread() -> "AgentThread":
+    """Create the conversation thread."""
+    print("Creating thread...")
+    thread = await project_client.agents.create_thread()
+    print(f"Created thread, ID: {thread.id}")
+    return thread
+
+
+async def delete_thread(thread: "AgentThread") -> None:
+    """Delete a thread created by a startup that failed later."""
+    await project_client.agents.delete_thread(thread.id)
 
-        print("Creating thread...")
-        thread = await project_client.agents.create_thread()
-        print(f"Created thread, ID: {thread.id}")
 
-        return agent, thread
+async def initialize(
+    show_timings: bool = False, with_thread: bool = True
+) -> tuple["Agent", Optional["AgentThread"]]:
+    """
+    Initialize the agent with the sales data schema and instructions.
+
+    The steps run as a dependency graph, so the thread, the file uploads and the schema are prepared
+    concurrently and the agent is created as soon as its instructions and tools are ready.
+    In server mode each session creates its own thread, so with_thread is False.
+    """
+
+    from startup import StartupGraph
+
+    if not INSTRUCTIONS_FILE:
+        return None, None
+
+    graph = StartupGraph()
+    if with_thread:
+        graph.add("thread", create_thread, cleanup=delete_thread)
+    graph.add("schema", get_schema)
+    graph.add("vector_store", create_datasheet_vector_store)
+    graph.add("font_file_info", upload_fonts)
+    graph.add("tools", add_agent_tools, after=("vector_store", "font_file_info"))
+    graph.add("instructions", build_instructions, after=("schema", "font_file_info"))
+    graph.add("agent", get_agent, after=("instructions", "tools"))
+
+    try:
+        results = await graph.run()
+        return results["agent"], results.get("thread")
 
     except Exception as e:
         logger.error("An error occurred initializing the agent: %s", str(e))
         logger.error("Please ensure you've enabled an instructions file.")
+        return None, None
 
+    finally:
+        if show_timings:
+            print(graph.report())
 
-async def cleanup(agent: Agent, thread: AgentThread) -> None:
-    """Cleanup the resources."""
-    await project_client.agents.delete_thread(thread.id)
-    await project_client.agents.delete_agent(agent.id)
+
+async def cleanup(agent: "Agent", thread: Optional["AgentThread"]) -> None:
+    """Cleanup the resources. A registered agent is kept so the next start can reuse it."""
+    if thread:
+        await project_client.agents.delete_thread(thread.id)
+    if not REUSE_AGENT:
+        await project_client.agents.delete_agent(agent.id)
+    await utilities.wait_for_deletes()
     await enza_data.close()
 
 
-async def post_message(thread_id: str, content: str, agent: Agent, thread: AgentThread) -> None:
-    """Post a message to the Azure AI Agent Service."""
+async def post_message(
+    thread_id: str,
+    content: str,
+    agent: "Agent",
+    thread: "AgentThread",
+    event_handler: Optional["StreamEventHandler"] = None,
+    priority: Optional["Priority"] = None,
+) -> "StreamEventHandler":
+    """
+    Post a message to the Azure AI Agent Service.
+
+    The run streams to the console unless another event handler is given, as in server mode. It starts
+    once the model quota allows it; runs of a higher priority are admitted first (interactive by default).
+
+    Returns:
+        The event handler, holding the streamed answer and the last state of the run (None if it did not start).
+    """
+    from quota_scheduler import Priority
+    from stream_event_handler import StreamEventHandler
+    from stream_recorder import RECORD_STREAMS, StreamRecorder
+    from tracing import tracer
+
+    if priority is None:
+        priority = Priority.INTERACTIVE
+    handler = event_handler or StreamEventHandler(
+        functions=functions, project_client=project_client, utilities=utilities
+    )
+    with tracer.span("agent turn", thread_id=thread_id, prompt_chars=len(content)) as turn:
+        admission = None
+        try:
+            with tracer.span("quota wait", priority=priority.name):
+                admission = await quota.admit(thread_id, content, instructions=agent.instructions, priority=priority)
+            if admission.waited_ms >= 1000 and not event_handler:
+                utilities.log_msg_purple(f"Waited {admission.waited_ms / 1000:.1f} s for model quota")
+
+            with tracer.span("create message"):
+                await project_client.agents.create_message(
+                    thread_id=thread_id,
+                    role="user",
+                    content=content,
+                )
+
+            with tracer.span("llm run", agent_id=agent.id):
+                if RECORD_STREAMS and handler.recorder is None:
+                    handler.recorder = StreamRecorder.for_thread(thread_id)
+                stream = await project_client.agents.create_stream(
+                    thread_id=thread.id,
+                    agent_id=agent.id,
+                    event_handler=handler,
+                    max_completion_tokens=MAX_COMPLETION_TOKENS,
+                    max_prompt_tokens=MAX_PROMPT_TOKENS,
+                    temperature=TEMPERATURE,
+                    top_p=TOP_P,
+                    instructions=agent.instructions,
+                )
+
+                async with stream as s:
+                    await s.until_done()
+            return handler
+        except asyncio.CancelledError:
+            await cancel_run(thread_id, handler)
+            raise
+        except Exception as e:
+            turn.status = "error"
+            if event_handler:
+                await event_handler.on_error(f"An error occurred posting the message: {e!s}")
+            else:
+                utilities.log_msg_purple(f"An error occurred posting the message: {e!s}")
+            return handler
+        finally:
+            if admission:
+                admission.settle(handler.run)
+            if handler.recorder and (recording := await asyncio.to_thread(handler.recorder.save)):
+                logger.info("Stream recorded to %s", recording)
+
+
+async def cancel_run(thread_id: str, event_handler: "StreamEventHandler") -> None:
+    """Cancel the run a cancelled turn left behind, so the thread accepts the next message."""
+    run = event_handler.run
+    if run is None or run.status in {"completed", "failed", "cancelled", "expired"}:
+        return
     try:
-        await project_client.agents.create_message(
-            thread_id=thread_id,
-            role="user",
-            content=content,
-        )
+        await project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+    except Exception as e:
+        logger.error("Failed to cancel run %s: %s", run.id, e)
 
-        stream = await project_client.agents.create_stream(
-            thread_id=thread.id,
-            agent_id=agent.id,
-            event_handler=StreamEventHandler(functions=functions, project_client=project_client, utilities=utilities),
-            max_completion_tokens=MAX_COMPLETION_TOKENS,
-            max_prompt_tokens=MAX_PROMPT_TOKENS,
-            temperature=TEMPERATURE,
-            top_p=TOP_P,
-            instructions=agent.instructions,
-        )
 
-        async with stream as s:
-            await s.until_done()
+async def record_turn(thread_id: str, question: str, answer: str) -> None:
+    """Add a question answered without a run to the thread, so later turns can refer to it."""
+    try:
+        await project_client.agents.create_message(thread_id=thread_id, role="user", content=question)
+        await project_client.agents.create_message(thread_id=thread_id, role="assistant", content=answer)
     except Exception as e:
-        utilities.log_msg_purple(f"An error occurred posting the message: {e!s}")
+        logger.error("Failed to record the cached answer in thread %s: %s", thread_id, e)
 
 
-async def main() -> None:
+async def main(show_timings: bool = False, use_answer_cache: bool = True, use_fast_path: bool = True) -> None:
     """
     Example questions: Sales by region, top-selling products, total shipping costs by region, show as a pie chart.
     """
+    from answer_cache import AnswerCache, data_version
+    from console import AsyncConsole
+    from fast_path import FastPath
+    from history_manager import HistoryManager
+    from sqlite_engine import SQL_SCRIPT
+
     async with project_client:
-        agent, thread = await initialize()
+        started = time.perf_counter()
+        agent, thread = await initialize(show_timings)
+        startup_ms["agent startup"] = (time.perf_counter() - started) * 1000
         if not agent or not thread:
             print(
                 f"{tc.BG_BRIGHT_RED}Initialization failed. Ensure you have uncommented the instructions file for the lab.{tc.RESET}"
@@ -205,9 +424,23 @@ async def main() -> None:
             return
 
         cmd = None
+        console = AsyncConsole()
+        history = HistoryManager(project_client)
+        fast_path = FastPath(enza_data) if use_fast_path else None
+        answers = AnswerCache() if use_answer_cache else None
+        answers_version = data_version(SQL_SCRIPT.read_text(encoding="utf-8"), agent.model, agent.instructions)
+        recording: Optional[asyncio.Task] = None
+        if show_timings:
+            print(startup_report())
 
         while True:
-            prompt = input(f"\n\n{tc.GREEN}Enter your query (type exit or save to finish): {tc.RESET}").strip()
+            prompt = await console.input(f"\n\n{tc.GREEN}Enter your query (type exit or save to finish): {tc.RESET}")
+            if prompt is None:
+                # End of input
+                cmd = "exit"
+                break
+
+            prompt = prompt.strip()
             if not prompt:
                 continue
 
@@ -215,7 +448,59 @@ async def main() -> None:
             if cmd in {"exit", "save"}:
                 break
 
-            await post_message(agent=agent, thread_id=thread.id, content=prompt, thread=thread)
+            # A leading ! asks the agent even for canonical questions and cached answers
+            fresh = prompt.startswith("!")
+            prompt = prompt.lstrip("!").strip()
+
+            # The thread accepts no new messages while an answered turn is being recorded, and recorded
+            # turns have to stay in order. Recording usually finishes while the user types.
+            if recording:
+                await recording
+                recording = None
+
+            # Canonical questions are answered straight from the data, with no run
+            answer = await fast_path.answer(prompt) if fast_path and not fresh else None
+            if answer:
+                utilities.log_token_blue(answer)
+                utilities.log_msg_purple("\n(Answered directly from the data; start with ! to ask the agent)")
+                recording = asyncio.create_task(record_turn(thread.id, prompt, answer))
+                continue
+
+            cached = answers.lookup(prompt, answers_version) if answers and not fresh else None
+            if cached:
+                utilities.log_token_blue(cached.answer)
+                utilities.log_msg_purple(
+                    f"\n(Answered from cache, similarity {cached.similarity:.2f}; start with ! to ask the agent)"
+                )
+                recording = asyncio.create_task(record_turn(thread.id, prompt, cached.answer))
+                continue
+
+            # Ctrl-C cancels the answer in progress and returns to the prompt
+            turn = asyncio.ensure_future(post_message(agent=agent, thread_id=thread.id, content=prompt, thread=thread))
+            if not await console.run_cancellable(turn):
+                utilities.log_msg_purple("\nCancelled.")
+                continue
+
+            handler = turn.result()
+            if fast_path and handler.perf.total_ms:
+                fast_path.record_agent_turn(handler.perf.total_ms)
+            if answers and handler.run and handler.run.status == "completed" and not handler.has_files:
+                answers.store(prompt, handler.answer, answers_version)
+
+            # Continue on a compacted thread once the history makes the prompt too large
+            compacted = await history.after_turn(thread, handler.run)
+            if compacted is not thread:
+                utilities.log_msg_purple(f"\nConversation history compacted into thread {compacted.id}")
+                thread = compacted
+
+        if recording:
+            await recording
+        await history.close()
+        await utilities.wait_for_deletes()
+        if fast_path and fast_path.hits:
+            utilities.log_msg_purple(fast_path.summary())
+        if tool_outputs.spilled:
+            utilities.log_msg_purple(tool_outputs.report())
 
         if cmd == "save":
             print("The agent has not been deleted, so you can continue experimenting with it in the Azure AI Foundry.")
@@ -224,10 +509,106 @@ async def main() -> None:
             )
         else:
             await cleanup(agent, thread)
-            print("The agent resources have been cleaned up.")
+            if REUSE_AGENT:
+                print("The thread has been cleaned up. The agent is kept and will be reused on the next start.")
+            else:
+                print("The agent resources have been cleaned up.")
+
+
+async def batch(prompts_file: Path, concurrency: int, output: Path, show_timings: bool = False) -> None:
+    """Answer a file of prompts concurrently, each in its own thread, and report throughput and latency."""
+    from batch import BatchEventHandler, PromptResult, load_prompts, run_batch, save_results
+    from quota_scheduler import Priority
+
+    async with project_client:
+        agent, _ = await initialize(show_timings, with_thread=False)
+        if not agent:
+            print(
+                f"{tc.BG_BRIGHT_RED}Initialization failed. Ensure you have uncommented the instructions file for the lab.{tc.RESET}"
+            )
+            return
+
+        async def run_prompt(result: PromptResult) -> None:
+            thread = await project_client.agents.create_thread()
+            try:
+                handler = BatchEventHandler(
+                    result, functions=functions, project_client=project_client, utilities=utilities
+                )
+                await post_message(
+                    thread.id, result.prompt, agent, thread, event_handler=handler, priority=Priority.BATCH
+                )
+            finally:
+                await project_client.agents.delete_thread(thread.id)
+
+        try:
+            report = await run_batch(load_prompts(prompts_file), run_prompt, concurrency)
+            print(report.report())
+            if quota.enabled:
+                print(quota.report())
+            if tool_outputs.spilled:
+                print(tool_outputs.report())
+            save_results(report.results, output)
+            print(f"Results saved to {output}")
+        finally:
+            await cleanup(agent, None)
+
+
+async def serve(host: str, port: int, show_timings: bool = False) -> None:
+    """Serve many concurrent chat sessions over HTTP and WebSocket, sharing the client, agent and data access."""
+    from server import AgentServer
+
+    async with project_client:
+        agent, _ = await initialize(show_timings, with_thread=False)
+        if not agent:
+            print(
+                f"{tc.BG_BRIGHT_RED}Initialization failed. Ensure you have uncommented the instructions file for the lab.{tc.RESET}"
+            )
+            return
+
+        server = AgentServer(project_client, agent, functions, utilities, post_message, quota=quota)
+        try:
+            await server.serve(host, port)
+        finally:
+            await cleanup(agent, None)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat with the Enza Zaden analysis agent.")
+    parser.add_argument("--timings", action="store_true", help="Print a breakdown of the startup time.")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Never answer from the answer cache.")
+    parser.add_argument("--no-fast-path", action="store_true", help="Ask the agent even for canonical questions.")
+    parser.add_argument("--serve", action="store_true", help="Serve chat sessions over HTTP and WebSocket.")
+    parser.add_argument("--batch", type=Path, metavar="PROMPTS", help="Answer the prompts in this file and exit.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts answered at once in batch mode.")
+    parser.add_argument("--output", type=Path, default=Path(script_dir) / ".cache" / "batch_results.jsonl")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8080")))
+    parser.add_argument(
+        "--profile-startup", action="store_true", help="Profile the cold start in fresh interpreters and exit."
+    )
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from startup_profile import profile_startup
+
+        sys.exit(profile_startup())
+
+    from answer_cache import ANSWER_CACHE_ENABLED
+    from fast_path import FAST_PATH_ENABLED
+
+    setup()
     print("Starting async program...")
-    asyncio.run(main())
+    if args.batch:
+        asyncio.run(batch(args.batch, args.concurrency, args.output, show_timings=args.timings))
+    elif args.serve:
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(serve(args.host, args.port, show_timings=args.timings))
+    else:
+        asyncio.run(
+            main(
+                show_timings=args.timings,
+                use_answer_cache=ANSWER_CACHE_ENABLED and not args.no_answer_cache,
+                use_fast_path=FAST_PATH_ENABLED and not args.no_fast_path,
+            )
+        )
     print("Program finished.")
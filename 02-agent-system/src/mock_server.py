@@ -0,0 +1,277 @@
+"""
+Local stand-in for APIM and the Function Apps.
+
+Implements every route called by EnzaData and SQLData with synthetic data, so the clients can be run and
+benchmarked without an Azure deployment. Latency, error rate and payload size are set by a MockProfile.
+
+    python mock_server.py --profile azure --port 7071
+
+Then point APIM_GATEWAY_URL at http://localhost:7071 (any APIM_SUBSCRIPTION_KEY is accepted unless --api-key
+is given).
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+from schema_prompt import tables_from_ddl
+
+logger = logging.getLogger(__name__)
+
+REGIONS = ["AFRICA", "ASIA-PACIFIC", "EUROPE", "LATIN AMERICA", "MIDDLE EAST", "NORTH AMERICA"]
+CATEGORIES = ["APPAREL", "CAMPING & HIKING", "CLIMBING", "FOOTWEAR", "TRAVEL", "WATER SPORTS", "WINTER SPORTS"]
+CHANNELS = ["Online", "Retail", "Wholesale", "Distributor"]
+CUSTOMER_TYPES = ["Retail", "Wholesale", "Enterprise"]
+COUNTRIES = ["Netherlands", "Spain", "Brazil", "Kenya", "Japan", "United States", "Australia"]
+
+
+@dataclass
+class MockProfile:
+    """Behaviour of the mock server."""
+
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    error_rate: float = 0.0
+    rows: Optional[int] = None  # Rows per response, None for the natural size of each route
+    seed: Optional[int] = None
+
+
+PROFILES = {
+    "instant": MockProfile(latency_ms=0, jitter_ms=0),
+    "fast": MockProfile(latency_ms=5, jitter_ms=1),
+    "azure": MockProfile(latency_ms=150, jitter_ms=75, error_rate=0.01),
+    "flaky": MockProfile(latency_ms=50, jitter_ms=25, error_rate=0.1),
+    "large": MockProfile(latency_ms=40, jitter_ms=10, rows=2000),
+}
+
+
+class MockDataFactory:
+    """Generate result rows shaped like the Function App responses."""
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+
+    def _amount(self, low: float = 1_000, high: float = 500_000) -> float:
+        return round(self.rng.uniform(low, high), 2)
+
+    def region_sales(self, region: str) -> dict[str, Any]:
+        return {
+            "RegionName": region,
+            "TotalSales": self._amount(),
+            "NumberOfTransactions": self.rng.randint(50, 5_000),
+            "TotalUnitsSold": self.rng.randint(100, 20_000),
+        }
+
+    def grouped_sales(self, key: str, value: str) -> dict[str, Any]:
+        return {
+            key: value,
+            "TotalOrders": self.rng.randint(50, 5_000),
+            "TotalUnitsSold": self.rng.randint(100, 20_000),
+            "TotalRevenue": self._amount(),
+        }
+
+    def customer(self, index: int) -> dict[str, Any]:
+        return {
+            "CustomerName": f"Customer {index + 1:04d}",
+            "CustomerType": self.rng.choice(CUSTOMER_TYPES),
+            "RegionName": self.rng.choice(REGIONS),
+            "Country": self.rng.choice(COUNTRIES),
+            "TotalOrders": self.rng.randint(1, 500),
+            "TotalSpent": self._amount(),
+        }
+
+    def product(self, index: int) -> dict[str, Any]:
+        return {
+            "ProductName": f"Product {index + 1:04d}",
+            "ProductCategory": self.rng.choice(CATEGORIES),
+            "ProductLine": self.rng.choice(["Standard", "Premium", "Pro"]),
+            "TotalOrders": self.rng.randint(1, 2_000),
+            "TotalUnitsSold": self.rng.randint(1, 10_000),
+            "TotalRevenue": self._amount(),
+            "AverageOrderValue": self._amount(20, 2_000),
+        }
+
+    def period(self, index: int, period_type: str) -> dict[str, Any]:
+        year, step = 2021 + index // 12, index % 12
+        period = f"{year}-Q{step // 3 + 1}" if period_type == "quarter" else f"{year}-{step + 1:02d}"
+        return {"Period": period, "TotalRevenue": self._amount(), "TotalOrders": self.rng.randint(10, 3_000)}
+
+    def repeat(self, make: Callable[[int], dict[str, Any]], count: int) -> list[dict[str, Any]]:
+        return [make(index) for index in range(count)]
+
+
+class MockServer:
+    """aiohttp application implementing the APIM routes, usable as an async context manager."""
+
+    def __init__(
+        self, profile: Optional[MockProfile] = None, *, host: str = "127.0.0.1", port: int = 0, api_key: str = ""
+    ) -> None:
+        self.profile = profile or MockProfile()
+        self.host = host
+        self.port = port
+        self.api_key = api_key
+        self.rng = random.Random(self.profile.seed)
+        self.data = MockDataFactory(self.rng)
+        self.requests: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self._runner: Optional[web.AppRunner] = None
+
+        routes = {
+            "sql/sales/regions": self._sales_by_region,
+            "sql/sales/by-category": self._sales_by_category,
+            "sql/sales/by-channel": self._sales_by_channel,
+            "sql/customers/top": self._top_customers,
+            "sql/products/performance": self._product_performance,
+            "sql/sales/products": self._product_sales,
+            "sql/sales/customers": self._customer_sales,
+            "sql/sales/time-series": self._sales_over_time,
+            "sql/schema": self._schema,
+            "weather": self._weather,
+        }
+        self.app = web.Application()
+        for route, handler in routes.items():
+            self.app.router.add_post(f"/{route}", self._wrap(route, handler))
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as APIM_GATEWAY_URL."""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        """Start serving; when port is 0 a free port is picked."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        logger.debug("Mock server listening on %s", self.url)
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    def _rows(self, natural: int) -> int:
+        return natural if self.profile.rows is None else self.profile.rows
+
+    def _wrap(self, route: str, handler: Callable[[dict[str, Any]], Any]) -> Callable:
+        async def handle(request: web.Request) -> web.Response:
+            self.requests[route] += 1
+            if self.api_key and request.headers.get("api-key") != self.api_key:
+                self.errors[route] += 1
+                return web.json_response({"error": "Access denied due to invalid subscription key."}, status=401)
+
+            started = time.perf_counter()
+            delay = max(self.profile.latency_ms + self.rng.uniform(-1, 1) * self.profile.jitter_ms, 0)
+            if delay:
+                await asyncio.sleep(delay / 1000)
+
+            headers = {}
+            if request_id := request.headers.get("Request-Id"):
+                headers["Request-Id"] = request_id
+
+            if self.rng.random() < self.profile.error_rate:
+                self.errors[route] += 1
+                body = {"error": f"Simulated failure of {route}", "details": "mock error"}
+                return web.json_response(body, status=500, headers=headers)
+
+            try:
+                body = await request.json() if request.can_read_body else {}
+            except json.JSONDecodeError:
+                body = {}
+            result = handler(body or {})
+            headers["Server-Timing"] = f"execute;dur={(time.perf_counter() - started) * 1000:.2f}"
+            return web.json_response(result, headers=headers)
+
+        return handle
+
+    def _sales_by_region(self, body: dict[str, Any]) -> dict[str, Any]:
+        regions = [body["region_name"]] if body.get("region_name") else REGIONS
+        count = self._rows(len(regions))
+        return {"results": [self.data.region_sales(regions[index % len(regions)]) for index in range(count)]}
+
+    def _sales_by_category(self, _body: dict[str, Any]) -> dict[str, Any]:
+        count = self._rows(len(CATEGORIES))
+        rows = [self.data.grouped_sales("ProductCategory", CATEGORIES[i % len(CATEGORIES)]) for i in range(count)]
+        return {"results": rows}
+
+    def _sales_by_channel(self, _body: dict[str, Any]) -> dict[str, Any]:
+        count = self._rows(len(CHANNELS))
+        return {"results": [self.data.grouped_sales("SalesChannel", CHANNELS[i % len(CHANNELS)]) for i in range(count)]}
+
+    def _top_customers(self, body: dict[str, Any]) -> dict[str, Any]:
+        return {"results": self.data.repeat(self.data.customer, self._rows(int(body.get("limit", 10))))}
+
+    def _product_performance(self, _body: dict[str, Any]) -> dict[str, Any]:
+        return {"results": self.data.repeat(self.data.product, self._rows(50))}
+
+    def _product_sales(self, body: dict[str, Any]) -> dict[str, Any]:
+        categories = [body["product_category"]] if body.get("product_category") else CATEGORIES
+        count = self._rows(len(categories))
+        rows = [self.data.grouped_sales("ProductCategory", categories[i % len(categories)]) for i in range(count)]
+        return {"results": rows}
+
+    def _customer_sales(self, body: dict[str, Any]) -> dict[str, Any]:
+        types = [body["customer_type"]] if body.get("customer_type") else CUSTOMER_TYPES
+        count = self._rows(len(types))
+        return {"results": [self.data.grouped_sales("CustomerType", types[i % len(types)]) for i in range(count)]}
+
+    def _sales_over_time(self, body: dict[str, Any]) -> dict[str, Any]:
+        period_type = body.get("period_type", "month")
+        count = self._rows(16 if period_type == "quarter" else 48)
+        return {"results": [self.data.period(index, period_type) for index in range(count)]}
+
+    def _schema(self, _body: dict[str, Any]) -> dict[str, Any]:
+        return {"results": [asdict(table) for table in tables_from_ddl()]}
+
+    def _weather(self, body: dict[str, Any]) -> dict[str, Any]:
+        return {"location": body.get("location"), "unit": body.get("unit"), "temperature": self.rng.randint(-5, 35)}
+
+
+async def serve(server: MockServer) -> None:
+    """Run the mock server until cancelled."""
+    async with server:
+        print(f"Mock APIM listening on {server.url} ({server.profile})")
+        await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local mock of APIM and the Function Apps.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7071)
+    parser.add_argument("--api-key", default="", help="Require this APIM subscription key.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("--latency-ms", type=float, help="Override the profile's mean latency.")
+    parser.add_argument("--jitter-ms", type=float, help="Override the profile's latency jitter.")
+    parser.add_argument("--error-rate", type=float, help="Override the profile's error rate (0-1).")
+    parser.add_argument("--rows", type=int, help="Override the number of rows per response.")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    profile = MockProfile(**vars(PROFILES[args.profile]))
+    for name in ("latency_ms", "jitter_ms", "error_rate", "rows", "seed"):
+        if getattr(args, name) is not None:
+            setattr(profile, name, getattr(args, name))
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(MockServer(profile, host=args.host, port=args.port, api_key=args.api_key)))
+
+
+if __name__ == "__main__":
+    main()
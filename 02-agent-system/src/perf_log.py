@@ -0,0 +1,163 @@
+"""
+Per-turn performance records of agent runs, kept in a rolling JSONL log.
+
+StreamEventHandler appends one record per run to .cache/perf.jsonl: time to first token, total time,
+tool steps, token usage, tool output sizes and tokens per second. Compare deployments or spot latency regressions with:
+
+    python perf_log.py            # percentiles per model deployment
+    python perf_log.py --last 20  # only the most recent runs
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERF_LOG = Path(__file__).parent / ".cache" / "perf.jsonl"
+
+# The log is rotated to perf.jsonl.1 once it grows past this size
+PERF_LOG_MAX_BYTES = int(os.getenv("PERF_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+
+
+@dataclass
+class ToolStep:
+    """A run step in which the model called tools."""
+
+    tools: list[str]
+    start_ms: float
+    end_ms: Optional[float] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ms or self.start_ms) - self.start_ms
+
+
+@dataclass
+class RunPerf:
+    """Timings and token usage of one run, relative to when the run was requested."""
+
+    started: float = field(default_factory=time.perf_counter, repr=False)
+    created: float = field(default_factory=time.time)
+    run_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    model: Optional[str] = None
+    status: Optional[str] = None
+    ttft_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    tool_steps: dict[str, ToolStep] = field(default_factory=dict)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Characters of tool output sent to the model, and of large results spilled to files instead
+    tool_output_chars: int = 0
+    spilled_chars: int = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @property
+    def tokens_per_s(self) -> float:
+        """Completion tokens per second of streaming, from the first token to the end of the run."""
+        if self.ttft_ms is None or not self.total_ms or self.total_ms <= self.ttft_ms:
+            return 0.0
+        return self.completion_tokens / ((self.total_ms - self.ttft_ms) / 1000)
+
+    def line(self) -> str:
+        """Compact one line summary."""
+        parts = [f"first token {self.ttft_ms:.0f} ms" if self.ttft_ms is not None else "no tokens"]
+        parts.append(f"total {(self.total_ms or 0) / 1000:.1f} s")
+        if self.tool_steps:
+            tool_ms = sum(step.duration_ms for step in self.tool_steps.values())
+            parts.append(f"{len(self.tool_steps)} tool steps {tool_ms / 1000:.1f} s")
+        parts.append(f"{self.prompt_tokens} prompt + {self.completion_tokens} completion tokens")
+        if self.spilled_chars:
+            parts.append(f"tool outputs {self.tool_output_chars} chars ({self.spilled_chars} spilled)")
+        if self.tokens_per_s:
+            parts.append(f"{self.tokens_per_s:.0f} tokens/s")
+        return " | ".join(parts)
+
+    def record(self) -> dict[str, Any]:
+        record = asdict(self)
+        del record["started"]
+        record["tool_steps"] = [
+            {"tools": step.tools, "start_ms": round(step.start_ms, 1), "duration_ms": round(step.duration_ms, 1)}
+            for step in self.tool_steps.values()
+        ]
+        for key in ("ttft_ms", "total_ms"):
+            if record[key] is not None:
+                record[key] = round(record[key], 1)
+        record["tokens_per_s"] = round(self.tokens_per_s, 1)
+        return record
+
+
+def append_perf_record(
+    record: dict[str, Any], path: Path = DEFAULT_PERF_LOG, max_bytes: int = PERF_LOG_MAX_BYTES
+) -> None:
+    """Append a record to the log, rotating the log once it is larger than max_bytes."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.stat().st_size > max_bytes:
+            path.replace(path.with_name(path.name + ".1"))
+        with path.open("a", encoding="utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logger.debug("Could not write the performance log: %s", e)
+
+
+def load_records(path: Path) -> list[dict[str, Any]]:
+    """Records of the rotated and the current log, oldest first."""
+    records = []
+    for log in (path.with_name(path.name + ".1"), path):
+        if log.exists():
+            with log.open("r", encoding="utf-8") as file:
+                records.extend(json.loads(line) for line in file if line.strip())
+    return records
+
+
+def print_report(records: list[dict[str, Any]]) -> None:
+    """Print latency and throughput percentiles per model deployment."""
+    from benchmark import percentile
+
+    by_model: dict[str, list[dict[str, Any]]] = {}
+    for record in records:
+        by_model.setdefault(record.get("model") or "unknown", []).append(record)
+
+    print(
+        f"{'model':<24} {'runs':>5} {'ttft p50':>9} {'ttft p95':>9} {'total p50':>10} {'total p95':>10} "
+        f"{'tok/s p50':>10} {'prompt p50':>11} {'prompt p95':>11} {'spilled':>8}"
+    )
+    for model, runs in sorted(by_model.items()):
+        ttft = [run["ttft_ms"] for run in runs if run.get("ttft_ms") is not None]
+        total = [run["total_ms"] for run in runs if run.get("total_ms") is not None]
+        rate = [run["tokens_per_s"] for run in runs if run.get("tokens_per_s")]
+        prompt = [run["prompt_tokens"] for run in runs if run.get("prompt_tokens")]
+        spilled = sum(1 for run in runs if run.get("spilled_chars"))
+        print(
+            f"{model:<24} {len(runs):>5} {percentile(ttft, 50):>9.0f} {percentile(ttft, 95):>9.0f} "
+            f"{percentile(total, 50):>10.0f} {percentile(total, 95):>10.0f} {percentile(rate, 50):>10.1f} "
+            f"{percentile(prompt, 50):>11.0f} {percentile(prompt, 95):>11.0f} {spilled:>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report agent run latency per model deployment.")
+    parser.add_argument("--file", type=Path, default=DEFAULT_PERF_LOG)
+    parser.add_argument("--last", type=int, help="Only report the most recent runs.")
+    args = parser.parse_args()
+
+    records = load_records(args.file)
+    if args.last:
+        records = records[-args.last :]
+    if not records:
+        print(f"No runs recorded in {args.file}")
+        return
+    print_report(records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Client-side scheduler for the model deployment's tokens-per-minute quota.
+
+Every run is admitted through a token bucket that holds MODEL_TPM tokens and refills at MODEL_TPM / 60
+tokens per second. A run is charged its estimated cost up front, like the service's own rate limiter does:
+the prompt (the thread's last prompt plus the new message, capped at the maximum prompt tokens) plus the
+maximum completion tokens. Once the run ends the estimate is settled against its actual usage and the
+difference goes back into the bucket. Runs that do not fit wait in a priority queue, so an interactive
+question goes ahead of queued batch prompts. MODEL_TPM=0 turns the scheduler off.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Optional
+
+from schema_prompt import estimate_tokens
+
+if TYPE_CHECKING:
+    from azure.ai.projects.models import ThreadRun
+
+logger = logging.getLogger(__name__)
+
+MODEL_TPM = int(os.getenv("MODEL_TPM", "0"))
+
+# Threads whose last prompt size is remembered for the next estimate
+MAX_TRACKED_THREADS = 1000
+
+
+class Priority(IntEnum):
+    """Lower values are admitted first."""
+
+    INTERACTIVE = 0
+    SESSION = 1
+    BATCH = 2
+
+
+@lru_cache(maxsize=8)
+def _instruction_tokens(instructions: str) -> int:
+    return estimate_tokens(instructions)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    cost: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class Admission:
+    """A run admitted by the scheduler. Settle it with the run once the run has ended."""
+
+    scheduler: "QuotaScheduler"
+    thread_id: str
+    cost: int
+    waited_ms: float
+    settled: bool = False
+
+    def settle(self, run: Optional["ThreadRun"]) -> None:
+        """
+        Correct the charged estimate with the run's token usage.
+
+        Without a run nothing was sent, so the whole estimate is refunded. A run without usage (cancelled
+        or failed mid-way) keeps the estimate, as the tokens it used are unknown.
+        """
+        if self.settled:
+            return
+        self.settled = True
+        if run is None:
+            self.scheduler._settle(self, 0)
+            return
+        usage = run.usage
+        if usage is None:
+            return
+        self.scheduler._remember_prompt(self.thread_id, usage.prompt_tokens)
+        self.scheduler._settle(self, usage.prompt_tokens + usage.completion_tokens)
+
+
+class QuotaScheduler:
+    """Admit runs through a token bucket matched to the deployment quota, queueing the rest by priority."""
+
+    def __init__(
+        self,
+        tokens_per_minute: int = MODEL_TPM,
+        *,
+        max_completion_tokens: int,
+        max_prompt_tokens: int,
+    ) -> None:
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.max_completion_tokens = max_completion_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self.tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._queue: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._thread_prompts: OrderedDict[str, int] = OrderedDict()
+        self.admitted = self.throttled = self.max_depth = 0
+        self.estimated_tokens = self.actual_tokens = 0
+        self.wait_ms: deque[float] = deque(maxlen=1000)
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    @property
+    def depth(self) -> int:
+        """Runs waiting for quota."""
+        return sum(not waiter.future.done() for waiter in self._queue)
+
+    def estimate(self, thread_id: str, content: str, instructions: str = "") -> int:
+        """Tokens a run is charged up front: its estimated prompt plus the maximum completion."""
+        previous = self._thread_prompts.get(thread_id)
+        # The thread's last prompt already holds the instructions
+        prompt = (previous if previous is not None else _instruction_tokens(instructions)) + estimate_tokens(content)
+        return min(prompt, self.max_prompt_tokens) + self.max_completion_tokens
+
+    async def admit(
+        self, thread_id: str, content: str, *, instructions: str = "", priority: Priority = Priority.INTERACTIVE
+    ) -> Admission:
+        """Wait until the quota allows the run. Settle the returned admission once the run has ended."""
+        cost = self.estimate(thread_id, content, instructions)
+        if self.enabled:
+            # A run larger than the whole bucket would never be admitted
+            cost = min(cost, self.capacity)
+        started = time.perf_counter()
+        if self.enabled:
+            await self._acquire(cost, priority)
+        waited_ms = (time.perf_counter() - started) * 1000
+        self.admitted += 1
+        self.estimated_tokens += cost
+        self.wait_ms.append(waited_ms)
+        return Admission(self, thread_id, cost if self.enabled else 0, waited_ms)
+
+    def stats(self) -> dict[str, Any]:
+        """Queue depth, wait times and token accounting."""
+        from benchmark import percentile
+
+        self._refill()
+        waits = list(self.wait_ms)
+        return {
+            "tokens_per_minute": self.capacity,
+            "available_tokens": round(self.tokens),
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "wait_ms_p50": round(percentile(waits, 50), 1),
+            "wait_ms_p95": round(percentile(waits, 95), 1),
+            "wait_ms_max": round(max(waits, default=0.0), 1),
+            "estimated_tokens": self.estimated_tokens,
+            "actual_tokens": self.actual_tokens,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"Model quota ({stats['tokens_per_minute']} tokens/min): {stats['admitted']} runs admitted, "
+            f"{stats['throttled']} waited (p50 {stats['wait_ms_p50']:.0f} ms, p95 {stats['wait_ms_p95']:.0f} ms, "
+            f"max {stats['wait_ms_max']:.0f} ms), max queue depth {stats['max_queue_depth']}, "
+            f"{stats['actual_tokens']} tokens used of {stats['estimated_tokens']} estimated"
+        )
+
+    async def _acquire(self, cost: int, priority: Priority) -> None:
+        self._refill()
+        if not self._queue and self.tokens >= cost:
+            self.tokens -= cost
+            return
+
+        waiter = _Waiter(priority, next(self._sequence), cost, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self.throttled += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self._wake()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted, but the caller went away before it could run
+                self._refund(cost)
+            else:
+                waiter.future.cancel()
+                self._wake()
+            raise
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wake(self) -> None:
+        """Admit the waiters at the head of the queue that fit, and schedule the next check."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._queue:
+            head = self._queue[0]
+            if head.future.done():
+                heapq.heappop(self._queue)
+                continue
+            # Strict priority order: a large run at the head is not overtaken by smaller ones behind it
+            if self.tokens < head.cost:
+                deficit = head.cost - self.tokens
+                self._timer = asyncio.get_running_loop().call_later(deficit / self.rate, self._wake)
+                return
+            heapq.heappop(self._queue)
+            self.tokens -= head.cost
+            head.future.set_result(None)
+
+    def _refund(self, tokens: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + tokens)
+        if self._queue:
+            self._wake()
+
+    def _settle(self, admission: Admission, actual: int) -> None:
+        self.actual_tokens += actual
+        if self.enabled:
+            # A run that used more than its estimate leaves the bucket in debt
+            self._refund(admission.cost - actual)
+
+    def _remember_prompt(self, thread_id: str, prompt_tokens: int) -> None:
+        self._thread_prompts[thread_id] = prompt_tokens
+        self._thread_prompts.move_to_end(thread_id)
+        while len(self._thread_prompts) > MAX_TRACKED_THREADS:
+            self._thread_prompts.popitem(last=False)
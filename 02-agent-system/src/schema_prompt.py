@@ -0,0 +1,247 @@
+"""
+Database schema for the agent instructions, introspected from the databases and rendered as compact DDL.
+
+The Azure SQL schema comes from the sql/schema route of the Function App; when the route is unavailable
+it is read from the CREATE TABLE statements of 00-setup/sales_data.sql. The local SQLite schema comes from
+PRAGMA table_info. Introspected schemas are cached in .cache/schema.json for SCHEMA_CACHE_TTL_S, and the
+rendering is identical for an identical schema, so a cached agent definition stays valid across starts.
+
+    python schema_prompt.py   # print the schema prompt and the tokens it saves per run
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections.abc import Awaitable
+from contextlib import closing
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEMA_CACHE = Path(__file__).parent / ".cache" / "schema.json"
+SALES_DATA_DDL = Path(__file__).parent.parent.parent / "00-setup" / "sales_data.sql"
+
+SCHEMA_CACHE_TTL_S = float(os.getenv("SCHEMA_CACHE_TTL_S", str(24 * 3600)))
+
+
+@dataclass
+class ColumnSchema:
+    name: str
+    type: str
+    nullable: bool = True
+    primary_key: bool = False
+    references: Optional[str] = None
+
+
+@dataclass
+class TableSchema:
+    name: str
+    columns: list[ColumnSchema] = field(default_factory=list)
+    view: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TableSchema":
+        columns = [ColumnSchema(**column) for column in data["columns"]]
+        return cls(data["name"], columns, data.get("view", False))
+
+    def ddl(self) -> str:
+        """One line compact DDL, such as Products(ProductID INT PK, ProductName NVARCHAR(100), ...)."""
+        columns = []
+        for column in self.columns:
+            text = f"{column.name} {column.type}"
+            if column.primary_key:
+                text += " PK"
+            if column.references:
+                text += f" FK>{column.references}"
+            columns.append(text)
+        return f"{self.name}({', '.join(columns)})"
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count of text, exact when tiktoken is installed and about four characters per token otherwise."""
+    try:
+        import tiktoken
+    except ImportError:
+        return (len(text) + 3) // 4
+    return len(tiktoken.get_encoding("o200k_base").encode(text))
+
+
+def schema_hash(sections: dict[str, list[TableSchema]]) -> str:
+    material = json.dumps({name: [asdict(table) for table in tables] for name, tables in sections.items()})
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def render_schema(sections: dict[str, list[TableSchema]]) -> str:
+    """Render schema sections as a heading per section and one line of DDL per table; views are left out."""
+    lines = []
+    for heading, tables in sections.items():
+        lines.append(f"{heading}:")
+        lines.extend(table.ddl() for table in tables if not table.view)
+    return "\n".join(lines)
+
+
+def render_legacy(sections: dict[str, list[TableSchema]]) -> str:
+    """The indented JSON the schema used to be injected as, to measure what the compact rendering saves."""
+    legacy = {
+        heading: [
+            {"Name": table.name, "Columns": [f"{column.name}: {column.type}" for column in table.columns]}
+            for table in tables
+            if not table.view
+        ]
+        for heading, tables in sections.items()
+    }
+    return json.dumps(legacy, indent=2)
+
+
+def tables_from_sqlite(connection: sqlite3.Connection) -> list[TableSchema]:
+    """Introspect the tables of a SQLite connection with PRAGMA table_info and foreign_key_list."""
+    tables = []
+    names = connection.execute(
+        "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') "
+        "AND name NOT LIKE 'sqlite_%' AND name != 'engine_meta' ORDER BY name"
+    ).fetchall()
+    for name, kind in names:
+        references = {row[3]: row[2] for row in connection.execute(f"PRAGMA foreign_key_list('{name}')")}
+        columns = [
+            ColumnSchema(
+                name=column_name,
+                # Declared types keep their spelling, such as NVARCHAR(50); DECIMAL(10, 2) loses the space
+                type=re.sub(r"\s*,\s*", ",", declared_type.upper()),
+                nullable=not not_null,
+                primary_key=bool(primary_key),
+                references=references.get(column_name),
+            )
+            for _, column_name, declared_type, not_null, _, primary_key in connection.execute(
+                f"PRAGMA table_info('{name}')"
+            )
+        ]
+        tables.append(TableSchema(name, columns, view=kind == "view"))
+    return tables
+
+
+def tables_from_ddl(path: Path = SALES_DATA_DDL) -> list[TableSchema]:
+    """Read the tables from the CREATE TABLE statements of a T-SQL script, without running the rest of it."""
+    script = path.read_text(encoding="utf-8")
+    statements = re.findall(r"CREATE\s+TABLE\s.*?\)\s*;", script, re.IGNORECASE | re.DOTALL)
+    with closing(sqlite3.connect(":memory:")) as connection:
+        for statement in statements:
+            connection.execute(statement)
+        return tables_from_sqlite(connection)
+
+
+def tables_from_sqlite_file(path: Path) -> list[TableSchema]:
+    with closing(sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)) as connection:
+        return tables_from_sqlite(connection)
+
+
+class SchemaPrompt:
+    """Introspect the schemas the agent uses, cache them on disk and render them for the instructions."""
+
+    def __init__(
+        self,
+        fetch_sql_server: Callable[[], Awaitable[str]],
+        sqlite_database: Callable[[], Awaitable[Path]],
+        *,
+        cache_path: Optional[Path] = DEFAULT_SCHEMA_CACHE,
+        ttl_s: float = SCHEMA_CACHE_TTL_S,
+    ) -> None:
+        self.fetch_sql_server = fetch_sql_server
+        self.sqlite_database = sqlite_database
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.ttl_s = ttl_s
+        self.sections: dict[str, list[TableSchema]] = {}
+        self.hash: Optional[str] = None
+        self.source: Optional[str] = None
+
+    async def get(self) -> str:
+        """Return the schema prompt, introspecting the databases unless a fresh cached schema exists."""
+        if not self._load_cache():
+            sql_server, sqlite = await asyncio.gather(self._sql_server_tables(), self._sqlite_tables())
+            self.sections = {
+                "Azure SQL tables (via the data functions)": sql_server,
+                "SQLite tables (fetch_sales_data_using_sqlite_query)": sqlite,
+            }
+            self.hash = schema_hash(self.sections)
+            self._save_cache()
+        return render_schema(self.sections)
+
+    def report(self) -> str:
+        """Prompt tokens of the compact schema and how many it saves on every run compared to indented JSON."""
+        compact, legacy = estimate_tokens(render_schema(self.sections)), estimate_tokens(render_legacy(self.sections))
+        return (
+            f"Schema prompt ({self.source}, hash {self.hash}): {compact} tokens, "
+            f"{legacy - compact} fewer per run than indented JSON ({legacy})"
+        )
+
+    async def _sql_server_tables(self) -> list[TableSchema]:
+        try:
+            response = json.loads(await self.fetch_sql_server())
+            if "error" not in response:
+                self.source = "introspected"
+                return [TableSchema.from_dict(table) for table in response["results"]]
+            logger.info("Schema route unavailable: %s", response["error"])
+        except Exception as e:
+            logger.info("Schema route unavailable: %s", e)
+        self.source = f"read from {SALES_DATA_DDL.name}"
+        return await asyncio.to_thread(tables_from_ddl)
+
+    async def _sqlite_tables(self) -> list[TableSchema]:
+        return await asyncio.to_thread(tables_from_sqlite_file, await self.sqlite_database())
+
+    def _load_cache(self) -> bool:
+        if not self.cache_path:
+            return False
+        try:
+            cached = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return False
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable schema cache %s: %s", self.cache_path, e)
+            return False
+        if time.time() - cached["created"] > self.ttl_s:
+            return False
+        self.sections = {
+            heading: [TableSchema.from_dict(table) for table in tables] for heading, tables in cached["sections"].items()
+        }
+        self.hash = cached["hash"]
+        self.source = f"cached, {cached['source']}"
+        return True
+
+    def _save_cache(self) -> None:
+        if not self.cache_path:
+            return
+        cached = {
+            "hash": self.hash,
+            "source": self.source,
+            "created": time.time(),
+            "sections": {heading: [asdict(table) for table in tables] for heading, tables in self.sections.items()},
+        }
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps(cached), encoding="utf-8")
+        except OSError as e:
+            logger.error("Could not write the schema cache %s: %s", self.cache_path, e)
+
+
+async def _print_schema() -> None:
+    from enza_data import EnzaData
+    from utilities import Utilities
+
+    enza_data = EnzaData(Utilities())
+    try:
+        print(await enza_data.get_database_info())
+        print()
+        print(enza_data.schema_prompt.report())
+    finally:
+        await enza_data.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_print_schema())
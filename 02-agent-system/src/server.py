@@ -0,0 +1,290 @@
+"""
+Multi-session HTTP and WebSocket front end for the agent.
+
+All sessions share one AIProjectClient, agent and EnzaData instance; each session has its own thread.
+
+    POST   /sessions                   create a session, returns {"session_id": ...}
+    POST   /sessions/{id}/messages     {"content": "..."}; the answer is streamed back as plain text
+    GET    /sessions/{id}/ws           WebSocket; send prompts as text, receive {"type": "token"|"error"|"done"}
+    DELETE /sessions/{id}              delete the session and its thread
+    GET    /health                     session, queue and model quota statistics
+
+Sessions that are idle for SERVER_SESSION_IDLE_S are deleted together with their threads.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections.abc import AsyncIterator, Awaitable
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from aiohttp import WSMsgType, web
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import Agent, AgentThread, AsyncFunctionTool
+
+from quota_scheduler import Priority, QuotaScheduler
+from stream_event_handler import StreamEventHandler
+from utilities import Utilities
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = int(os.getenv("SERVER_MAX_SESSIONS", "100"))
+MAX_QUEUED_PER_SESSION = int(os.getenv("SERVER_MAX_QUEUED_PER_SESSION", "2"))
+MAX_CONCURRENT_RUNS = int(os.getenv("SERVER_MAX_CONCURRENT_RUNS", "8"))
+SESSION_IDLE_S = float(os.getenv("SERVER_SESSION_IDLE_S", "1800"))
+
+# Post a message to a thread and stream the run through an event handler, like main.post_message
+PostMessage = Callable[..., Awaitable[None]]
+
+_DONE = object()
+
+
+class SessionStreamEventHandler(StreamEventHandler):
+    """Stream handler that forwards tokens and errors to a session's output queue instead of the console."""
+
+    # kwargs are passed on to StreamEventHandler as they are
+    def __init__(self, output: asyncio.Queue, **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(**kwargs)
+        self.output = output
+
+    def write_token(self, text: str) -> None:
+        self.output.put_nowait(("token", text))
+
+    async def on_error(self, data: str) -> None:
+        self.output.put_nowait(("error", data))
+
+
+@dataclass
+class AgentSession:
+    """A conversation thread; runs on a thread are serialized because a thread allows one active run."""
+
+    id: str
+    thread: AgentThread
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    queued: int = 0
+    turns: int = 0
+    last_used: float = field(default_factory=time.time)
+
+
+class AgentServer:
+    """Serve many concurrent sessions against one agent."""
+
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        agent: Agent,
+        functions: AsyncFunctionTool,
+        utilities: Utilities,
+        post_message: PostMessage,
+        *,
+        max_sessions: int = MAX_SESSIONS,
+        max_queued_per_session: int = MAX_QUEUED_PER_SESSION,
+        max_concurrent_runs: int = MAX_CONCURRENT_RUNS,
+        session_idle_s: float = SESSION_IDLE_S,
+        quota: Optional[QuotaScheduler] = None,
+    ) -> None:
+        self.project_client = project_client
+        self.agent = agent
+        self.functions = functions
+        self.util = utilities
+        self.post_message = post_message
+        self.max_sessions = max_sessions
+        self.max_queued_per_session = max_queued_per_session
+        self.session_idle_s = session_idle_s
+        self.quota = quota
+        self.sessions: dict[str, AgentSession] = {}
+        self._runs = asyncio.Semaphore(max_concurrent_runs)
+        self._active_runs = 0
+
+        self.app = web.Application()
+        self.app.router.add_post("/sessions", self.create_session)
+        self.app.router.add_delete("/sessions/{session_id}", self.delete_session)
+        self.app.router.add_post("/sessions/{session_id}/messages", self.post_session_message)
+        self.app.router.add_get("/sessions/{session_id}/ws", self.session_websocket)
+        self.app.router.add_get("/health", self.health)
+        self.app.on_shutdown.append(self._close_sessions)
+        self.app.cleanup_ctx.append(self._expire_periodically)
+
+    async def create_session(self, _request: web.Request) -> web.Response:
+        if len(self.sessions) >= self.max_sessions:
+            await self.expire_idle_sessions()
+        if len(self.sessions) >= self.max_sessions:
+            return web.json_response({"error": "Too many sessions"}, status=503)
+        thread = await self.project_client.agents.create_thread()
+        session = AgentSession(id=self.util.generate_uuid(), thread=thread)
+        self.sessions[session.id] = session
+        return web.json_response({"session_id": session.id}, status=201)
+
+    async def delete_session(self, request: web.Request) -> web.Response:
+        session = self.sessions.pop(request.match_info["session_id"], None)
+        if session is None:
+            raise web.HTTPNotFound()
+        async with session.lock:
+            await self.project_client.agents.delete_thread(session.thread.id)
+        return web.Response(status=204)
+
+    async def post_session_message(self, request: web.Request) -> web.StreamResponse:
+        session = self._get_session(request)
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            body = None
+        if not isinstance(body, dict):
+            return web.json_response({"error": "The body must be a JSON object"}, status=400)
+        content = body.get("content")
+        if not isinstance(content, str) or not content.strip():
+            return web.json_response({"error": "content is required"}, status=400)
+        content = content.strip()
+        if session.queued >= self.max_queued_per_session:
+            return web.json_response({"error": "Too many queued messages for this session"}, status=429)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+        await response.prepare(request)
+        async for kind, text in self._run(session, content):
+            if kind == "token":
+                await response.write(text.encode("utf-8"))
+            elif kind == "error":
+                await response.write(f"\n[error] {text}\n".encode())
+        await response.write_eof()
+        return response
+
+    async def session_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        session = self._get_session(request)
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+
+        async for message in websocket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            session.last_used = time.time()
+            if session.queued >= self.max_queued_per_session:
+                await websocket.send_json({"type": "error", "text": "Too many queued messages for this session"})
+                continue
+            async for kind, text in self._run(session, message.data):
+                await websocket.send_json({"type": kind, "text": text})
+            await websocket.send_json({"type": "done"})
+        return websocket
+
+    async def health(self, _request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "sessions": len(self.sessions),
+                "active_runs": self._active_runs,
+                "queued_messages": sum(session.queued for session in self.sessions.values()),
+                "quota": self.quota.stats() if self.quota and self.quota.enabled else None,
+            }
+        )
+
+    def _get_session(self, request: web.Request) -> AgentSession:
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "Unknown session"}), content_type="application/json")
+        session.last_used = time.time()
+        return session
+
+    async def _run(self, session: AgentSession, content: str) -> AsyncIterator[tuple[str, str]]:
+        """Queue a turn on the session and yield its (kind, text) output as the run streams."""
+        output: asyncio.Queue = asyncio.Queue()
+        session.queued += 1
+        try:
+            await session.lock.acquire()
+        finally:
+            session.queued -= 1
+
+        try:
+            async with self._runs:
+                self._active_runs += 1
+                handler = SessionStreamEventHandler(
+                    output,
+                    functions=self.functions,
+                    project_client=self.project_client,
+                    utilities=self.util,
+                    show_perf=False,
+                )
+                run = asyncio.create_task(self._post(session, content, handler, output))
+                try:
+                    while (item := await output.get()) is not _DONE:
+                        yield item
+                    session.turns += 1
+                finally:
+                    # The client went away: stop the run rather than streaming into the void
+                    if not run.done():
+                        run.cancel()
+                        await asyncio.gather(run, return_exceptions=True)
+                    self._active_runs -= 1
+        finally:
+            session.lock.release()
+
+    async def _post(
+        self, session: AgentSession, content: str, handler: SessionStreamEventHandler, output: asyncio.Queue
+    ) -> None:
+        try:
+            await self.post_message(
+                thread_id=session.thread.id,
+                content=content,
+                agent=self.agent,
+                thread=session.thread,
+                event_handler=handler,
+                priority=Priority.SESSION,
+            )
+        finally:
+            output.put_nowait(_DONE)
+
+    async def expire_idle_sessions(self) -> int:
+        """Delete the sessions, and their threads, that have been idle for session_idle_s. Returns their number."""
+        now = time.time()
+        idle = [
+            session
+            for session in self.sessions.values()
+            if now - session.last_used > self.session_idle_s and not session.lock.locked() and not session.queued
+        ]
+        for session in idle:
+            del self.sessions[session.id]
+        results = await asyncio.gather(
+            *(self.project_client.agents.delete_thread(session.thread.id) for session in idle),
+            return_exceptions=True,
+        )
+        for session, result in zip(idle, results, strict=True):
+            if isinstance(result, Exception):
+                logger.error("Failed to delete the thread of idle session %s: %s", session.id, result)
+        if idle:
+            logger.info("Expired %d idle sessions", len(idle))
+        return len(idle)
+
+    async def _expire_periodically(self, _app: web.Application) -> AsyncIterator[None]:
+        """Expire idle sessions in the background while the app runs."""
+
+        async def sweep() -> None:
+            while True:
+                await asyncio.sleep(min(self.session_idle_s, 60))
+                try:
+                    await self.expire_idle_sessions()
+                except Exception as e:
+                    logger.error("Failed to expire idle sessions: %s", e)
+
+        task = asyncio.create_task(sweep())
+        yield
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def _close_sessions(self, _app: web.Application) -> None:
+        """Delete the threads of all open sessions."""
+        sessions, self.sessions = list(self.sessions.values()), {}
+        await asyncio.gather(
+            *(self.project_client.agents.delete_thread(session.thread.id) for session in sessions),
+            return_exceptions=True,
+        )
+
+    async def serve(self, host: str, port: int) -> None:
+        """Serve until cancelled."""
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self.util.log_msg_green(f"Agent server listening on http://{host}:{port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
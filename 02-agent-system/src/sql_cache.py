@@ -0,0 +1,334 @@
+"""
+Result cache for ad-hoc SQL keyed on a canonical form of the query.
+
+LLM generated SQL for the same question varies in whitespace, keyword and identifier casing, alias names,
+comments and the order of IN (...) literals. canonicalize_sql() removes those differences, so equivalent
+queries share one cache entry. Entries expire after a TTL and the least recently used ones are evicted
+once the cache exceeds its byte budget.
+
+Ad-hoc queries are appended to .cache/sql_queries.jsonl; replay that log to compare hit rates:
+
+    python sql_cache.py replay .cache/sql_queries.jsonl
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_LOG = Path(__file__).parent / ".cache" / "sql_queries.jsonl"
+
+CACHE_TTL_S = float(os.getenv("SQL_CACHE_TTL_S", "600"))
+CACHE_MAX_BYTES = int(os.getenv("SQL_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+_TOKEN = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<param>[:@$][A-Za-z_][A-Za-z0-9_]*|\?\d*)
+    |(?P<operator><>|!=|<=|>=|==|\|\||[-+*/%=<>(),.;])
+    |(?P<space>\s+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Words after which an identifier is a table reference that may be followed by an alias
+_TABLE_INTRODUCERS = {"from", "join"}
+# Words that can follow a table reference or expression and are therefore never an alias
+_CLAUSE_WORDS = {
+    "where", "group", "order", "having", "limit", "offset", "join", "inner", "left", "right", "full", "cross",
+    "outer", "natural", "on", "using", "union", "intersect", "except", "window", "as",
+}  # fmt: skip
+# Words that start a clause. SQLite resolves a column alias only in ORDER BY; anywhere else the name may stand
+# for a real column (WHERE month = 3, or SELECT a AS x, x + 1), so an alias used there keeps its name.
+_CLAUSE_STARTS = {"select", "from", "join", "on", "where", "group", "having", "order", "limit", "window"}
+
+
+@dataclass
+class CanonicalQuery:
+    """A query in canonical form, with the alias renames applied to produce it."""
+
+    text: str
+    aliases: dict[str, str]  # Alias as spelled in the query -> canonical alias
+
+
+def _tokenize(query: str) -> list[tuple[str, str, str]]:
+    """Split query into (kind, normalized value, spelling) tokens, dropping comments and whitespace."""
+    tokens = []
+    for match in _TOKEN.finditer(query):
+        kind = match.lastgroup
+        if kind in {"comment", "space"}:
+            continue
+        value = spelling = match.group()
+        if kind == "quoted":
+            inner = value[1:-1]
+            # "Region" and region name the same column when the quotes are not needed
+            if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", inner):
+                kind, value, spelling = "word", inner, inner
+        if kind == "word":
+            value = value.lower()
+        tokens.append((kind, value, spelling))
+    return tokens
+
+
+def _find_aliases(tokens: list[tuple[str, str, str]]) -> dict[str, str]:
+    """
+    Map column aliases (``expr AS x``) and table aliases (``FROM t x``, ``JOIN t AS x``) to positional names.
+
+    Only names that are unambiguously aliases are renamed: a column alias must not be used before it is
+    defined (as in ``SUM(revenue) AS revenue``) or anywhere but ORDER BY after it, and every other use of a
+    table alias must qualify a column.
+    """
+    words = [value if kind == "word" else None for kind, value, _ in tokens]
+    aliases: dict[str, str] = {}
+    columns = tables = 0
+
+    clauses = []
+    clause = ""
+    for word in words:
+        clause = word if word in _CLAUSE_STARTS else clause
+        clauses.append(clause)
+
+    for index, value in enumerate(words):
+        if value is None or value in aliases or value in _CLAUSE_WORDS or index < 2:
+            continue
+        previous, next_value = tokens[index - 1][1], tokens[index + 1][1] if index + 1 < len(tokens) else ""
+        table_start = index - 2 if previous == "as" else index - 1
+
+        if words[table_start] is not None and table_start > 0 and words[table_start - 1] in _TABLE_INTRODUCERS:
+            uses = [i for i, word in enumerate(words) if word == value and i != index]
+            if all(i + 1 < len(tokens) and tokens[i + 1][1] == "." for i in uses):
+                tables += 1
+                aliases[value] = f"_t{tables}"
+        elif (
+            previous == "as"
+            and next_value != ")"
+            and value not in words[:index]
+            and all(clauses[i] == "order" for i, word in enumerate(words) if word == value and i != index)
+        ):
+            # A closing parenthesis means a type name, as in CAST(x AS REAL)
+            columns += 1
+            aliases[value] = f"_c{columns}"
+    return aliases
+
+
+def _sort_in_lists(tokens: list[str]) -> list[str]:
+    """Sort the literals of IN (...) lists that contain nothing but literals."""
+    result: list[str] = []
+    index = 0
+    while index < len(tokens):
+        result.append(tokens[index])
+        if tokens[index] == "in" and tokens[index + 1 : index + 2] == ["("] and ")" in tokens[index + 2 :]:
+            end = tokens.index(")", index + 2)
+            items = tokens[index + 2 : end]
+            literals = items[::2]
+            if (
+                items
+                and all(separator == "," for separator in items[1::2])
+                and all(re.fullmatch(r"'.*'|[\d.eE+-]+", literal, re.DOTALL) for literal in literals)
+            ):
+                result.append("(")
+                for position, literal in enumerate(sorted(set(literals))):
+                    result.extend([",", literal] if position else [literal])
+                result.append(")")
+                index = end + 1
+                continue
+        index += 1
+    return result
+
+
+def canonicalize_sql(query: str) -> CanonicalQuery:
+    """Return the canonical form of query; equivalent spellings of a query map to the same text."""
+    tokens = _tokenize(query)
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+
+    aliases = _find_aliases(tokens)
+    values = [aliases.get(value, value) if kind == "word" else value for kind, value, _ in tokens]
+    spellings = {spelling: aliases[value] for kind, value, spelling in tokens if kind == "word" and value in aliases}
+    return CanonicalQuery(" ".join(_sort_in_lists(values)), spellings)
+
+
+def cache_key(canonical: CanonicalQuery, parameters: Optional[dict[str, Any]], data_version: str = "") -> str:
+    """Hash of the canonical query, its parameters and the version of the data it runs against."""
+    material = json.dumps([canonical.text, parameters or {}, data_version], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def rename_columns(result: dict[str, Any], renames: dict[str, str]) -> dict[str, Any]:
+    """Return a copy of a query result with its columns renamed."""
+    if not renames or "results" not in result:
+        return result
+    renamed = dict(result)
+    if "columns" in result:
+        renamed["columns"] = [renames.get(column, column) for column in result["columns"]]
+    renamed["results"] = [{renames.get(key, key): value for key, value in row.items()} for row in result["results"]]
+    return renamed
+
+
+class QueryResultCache:
+    """TTL cache of query results with least recently used eviction under a byte budget."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, ttl_s: float = CACHE_TTL_S) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.size_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, int, dict[str, Any]]] = OrderedDict()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        """Return the cached result for key, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        """Store a result under key, evicting the least recently used entries to stay within the byte budget."""
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_s, size, value)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 3),
+        }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+
+
+def append_query_log(query: str, parameters: Optional[dict[str, Any]], path: Path = DEFAULT_QUERY_LOG) -> None:
+    """Append an executed query to the replayable query log."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as file:
+            file.write(json.dumps({"query": query, "parameters": parameters}) + "\n")
+    except OSError as e:
+        logger.debug("Could not write the query log: %s", e)
+
+
+# (query, query, whether they must share a cache entry), checked by python sql_cache.py check
+CANONICAL_CASES = [
+    (
+        "SELECT region, SUM(revenue) AS total FROM sales_data GROUP BY region ORDER BY total DESC",
+        "select Region, sum(Revenue) as revenue_total from SALES_DATA group by region order by revenue_total desc;",
+        True,
+    ),
+    (
+        "SELECT s.region FROM sales_data s WHERE s.month IN (3, 1, 2)",
+        "SELECT x.region FROM sales_data x WHERE x.month IN (1, 2, 3)",
+        True,
+    ),
+    # An alias named like a real column used in WHERE reads that column, not the alias
+    (
+        "SELECT region AS month, COUNT(*) AS n FROM sales_data WHERE month = 3 GROUP BY region",
+        "SELECT region AS year, COUNT(*) AS n FROM sales_data WHERE year = 3 GROUP BY region",
+        False,
+    ),
+    # A later select item reads the real column x or y, not the alias
+    ("SELECT a AS x, x + 1 FROM t", "SELECT a AS y, y + 1 FROM t", False),
+]
+
+
+def check() -> bool:
+    """Check the canonical forms of CANONICAL_CASES, printing the cases that fail."""
+    ok = True
+    for first, second, same in CANONICAL_CASES:
+        first_text, second_text = canonicalize_sql(first).text, canonicalize_sql(second).text
+        if (first_text == second_text) != same:
+            ok = False
+            print(f"{'Expected' if same else 'Did not expect'} the same cache entry for:")
+            print(f"  {first}\n    -> {first_text}\n  {second}\n    -> {second_text}")
+    print(f"{len(CANONICAL_CASES)} canonicalization cases checked: {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def replay(path: Path) -> None:
+    """Report exact-text and canonical hit rates for a logged sequence of queries."""
+    exact, canonical = set(), set()
+    exact_hits = canonical_hits = total = 0
+    with path.open("r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line) if line.lstrip().startswith("{") else {"query": line.strip()}
+            parameters = entry.get("parameters")
+            exact_key = json.dumps([entry["query"], parameters], sort_keys=True)
+            canonical_key = cache_key(canonicalize_sql(entry["query"]), parameters)
+            exact_hits += exact_key in exact
+            canonical_hits += canonical_key in canonical
+            exact.add(exact_key)
+            canonical.add(canonical_key)
+            total += 1
+
+    if not total:
+        print("The query log is empty.")
+        return
+    print(f"Replayed {total} queries, {len(canonical)} distinct after canonicalization")
+    print(f"  exact text hit rate: {exact_hits / total:6.1%}")
+    print(f"  canonical hit rate:  {canonical_hits / total:6.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the normalized SQL result cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="Replay a query log and report cache hit rates.")
+    replay_parser.add_argument("log", type=Path, nargs="?", default=DEFAULT_QUERY_LOG)
+    canonical_parser = commands.add_parser("canonical", help="Print the canonical form of a query.")
+    canonical_parser.add_argument("query")
+    commands.add_parser("check", help="Check the canonicalization cases; exits with status 1 on a failure.")
+    args = parser.parse_args()
+
+    if args.command == "canonical":
+        print(canonicalize_sql(args.query).text)
+    elif args.command == "check":
+        sys.exit(0 if check() else 1)
+    elif not args.log.exists():
+        print(f"Query log not found: {args.log}")
+    else:
+        replay(args.log)
+
+
+if __name__ == "__main__":
+    main()
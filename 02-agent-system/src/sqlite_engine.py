@@ -0,0 +1,177 @@
+"""
+In-process, read-only SQLite engine for ad-hoc sales queries.
+
+The database is built once from populate_sales_data.sql into .cache/sales_data.db, indexed for the
+columns the agent filters and groups on, and rebuilt only when the script changes. Queries run on a
+small pool of read-only aiosqlite connections with a per-statement time limit and a row cap.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+SQL_SCRIPT = Path(__file__).parent / "shared" / "database" / "data-generator" / "populate_sales_data.sql"
+DEFAULT_DATABASE = Path(__file__).parent / ".cache" / "sales_data.db"
+
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "4"))
+TIME_LIMIT_S = float(os.getenv("SQLITE_TIME_LIMIT_S", "2.0"))
+MAX_ROWS = int(os.getenv("SQLITE_MAX_ROWS", "100"))
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sales_region ON sales_data (region)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_category ON sales_data (main_category, product_type)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_period ON sales_data (year, month)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_month_date ON sales_data (month_date)",
+]
+
+# Number of SQLite virtual machine instructions between time limit checks
+PROGRESS_INTERVAL = 1000
+
+
+class QueryTimeoutError(Exception):
+    """Raised when a query runs longer than the engine's time limit."""
+
+
+class SQLiteEngine:
+    """Pool of read-only aiosqlite connections to the local sales database."""
+
+    def __init__(
+        self,
+        script_path: Path = SQL_SCRIPT,
+        database_path: Path = DEFAULT_DATABASE,
+        *,
+        pool_size: int = POOL_SIZE,
+        time_limit_s: float = TIME_LIMIT_S,
+        max_rows: int = MAX_ROWS,
+    ) -> None:
+        self.script_path = Path(script_path)
+        self.database_path = Path(database_path).resolve()
+        self.pool_size = pool_size
+        self.time_limit_s = time_limit_s
+        self.max_rows = max_rows
+        self.data_version: Optional[str] = None
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: list[aiosqlite.Connection] = []
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Build the database if needed and open the connection pool."""
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            self.data_version = await asyncio.to_thread(self._build)
+
+            pool: asyncio.Queue = asyncio.Queue()
+            for _ in range(self.pool_size):
+                pool.put_nowait(await self._connect())
+            self._pool = pool
+
+    async def close(self) -> None:
+        """Close all pooled connections."""
+        for connection in self._connections:
+            await connection.close()
+        self._connections.clear()
+        self._pool = None
+
+    async def execute(self, query: str, parameters: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+        """
+        Run a single read-only statement and return its rows.
+
+        Returns:
+            A dictionary with the columns, the rows (as dictionaries) and whether the rows were truncated
+            at the row cap.
+
+        Raises:
+            QueryTimeoutError: If the statement runs longer than the time limit.
+            sqlite3.Error: If the statement is invalid or attempts to write.
+        """
+        if self._pool is None:
+            await self.start()
+
+        connection, state = await self._pool.get()
+        started = time.perf_counter()
+        state["deadline"] = time.monotonic() + self.time_limit_s
+        try:
+            async with connection.execute(query, parameters or ()) as cursor:
+                rows = await cursor.fetchmany(self.max_rows + 1)
+                columns = [column[0] for column in cursor.description or []]
+        except sqlite3.OperationalError as e:
+            if state["timed_out"]:
+                raise QueryTimeoutError(f"Query exceeded the time limit of {self.time_limit_s}s") from e
+            raise
+        finally:
+            state["deadline"], state["timed_out"] = math.inf, False
+            self._pool.put_nowait((connection, state))
+
+        truncated = len(rows) > self.max_rows
+        rows = rows[: self.max_rows]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.debug("SQLite query returned %d rows in %.1f ms", len(rows), elapsed_ms)
+        return {
+            "columns": columns,
+            "results": [dict(zip(columns, row, strict=True)) for row in rows],
+            "truncated": truncated,
+            "elapsed_ms": round(elapsed_ms, 2),
+        }
+
+    async def _connect(self) -> tuple[aiosqlite.Connection, dict[str, Any]]:
+        connection = await aiosqlite.connect(f"{self.database_path.as_uri()}?mode=ro", uri=True)
+        await connection.execute("PRAGMA query_only = ON")
+        state = {"deadline": math.inf, "timed_out": False}
+
+        def check_deadline() -> int:
+            # A non-zero return value interrupts the running statement
+            if time.monotonic() > state["deadline"]:
+                state["timed_out"] = True
+                return 1
+            return 0
+
+        await connection.set_progress_handler(check_deadline, PROGRESS_INTERVAL)
+        self._connections.append(connection)
+        return connection, state
+
+    def _build(self) -> str:
+        """Create the database from the SQL script unless an up-to-date copy exists; return its version."""
+        script = self.script_path.read_text(encoding="utf-8")
+        version = hashlib.sha256("\n".join([script, *INDEXES]).encode("utf-8")).hexdigest()[:16]
+
+        if self.database_path.exists():
+            try:
+                with closing(sqlite3.connect(f"{self.database_path.as_uri()}?mode=ro", uri=True)) as connection:
+                    row = connection.execute("SELECT value FROM engine_meta WHERE key = 'version'").fetchone()
+                if row and row[0] == version:
+                    return version
+            except sqlite3.Error:
+                logger.debug("Rebuilding unreadable database %s", self.database_path)
+
+        logger.info("Building SQLite database %s", self.database_path)
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        building = self.database_path.with_suffix(".building")
+        building.unlink(missing_ok=True)
+
+        connection = sqlite3.connect(building)
+        try:
+            connection.executescript(script)
+            for statement in INDEXES:
+                connection.execute(statement)
+            connection.execute("CREATE TABLE engine_meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("INSERT INTO engine_meta VALUES ('version', ?)", (version,))
+            connection.commit()
+            connection.execute("ANALYZE")
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+
+        building.replace(self.database_path)
+        return version
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Undo a finished step, such as deleting the thread it created, given the step's result
+Cleanup = Callable[[Any], Awaitable[None]]
+
+
+class StartupGraph:
+    """
+    Run startup steps as a dependency graph: each step starts as soon as the steps it depends on are done.
+
+    A step receives the results of its dependencies as keyword arguments named after them. When a step fails,
+    the steps that already finished are undone by their cleanup callbacks, so no resources are left behind.
+    """
+
+    def __init__(self) -> None:
+        self._steps: dict[str, tuple[Callable[..., Awaitable[Any]], tuple[str, ...]]] = {}
+        self._cleanups: dict[str, Cleanup] = {}
+        self.timings: dict[str, tuple[float, float]] = {}
+        self.wall_s = 0.0
+
+    def add(
+        self,
+        name: str,
+        step: Callable[..., Awaitable[Any]],
+        *,
+        after: tuple[str, ...] = (),
+        cleanup: Optional[Cleanup] = None,
+    ) -> None:
+        """Add a step that runs after the steps named in after, undone by cleanup if the startup fails."""
+        for dependency in after:
+            if dependency not in self._steps:
+                raise ValueError(f"Step {name} depends on unknown step {dependency}")
+        self._steps[name] = (step, after)
+        if cleanup:
+            self._cleanups[name] = cleanup
+
+    async def run(self) -> dict[str, Any]:
+        """Run all steps and return their results by name. The first failing step cancels the rest."""
+        started = time.perf_counter()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_step(name: str) -> object:
+            step, after = self._steps[name]
+            dependencies = {dependency: await tasks[dependency] for dependency in after}
+            step_started = time.perf_counter()
+            try:
+                return await step(**dependencies)
+            finally:
+                self.timings[name] = (step_started - started, time.perf_counter() - started)
+
+        # Steps are added after their dependencies, so every dependency task exists before it is awaited
+        for name in self._steps:
+            tasks[name] = asyncio.create_task(run_step(name), name=f"startup {name}")
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            await self._clean_up(tasks)
+            raise
+        finally:
+            self.wall_s = time.perf_counter() - started
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    async def _clean_up(self, tasks: dict[str, asyncio.Task]) -> None:
+        """Undo the steps that finished before the startup failed."""
+        finished = {
+            name: task.result()
+            for name, task in tasks.items()
+            if name in self._cleanups and not task.cancelled() and task.exception() is None
+        }
+        results = await asyncio.gather(
+            *(self._cleanups[name](result) for name, result in finished.items()), return_exceptions=True
+        )
+        for name, result in zip(finished, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.error("Failed to clean up startup step %s: %s", name, result)
+
+    def report(self, width: int = 40) -> str:
+        """Startup time breakdown with a bar per step showing when it ran."""
+        if not self.timings:
+            return "No startup steps ran."
+        scale = width / self.wall_s if self.wall_s else 0
+        lines = ["Startup timings:"]
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            bar = " " * int(start * scale) + "#" * max(int((end - start) * scale), 1)
+            lines.append(f"  {name:<14} {start * 1000:8.0f} ms +{(end - start) * 1000:7.0f} ms  |{bar:<{width}}|")
+        sequential = sum(end - start for start, end in self.timings.values())
+        lines.append(f"  {'total':<14} {self.wall_s * 1000:8.0f} ms (steps one after another: {sequential * 1000:.0f} ms)")
+        return "\n".join(lines)
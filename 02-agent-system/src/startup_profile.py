@@ -0,0 +1,176 @@
+"""
+Cold-start profile of the agent CLI.
+
+Each run starts a fresh interpreter that imports main.py and builds the project client, data access and tool
+set, as the CLI does before its first request to the service. No .env file or connection string is needed.
+The wall time of the median run is checked against STARTUP_TARGET_MS, and the packages loaded by the import
+of main.py against DEFERRED_PACKAGES, so a heavy import that comes back at the top of a module fails the
+check. One more run with python -X importtime breaks the import time down by the modules main.py and its
+setup import, and by package.
+
+    python startup_profile.py                  # or python main.py --profile-startup
+    python startup_profile.py --target-ms 1500 # exits with status 1 when the cold start is slower
+
+The network part of the startup (thread, schema and agent) is shown by python main.py --timings.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+STARTUP_TARGET_MS = float(os.getenv("STARTUP_TARGET_MS", "2000"))
+
+# Packages that only setup() and the modes may load, so --help and the import of main.py stay fast
+DEFERRED_PACKAGES = ("azure", "aiohttp", "httpx", "aiosqlite")
+# Packages that nothing uses, so nothing may load them
+UNUSED_PACKAGES = ("pandas",)
+
+# Run in the fresh interpreter: the time of the imports of main.py and of its setup, which imports the rest,
+# and the packages loaded after each
+PROBE = """
+import json, sys, time
+def packages():
+    return sorted({name.split(".")[0] for name in sys.modules})
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+on_import = packages()
+main.setup(check_env=False)
+print(json.dumps({
+    "imports_ms": (imported - started) * 1000,
+    "setup_ms": (time.perf_counter() - imported) * 1000,
+    "packages_on_import": on_import,
+    "packages": packages(),
+}))
+"""
+
+
+@dataclass
+class ImportTime:
+    """One line of python -X importtime."""
+
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|", 2)
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append(ImportTime(name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def imports_of(imports: list[ImportTime], module: str) -> list[ImportTime]:
+    """The modules a module imported directly. Nested imports are listed before the module that imported them."""
+    pending: list[ImportTime] = []
+    for entry in imports:
+        if entry.depth == 0:
+            if entry.name == module:
+                return sorted(pending, key=lambda child: child.cumulative_us, reverse=True)
+            pending = []
+        elif entry.depth == 1:
+            pending.append(entry)
+    return []
+
+
+def imports_after(imports: list[ImportTime], module: str) -> list[ImportTime]:
+    """The modules imported at the top level after a module, such as those a function of the module imported."""
+    names = [entry.name for entry in imports]
+    if module not in names:
+        return []
+    later = [entry for entry in imports[names.index(module) + 1 :] if entry.depth == 0]
+    return sorted(later, key=lambda entry: entry.cumulative_us, reverse=True)
+
+
+def by_package(imports: list[ImportTime]) -> list[tuple[str, int]]:
+    totals: dict[str, int] = defaultdict(int)
+    for entry in imports:
+        totals[entry.name.split(".")[0]] += entry.self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def run_probe(*, importtime: bool = False) -> tuple[float, dict[str, Any], str]:
+    """Start a fresh interpreter on the probe. Returns its wall time, the probe's timings and its stderr."""
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", PROBE]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=Path(__file__).parent, capture_output=True, text=True, check=False)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("The startup probe failed:\n" + "\n".join(errors[-20:]))
+    return wall_ms, json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def import_problems(timings: dict[str, Any]) -> list[str]:
+    """The deferred packages the import of main.py loaded and the unused packages loaded at all."""
+    problems = [
+        f"importing main.py loads {package}, which only setup() should load"
+        for package in DEFERRED_PACKAGES
+        if package in timings["packages_on_import"]
+    ]
+    problems += [f"{package} is loaded but not used" for package in UNUSED_PACKAGES if package in timings["packages"]]
+    return problems
+
+
+def profile_startup(runs: int = 3, target_ms: float = STARTUP_TARGET_MS, top: int = 10) -> int:
+    """
+    Print the cold start profile. Returns the exit status: 1 if the median cold start misses the target or a
+    deferred or unused package is loaded too early.
+    """
+    try:
+        results = [run_probe() for _ in range(runs)]
+        _, _, importtime = run_probe(importtime=True)
+    except RuntimeError as e:
+        print(e)
+        return 2
+
+    wall_ms = statistics.median(wall for wall, _, _ in results)
+    imports_ms = statistics.median(timings["imports_ms"] for _, timings, _ in results)
+    setup_ms = statistics.median(timings["setup_ms"] for _, timings, _ in results)
+    interpreter_ms = max(wall_ms - imports_ms - setup_ms, 0.0)
+    problems = import_problems(results[0][1])
+    verdict = "OK" if wall_ms <= target_ms else "too slow"
+    print(f"Cold start (median of {runs} runs): {wall_ms:.0f} ms, target {target_ms:.0f} ms: {verdict}")
+    print(f"  interpreter {interpreter_ms:.0f} ms, imports {imports_ms:.0f} ms, setup {setup_ms:.0f} ms")
+
+    imports = parse_importtime(importtime)
+    print("Imports of main.py (cumulative, with python -X importtime):")
+    for entry in imports_of(imports, "main")[:top]:
+        print(f"  {entry.name:<32} {entry.cumulative_us / 1000:8.1f} ms")
+    print("Imports of its setup:")
+    for entry in imports_after(imports, "main")[:top]:
+        print(f"  {entry.name:<32} {entry.cumulative_us / 1000:8.1f} ms")
+    print("Import time by package:")
+    for package, self_us in by_package(imports)[:top]:
+        print(f"  {package:<32} {self_us / 1000:8.1f} ms")
+    for problem in problems:
+        print(f"Import check failed: {problem}")
+    return 0 if wall_ms <= target_ms and not problems else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Profile the cold start of the agent CLI.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to time.")
+    parser.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS, help="Slowest acceptable cold start.")
+    parser.add_argument("--top", type=int, default=10, help="Imports and packages listed.")
+    args = parser.parse_args()
+    sys.exit(profile_startup(args.runs, args.target_ms, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-from typing import Any
+import asyncio
+import logging
+from typing import Any, Optional
 
 from azure.ai.projects.aio import AIProjectClient
 from azure.ai.projects.models import (
@@ -9,25 +11,68 @@ from azure.ai.projects.models import (
     RunStep,
     RunStepDeltaChunk,
     RunStepStatus,
+    StreamEventData,
     ThreadMessage,
     ThreadRun,
 )
 
+from perf_log import RunPerf, ToolStep, append_perf_record
+from stream_recorder import StreamRecorder
+from token_renderer import TokenRenderer
+from tool_output_store import spilled_chars
 from utilities import Utilities
 
+logger = logging.getLogger(__name__)
+
+# Run statuses after which the run makes no more progress
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete"}
+
 
 class StreamEventHandler(AsyncAgentEventHandler[str]):
     """Handle LLM streaming events and tokens."""
 
-    def __init__(self, functions: AsyncFunctionTool, project_client: AIProjectClient, utilities: Utilities) -> None:
+    def __init__(
+        self,
+        functions: AsyncFunctionTool,
+        project_client: Optional[AIProjectClient],
+        utilities: Utilities,
+        *,
+        show_perf: bool = True,
+        log_perf: bool = True,
+        recorder: Optional[StreamRecorder] = None,
+    ) -> None:
         self.functions = functions
         self.project_client = project_client
         self.util = utilities
+        self.show_perf = show_perf
+        self.log_perf = log_perf
+        self.recorder = recorder
+        self.run: Optional[ThreadRun] = None
+        self.answer = ""
+        self.has_files = False
+        self.downloads: list[asyncio.Task] = []
+        # Timings are measured from the creation of the handler, just before the run is requested
+        self.perf = RunPerf()
+        # Tokens are written at a fixed frame rate rather than flushed one by one
+        self.renderer = TokenRenderer()
         super().__init__()
 
+    async def _process_event(self, event_data_str: str) -> tuple[str, StreamEventData, Optional[str]]:
+        # Every raw event of the run passes through here, including those after submitted tool outputs
+        if self.recorder:
+            self.recorder.record(event_data_str)
+        return await super()._process_event(event_data_str)
+
     async def on_message_delta(self, delta: MessageDeltaChunk) -> None:
         """Handle message delta events. This will be the streamed token"""
-        self.util.log_token_blue(delta.text)
+        if self.perf.ttft_ms is None:
+            self.perf.ttft_ms = self.perf.elapsed_ms()
+        self.answer += delta.text
+        self.write_token(delta.text)
+
+    def write_token(self, text: str) -> None:
+        """Show a streamed token. The console handler renders it; other front ends override this."""
+        self.renderer.write(text)
 
     async def on_thread_message(self, message: ThreadMessage) -> None:
         """Handle thread message events."""
@@ -36,17 +81,40 @@ class StreamEventHandler(AsyncAgentEventHandler[str]):
         #     print()
         # self.util.log_msg_purple(f"ThreadMessage created. ID: {message.id}, " f"Status: {message.status}")
 
-        await self.util.get_files(message, self.project_client)
+        if message.image_contents or message.attachments:
+            self.has_files = True
+            if self.project_client is None:
+                # A replayed run's files only exist in the project
+                return
+            # Download in the background, so the stream is not held up; on_done waits for the downloads
+            self.downloads.append(asyncio.create_task(self.util.get_files(message, self.project_client)))
 
     async def on_thread_run(self, run: ThreadRun) -> None:
         """Handle thread run events"""
+        self.run = run
+        if run.status in TERMINAL_RUN_STATUSES and self.perf.total_ms is None:
+            self.finish_perf(run)
         # print(f"ThreadRun status: {run.status}")
 
         if run.status == "failed":
-            print(f"Run failed. Error: {run.last_error}")
+            await self.on_error(f"Run failed: {run.last_error}")
 
     async def on_run_step(self, step: RunStep) -> None:
-        pass
+        if step.type == "tool_calls":
+            tool_step = self.perf.tool_steps.get(step.id)
+            if tool_step is None:
+                tools = [
+                    tool_call.function.name if tool_call.type == "function" else tool_call.type
+                    for tool_call in step.step_details.tool_calls
+                ]
+                tool_step = self.perf.tool_steps[step.id] = ToolStep(tools, self.perf.elapsed_ms())
+            if step.status in TERMINAL_RUN_STATUSES and tool_step.end_ms is None:
+                tool_step.end_ms = self.perf.elapsed_ms()
+                # The outputs that went into the thread, and the large results kept out of it
+                for tool_call in step.step_details.tool_calls:
+                    if tool_call.type == "function" and tool_call.function.output:
+                        self.perf.tool_output_chars += len(tool_call.function.output)
+                        self.perf.spilled_chars += spilled_chars(tool_call.function.output)
         # if step.status == RunStepStatus.COMPLETED:
         #     print()
         # self.util.log_msg_purple(f"RunStep type: {step.type}, Status: {step.status}")
@@ -54,12 +122,34 @@ class StreamEventHandler(AsyncAgentEventHandler[str]):
     async def on_run_step_delta(self, delta: RunStepDeltaChunk) -> None:
         pass
 
+    def finish_perf(self, run: ThreadRun) -> None:
+        """Complete the run's performance record, print its summary line and append it to the performance log."""
+        self.renderer.flush()
+        perf = self.perf
+        perf.total_ms = perf.elapsed_ms()
+        perf.run_id, perf.thread_id, perf.model, perf.status = run.id, run.thread_id, run.model, run.status
+        if run.usage:
+            perf.prompt_tokens = run.usage.prompt_tokens
+            perf.completion_tokens = run.usage.completion_tokens
+        for tool_step in perf.tool_steps.values():
+            tool_step.end_ms = tool_step.end_ms or perf.total_ms
+
+        if self.log_perf:
+            append_perf_record(perf.record())
+        if self.show_perf:
+            self.util.log_msg_purple(f"\n[{perf.line()}]")
+
     async def on_error(self, data: str) -> None:
+        self.renderer.flush()
         print(f"An error occurred. Data: {data}")
 
     async def on_done(self) -> None:
         """Handle stream completion."""
-        pass
+        self.renderer.flush()
+        if self.downloads:
+            await asyncio.gather(*self.downloads)
+        if self.renderer.deltas:
+            logger.info("Tokens: %s", self.renderer.summary())
         # self.util.log_msg_purple(f"\nStream completed.")
 
     async def on_unhandled_event(self, event_type: str, event_data: Any) -> None:
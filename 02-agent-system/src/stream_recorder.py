@@ -0,0 +1,222 @@
+"""
+Record and replay of agent event streams, for benchmarks of the stream handler without the agent service.
+
+With RECORD_STREAMS=true every run's raw stream events (message deltas, messages, run and run step events,
+including the tool calls a run requires) are written to .cache/streams/<time>-<thread>.jsonl, one compact
+JSON object per event with its arrival time in milliseconds since the run was requested:
+
+    {"t": 812.4, "event": "event: thread.message.delta\\ndata: {...}"}
+
+A replay feeds the recorded events through the same parsing and dispatch path as a live stream, at the
+recorded speed or as fast as possible. Tool calls the run required are executed locally by a tool set,
+with the data functions against the mock server, and the recorded events continue once they are done.
+
+    python stream_recorder.py .cache/streams/20250101-120000-thread_abc.jsonl           # as fast as possible
+    python stream_recorder.py .cache/streams/*.jsonl --speed 1 --render                  # at recorded speed
+    python stream_recorder.py .cache/streams/*.jsonl --repeat 20 --profile azure         # tool latency included
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from azure.ai.projects.models import BaseAsyncAgentEventHandler, ThreadRun
+
+    from agent_toolset import AgentToolSet
+    from stream_event_handler import StreamEventHandler
+
+logger = logging.getLogger(__name__)
+
+RECORD_STREAMS = os.getenv("RECORD_STREAMS", "false").lower() == "true"
+
+DEFAULT_STREAM_DIR = Path(__file__).parent / ".cache" / "streams"
+
+
+class StreamRecorder:
+    """Collect the raw events of one run's stream and write them to a JSONL file when the run ends."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.started = time.perf_counter()
+        self.events: list[dict[str, Any]] = []
+
+    @classmethod
+    def for_thread(cls, thread_id: str, directory: Path = DEFAULT_STREAM_DIR) -> "StreamRecorder":
+        return cls(Path(directory) / f"{time.strftime('%Y%m%d-%H%M%S')}-{thread_id}.jsonl")
+
+    def record(self, event_data_str: str) -> None:
+        self.events.append({"t": round((time.perf_counter() - self.started) * 1000, 1), "event": event_data_str})
+
+    def save(self) -> Optional[Path]:
+        """Write the recorded events, returning the file (None if nothing was recorded or it failed)."""
+        if not self.events:
+            return None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("w", encoding="utf-8") as file:
+                for event in self.events:
+                    file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.error("Failed to save the stream recording %s: %s", self.path, e)
+            return None
+        return self.path
+
+
+def load_recording(path: Path) -> list[tuple[float, str]]:
+    """The (milliseconds, raw event) pairs of a recording."""
+    events = []
+    with Path(path).open(encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                event = json.loads(line)
+                events.append((float(event["t"]), event["event"]))
+    return events
+
+
+@dataclass
+class ReplayStats:
+    """What one replay fed through the handler and how long it took."""
+
+    events: int = 0
+    deltas: int = 0
+    tool_calls: int = 0
+    wall_ms: float = 0.0
+    slept_ms: float = 0.0
+    tool_ms: float = 0.0
+
+    @property
+    def handler_ms(self) -> float:
+        """Time spent parsing, dispatching and rendering, without the replay's waits and the tool calls."""
+        return max(self.wall_ms - self.slept_ms - self.tool_ms, 0.0)
+
+    def add(self, other: "ReplayStats") -> None:
+        for name in ("events", "deltas", "tool_calls", "wall_ms", "slept_ms", "tool_ms"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def line(self) -> str:
+        handler_s = self.handler_ms / 1000 or 1e-9
+        return (
+            f"{self.events} events ({self.deltas} deltas, {self.tool_calls} tool calls) in {self.wall_ms:.1f} ms: "
+            f"handler {self.handler_ms:.1f} ms ({self.events / handler_s:,.0f} events/s, "
+            f"{self.deltas / handler_s:,.0f} deltas/s), tools {self.tool_ms:.1f} ms, waits {self.slept_ms:.1f} ms"
+        )
+
+
+async def _events(events: list[tuple[float, str]], speed: float, stats: ReplayStats) -> AsyncIterator[bytes]:
+    started = time.perf_counter()
+    for t_ms, event in events:
+        if speed > 0:
+            # Waits are measured from the start, so the time the handler and the tools took is not added twice
+            wait = started + t_ms / 1000 / speed - time.perf_counter()
+            if wait > 0:
+                slept = time.perf_counter()
+                await asyncio.sleep(wait)
+                stats.slept_ms += (time.perf_counter() - slept) * 1000
+        stats.events += 1
+        yield f"{event}\n\n".encode("utf-8")
+
+
+async def replay(
+    events: list[tuple[float, str]],
+    handler: "StreamEventHandler",
+    *,
+    speed: float = 0.0,
+    toolset: Optional["AgentToolSet"] = None,
+) -> ReplayStats:
+    """
+    Feed recorded events into an event handler, as a live stream would.
+
+    A speed of 1 replays at the recorded pace, 0 as fast as possible. When the run requires tool outputs,
+    the tool calls are executed by the toolset (if any) and the outputs are dropped, as the recording
+    already holds the events that followed them.
+    """
+    stats = ReplayStats()
+
+    async def submit_tool_outputs(run: "ThreadRun", _event_handler: "BaseAsyncAgentEventHandler") -> None:
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        stats.tool_calls += len(tool_calls)
+        if toolset:
+            started = time.perf_counter()
+            await toolset.execute_tool_calls(tool_calls)
+            stats.tool_ms += (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    handler.initialize(_events(events, speed, stats), submit_tool_outputs)
+    await handler.until_done()
+    stats.wall_ms = (time.perf_counter() - started) * 1000
+    stats.deltas = handler.renderer.deltas
+    return stats
+
+
+async def _benchmark(args: argparse.Namespace) -> None:
+    from azure.ai.projects.models import AsyncFunctionTool
+
+    from agent_toolset import AgentToolSet
+    from enza_data import EnzaData
+    from mock_server import PROFILES, MockServer
+    from stream_event_handler import StreamEventHandler
+    from token_renderer import TokenRenderer
+    from utilities import Utilities
+
+    recordings = {path: load_recording(path) for path in args.recordings}
+    utilities = Utilities()
+    async with MockServer(PROFILES[args.profile]) as server:
+        os.environ["APIM_GATEWAY_URL"] = server.url
+        os.environ.setdefault("APIM_SUBSCRIPTION_KEY", "replay")
+        enza_data = EnzaData(utilities)
+        functions = AsyncFunctionTool(utilities.collect_api_functions(enza_data)[0])
+        toolset = None
+        if not args.no_tools:
+            toolset = AgentToolSet()
+            toolset.add(functions)
+
+        total = ReplayStats()
+        try:
+            with Path(os.devnull).open("w", encoding="utf-8") as devnull:
+                for path, events in recordings.items():
+                    stats = ReplayStats()
+                    for _ in range(args.repeat):
+                        # Without a project client the handler skips the downloads of the recorded files
+                        handler = StreamEventHandler(
+                            functions=functions,
+                            project_client=None,
+                            utilities=utilities,
+                            show_perf=False,
+                            log_perf=False,
+                        )
+                        if not args.render:
+                            handler.renderer = TokenRenderer(devnull)
+                        stats.add(await replay(events, handler, speed=args.speed, toolset=toolset))
+                    if args.render:
+                        print()
+                    print(f"{path.name}: {stats.line()}")
+                    total.add(stats)
+        finally:
+            await enza_data.close()
+
+    if len(recordings) > 1:
+        print(f"Total: {total.line()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded agent event streams through the stream handler.")
+    parser.add_argument("recordings", type=Path, nargs="+", help="Recordings from .cache/streams.")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 for the recorded pace, 0 as fast as possible.")
+    parser.add_argument("--repeat", type=int, default=1, help="Replays of each recording.")
+    parser.add_argument("--render", action="store_true", help="Render the answers to the console.")
+    parser.add_argument("--no-tools", action="store_true", help="Do not execute the recorded tool calls.")
+    parser.add_argument("--profile", default="instant", help="Mock server profile for the data tools.")
+    args = parser.parse_args()
+    asyncio.run(_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Frame-rate-limited rendering of streamed tokens.
+
+Printing every delta with flush=True costs one write system call per token, which is slow on remote
+terminals and when the output is piped to a log. TokenRenderer writes the deltas into the buffer of the
+output stream and flushes it at most TOKEN_RENDER_FPS times per second, or right away at a newline.
+Everything else printed to the same stream goes through the same buffer, so the output stays in order.
+Colors are left out when the stream is not a terminal or NO_COLOR is set.
+
+    python token_renderer.py --tokens 2000   # measure the writes saved compared to flushing every delta
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+from typing import Optional, TextIO
+
+from terminal_colors import TerminalColors as tc
+
+TOKEN_RENDER_FPS = float(os.getenv("TOKEN_RENDER_FPS", "30"))
+
+
+def use_color(stream: TextIO) -> bool:
+    """Color only on a terminal, and never when NO_COLOR is set (https://no-color.org)."""
+    if os.getenv("NO_COLOR"):
+        return False
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class TokenRenderer:
+    """Buffer streamed deltas and flush them to the stream at a fixed frame rate or at a newline."""
+
+    def __init__(
+        self, stream: Optional[TextIO] = None, *, fps: float = TOKEN_RENDER_FPS, color: Optional[bool] = None
+    ) -> None:
+        self.stream = stream or sys.stdout
+        self.interval = 1 / fps if fps > 0 else 0.0
+        self.color = use_color(self.stream) if color is None else color
+        self.deltas = self.flushes = 0
+        self._pending = False
+        self._last_flush = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def write(self, text: str) -> None:
+        """Write a delta to the stream buffer; it reaches the screen with the next frame."""
+        if not text:
+            return
+        self.deltas += 1
+        self.stream.write(f"{tc.BLUE}{text}{tc.RESET}" if self.color else text)
+        self._pending = True
+
+        wait = self.interval - (time.monotonic() - self._last_flush)
+        if "\n" in text or wait <= 0:
+            self.flush()
+        elif self._timer is None:
+            try:
+                # The last delta of a burst is shown at the end of the frame even if no other delta follows
+                self._timer = asyncio.get_running_loop().call_later(wait, self.flush)
+            except RuntimeError:
+                self.flush()
+
+    def flush(self) -> None:
+        """Show the buffered deltas now."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        self._pending = False
+        self.stream.flush()
+        self.flushes += 1
+        self._last_flush = time.monotonic()
+
+    def summary(self) -> str:
+        saved = 1 - self.flushes / self.deltas if self.deltas else 0.0
+        return f"{self.deltas} deltas rendered in {self.flushes} writes ({saved:.0%} fewer)"
+
+
+class _CountingRaw(io.RawIOBase):
+    """Binary sink that counts the write calls that would be system calls on a real file."""
+
+    def __init__(self) -> None:
+        self.writes = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.writes += 1
+        return len(data)
+
+
+def _stream() -> tuple[TextIO, _CountingRaw]:
+    raw = _CountingRaw()
+    return io.TextIOWrapper(io.BufferedWriter(raw), encoding="utf-8"), raw
+
+
+async def _measure(tokens: int, tokens_per_s: float, fps: float) -> None:
+    deltas = [("\n" if index % 40 == 39 else f" token{index}") for index in range(tokens)]
+
+    # One print with flush=True per delta, as before
+    stream, unbuffered = _stream()
+    for delta in deltas:
+        print(f"{tc.BLUE}{delta}{tc.RESET}", end="", flush=True, file=stream)
+        await asyncio.sleep(1 / tokens_per_s)
+
+    stream, buffered = _stream()
+    renderer = TokenRenderer(stream, fps=fps, color=True)
+    for delta in deltas:
+        renderer.write(delta)
+        await asyncio.sleep(1 / tokens_per_s)
+    renderer.flush()
+
+    print(f"{tokens} deltas at {tokens_per_s:.0f} tokens/s, {fps:.0f} frames/s")
+    print(f"  flush per delta: {unbuffered.writes} writes")
+    print(f"  renderer:        {buffered.writes} writes ({1 - buffered.writes / unbuffered.writes:.0%} fewer)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the writes the token renderer saves.")
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--tokens-per-s", type=float, default=200)
+    parser.add_argument("--fps", type=float, default=TOKEN_RENDER_FPS)
+    args = parser.parse_args()
+    asyncio.run(_measure(args.tokens, args.tokens_per_s, args.fps))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Size-aware policy for tool outputs.
+
+A tool output becomes part of the thread, so a large result set is sent again with every later prompt of the
+conversation. Outputs longer than TOOL_OUTPUT_MAX_CHARS are written to .cache/tool_outputs instead, and the
+model gets a compact summary: the number of rows, the columns, the first rows, the minimum, maximum and sum of
+each numeric column, and a handle. With the handle the model can page through the rest of the result with the
+read_tool_output function. TOOL_OUTPUT_MAX_CHARS=0 always inlines the outputs.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+TOOL_OUTPUT_MAX_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_CHARS", "8000"))
+TOOL_OUTPUT_PREVIEW_ROWS = int(os.getenv("TOOL_OUTPUT_PREVIEW_ROWS", "10"))
+
+DEFAULT_OUTPUT_DIR = Path(__file__).parent / ".cache" / "tool_outputs"
+
+# Spilled outputs older than this are deleted when the store is created
+MAX_AGE_S = 24 * 3600
+
+# Every summary starts with this, so spilled outputs are recognized without parsing every output
+SPILLED_PREFIX = '{"spilled": true'
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def result_rows(value: object) -> Optional[list[Any]]:
+    """The rows of a result: a list, or the only list in an object such as {"results": [...]}."""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        lists = [item for item in value.values() if isinstance(item, list)]
+        if len(lists) == 1:
+            return lists[0]
+    return None
+
+
+def column_stats(rows: list[Any]) -> dict[str, dict[str, float]]:
+    """Minimum, maximum and sum of each numeric column, so totals can be answered without paging."""
+    stats: dict[str, dict[str, float]] = {}
+    for row in rows:
+        if not isinstance(row, dict):
+            return {}
+        for column, value in row.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            column_stat = stats.setdefault(column, {"min": value, "max": value, "sum": 0})
+            column_stat["min"] = min(column_stat["min"], value)
+            column_stat["max"] = max(column_stat["max"], value)
+            column_stat["sum"] += value
+    for column_stat in stats.values():
+        column_stat["sum"] = round(column_stat["sum"], 2)
+    return stats
+
+
+def spilled_chars(output: str) -> int:
+    """Characters of the full result behind a spilled output's summary, 0 for an inlined output."""
+    if not output.startswith(SPILLED_PREFIX):
+        return 0
+    try:
+        return int(json.loads(output).get("chars", 0))
+    except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+        return 0
+
+
+class ToolOutputStore:
+    """Spill oversized tool outputs to files and page through them for the model."""
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_OUTPUT_DIR,
+        *,
+        max_chars: int = TOOL_OUTPUT_MAX_CHARS,
+        preview_rows: int = TOOL_OUTPUT_PREVIEW_ROWS,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_chars = max_chars
+        self.preview_rows = preview_rows
+        self.spilled = 0
+        self.spilled_chars = self.summary_chars = 0
+        self._prune()
+
+    async def apply(self, name: str, tool_call_id: str, output: str) -> str:
+        """Return the output to send to the model: the output itself, or a summary of it once it is spilled."""
+        if not isinstance(output, str) or not self.max_chars or len(output) <= self.max_chars:
+            return output
+        # Pages are kept within the limit already
+        if name == "read_tool_output":
+            return output
+
+        handle = _UNSAFE.sub("_", f"{name}-{tool_call_id}")
+        try:
+            await asyncio.to_thread(self._write, handle, output)
+        except OSError as e:
+            logger.error("Could not spill the output of %s, sending it inline: %s", name, e)
+            return output
+
+        summary = self._summary(handle, name, output)
+        self.spilled += 1
+        self.spilled_chars += len(output)
+        self.summary_chars += len(summary)
+        logger.info("Spilled %d chars of %s to %s, sent a %d char summary", len(output), name, handle, len(summary))
+        return summary
+
+    async def read_tool_output(self, handle: str, offset: int = 0, limit: int = 20) -> str:
+        """
+        Read more of a large tool result that was replaced by a summary with a handle.
+
+        :param handle: The handle given in the summary of the tool result.
+        :param offset: The first row to return (or, for a result without rows, the first character).
+        :param limit: The number of rows to return (default: 20).
+        :return: A JSON string with the requested rows and the offset of the next page, if there is one.
+        :rtype: str
+        """
+        path = self.directory / f"{_UNSAFE.sub('_', handle)}.json"
+        try:
+            output = await asyncio.to_thread(path.read_text, encoding="utf-8")
+        except OSError:
+            return json.dumps({"error": f"No tool result with handle {handle}"})
+
+        offset = max(offset, 0)
+        try:
+            rows = result_rows(json.loads(output))
+        except json.JSONDecodeError:
+            rows = None
+        if rows is None:
+            page_chars = self.max_chars or 8000
+            text = output[offset : offset + page_chars]
+            next_offset = offset + len(text) if offset + len(text) < len(output) else None
+            return json.dumps({"handle": handle, "offset": offset, "text": text, "next_offset": next_offset})
+
+        page = rows[offset : offset + max(limit, 1)]
+        # A page is kept within the size limit, or paging would put the large result back in the thread
+        while self.max_chars and len(page) > 1 and len(json.dumps(page)) > self.max_chars:
+            page = page[: len(page) // 2]
+        next_offset = offset + len(page) if offset + len(page) < len(rows) else None
+        return json.dumps(
+            {"handle": handle, "offset": offset, "total_rows": len(rows), "rows": page, "next_offset": next_offset}
+        )
+
+    def report(self) -> str:
+        return (
+            f"Tool outputs: {self.spilled} spilled to files, {self.spilled_chars} chars kept out of the thread "
+            f"(sent {self.summary_chars} chars of summaries)"
+        )
+
+    def _summary(self, handle: str, name: str, output: str) -> str:
+        try:
+            rows = result_rows(json.loads(output))
+        except json.JSONDecodeError:
+            rows = None
+        summary: dict[str, Any] = {"spilled": True, "handle": handle, "function": name, "chars": len(output)}
+        if rows is None:
+            summary["preview"] = output[: self.max_chars // 4]
+            summary["note"] = "The result is too large to include. Call read_tool_output with the handle to read it."
+            return json.dumps(summary)
+
+        summary["total_rows"] = len(rows)
+        if rows and isinstance(rows[0], dict):
+            summary["columns"] = list(rows[0])
+        summary["column_stats"] = column_stats(rows)
+        summary["note"] = (
+            f"The result has {len(rows)} rows, too many to include. The first rows are in preview. "
+            "Call read_tool_output with the handle and an offset to read more rows."
+        )
+        preview = rows[: self.preview_rows]
+        summary["preview"] = preview
+        text = json.dumps(summary)
+        while len(text) > self.max_chars and preview:
+            preview = preview[: len(preview) // 2]
+            summary["preview"] = preview
+            text = json.dumps(summary)
+        return text
+
+    def _write(self, handle: str, output: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{handle}.json").write_text(output, encoding="utf-8")
+
+    def _prune(self) -> None:
+        if not self.directory.exists():
+            return
+        cutoff = time.time() - MAX_AGE_S
+        for path in self.directory.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
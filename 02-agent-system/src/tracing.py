@@ -0,0 +1,284 @@
+"""
+Span based tracing for agent turns, tool calls and function app requests.
+
+Spans of one agent turn share a trace id. The trace and parent span are propagated to APIM and the
+Function App through the hierarchical Request-Id header (``|<trace_id>.<span_id>.``), and the phases the
+function app reports back in its Server-Timing header are recorded as child spans of the HTTP call.
+
+Run ``python tracing.py summary`` to print the critical path of the last recorded turn.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_FILE = Path(__file__).parent / ".cache" / "traces.jsonl"
+
+# Traces whose root span was exported are remembered, so spans that end later are exported on their own
+MAX_EXPORTED_TRACES = 1000
+
+
+@dataclass
+class Span:
+    """A timed unit of work within a trace."""
+
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start: float
+    end: Optional[float] = None
+    status: str = "ok"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        """Duration of the span in milliseconds."""
+        return ((self.end or time.time()) - self.start) * 1000
+
+
+class JsonlSpanExporter:
+    """Append finished spans to a JSONL file, one span per line."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def export(self, spans: list[Span]) -> None:
+        """Write a batch of spans to the file."""
+        if not spans:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as file:
+            file.writelines(json.dumps(asdict(span)) + "\n" for span in spans)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Create spans and hand them to the exporter once the root span of a trace ends."""
+
+    def __init__(self, exporter: Optional[JsonlSpanExporter] = None) -> None:
+        self.exporter = exporter
+        self._pending: dict[str, list[Span]] = {}
+        self._exported: OrderedDict[str, None] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Create a tracer configured by TRACING_ENABLED and TRACE_FILE."""
+        if os.getenv("TRACING_ENABLED", "true").lower() not in {"1", "true", "yes"}:
+            return cls()
+        return cls(JsonlSpanExporter(Path(os.getenv("TRACE_FILE", str(DEFAULT_TRACE_FILE)))))
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        """Return the active span of the calling task, if any."""
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, *, start: Optional[float] = None, **attributes: object) -> Iterator[Span]:
+        """Run the enclosed block as a child of the current span, or as the root of a new trace."""
+        parent = _current_span.get()
+        span = Span(
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            name=name,
+            start=start or time.time(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            span.end = time.time()
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record_span(self, name: str, start: float, end: float, parent: Span, **attributes: object) -> Span:
+        """Record an already finished span, e.g. a phase measured by a remote service."""
+        span = Span(
+            trace_id=parent.trace_id,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id,
+            name=name,
+            start=start,
+            end=end,
+            attributes=attributes,
+        )
+        self._finish(span)
+        return span
+
+    def record_server_timing(self, parent: Span, header: Optional[str]) -> None:
+        """
+        Record the phases of a Server-Timing header (``connect;dur=1.2, execute;dur=30``) as children of parent.
+
+        The remote phases are laid out back to back, centred in the client side span, since only their
+        durations travel back over the wire.
+        """
+        phases = parse_server_timing(header)
+        if not phases:
+            return
+        remote_ms = sum(duration for _, duration in phases)
+        cursor = parent.start + max(parent.duration_ms - remote_ms, 0) / 2000
+        for name, duration in phases:
+            self.record_span(f"remote {name}", cursor, cursor + duration / 1000, parent, remote=True)
+            cursor += duration / 1000
+
+    def request_id(self, span: Optional[Span] = None) -> str:
+        """Build the hierarchical Request-Id header value for span (default: the current span)."""
+        span = span or _current_span.get()
+        if span is None:
+            return f"|{uuid.uuid4().hex}."
+        return f"|{span.trace_id}.{span.span_id}."
+
+    def _finish(self, span: Span) -> None:
+        if self.exporter is None:
+            return
+        if span.trace_id in self._exported:
+            # A span that outlived its root, such as a background download: its trace is already written
+            self._export([span])
+            return
+        pending = self._pending.setdefault(span.trace_id, [])
+        pending.append(span)
+        # Flush once per trace so a turn costs a single file write
+        if span.parent_id is None:
+            self._export(self._pending.pop(span.trace_id))
+            self._exported[span.trace_id] = None
+            while len(self._exported) > MAX_EXPORTED_TRACES:
+                self._exported.popitem(last=False)
+
+    def _export(self, spans: list[Span]) -> None:
+        try:
+            self.exporter.export(spans)
+        except OSError as e:
+            logger.error("Failed to export spans: %s", e)
+
+
+def parse_request_id(value: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """Split a hierarchical Request-Id into (trace_id, parent_span_id)."""
+    if not value:
+        return None, None
+    parts = [part for part in value.strip("|").split(".") if part]
+    if not parts:
+        return None, None
+    return parts[0], parts[-1] if len(parts) > 1 else None
+
+
+def parse_server_timing(header: Optional[str]) -> list[tuple[str, float]]:
+    """Parse a Server-Timing header into (name, duration_ms) pairs."""
+    phases = []
+    for metric in (header or "").split(","):
+        name, *params = (part.strip() for part in metric.split(";"))
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key == "dur":
+                try:
+                    phases.append((name, float(value)))
+                except ValueError:
+                    logger.debug("Ignoring malformed Server-Timing metric: %s", metric)
+    return phases
+
+
+tracer = Tracer.from_env()
+
+
+def load_spans(path: Path) -> list[Span]:
+    """Load all spans from a JSONL trace file."""
+    with Path(path).open("r", encoding="utf-8") as file:
+        return [Span(**json.loads(line)) for line in file if line.strip()]
+
+
+def critical_path(root: Span, spans: list[Span]) -> list[tuple[int, Span]]:
+    """
+    Return the chain of spans that determined the duration of root, as (depth, span) pairs.
+
+    Walking back from the end of a span, the child that finished last is on the critical path; before it,
+    the last child that finished before that one started, and so on.
+    """
+    children: dict[str, list[Span]] = {}
+    for span in spans:
+        if span.parent_id:
+            children.setdefault(span.parent_id, []).append(span)
+
+    def walk(span: Span, depth: int) -> list[tuple[int, Span]]:
+        chain, cursor = [], span.end or span.start
+        for child in sorted(children.get(span.span_id, []), key=lambda s: s.end or s.start, reverse=True):
+            if (child.end or child.start) <= cursor + 1e-6:
+                chain.append(child)
+                cursor = child.start
+        path = [(depth, span)]
+        for child in reversed(chain):
+            path.extend(walk(child, depth + 1))
+        return path
+
+    return walk(root, 0)
+
+
+def print_summary(path: Path, trace_id: Optional[str] = None) -> None:
+    """Print the critical path of a turn (default: the most recent one)."""
+    spans = load_spans(path)
+    roots = [span for span in spans if span.parent_id is None and (trace_id is None or span.trace_id == trace_id)]
+    if not roots:
+        print("No matching traces found.")
+        return
+    root = max(roots, key=lambda span: span.start)
+    trace_spans = [span for span in spans if span.trace_id == root.trace_id]
+
+    print(f"Trace {root.trace_id}: {root.name} took {root.duration_ms:.1f} ms ({len(trace_spans)} spans)")
+    print("Critical path:")
+    for depth, span in critical_path(root, trace_spans):
+        share = span.duration_ms / root.duration_ms * 100 if root.duration_ms else 0
+        marker = " !" if span.status != "ok" else ""
+        print(f"  {'  ' * depth}{span.name:<{48 - 2 * depth}} {span.duration_ms:10.1f} ms {share:6.1f}%{marker}")
+
+
+def print_traces(path: Path, limit: int) -> None:
+    """List the most recent turns with their durations."""
+    roots = [span for span in load_spans(path) if span.parent_id is None]
+    for span in sorted(roots, key=lambda s: s.start)[-limit:]:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(span.start))
+        print(f"{started}  {span.trace_id}  {span.name:<24} {span.duration_ms:10.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect agent traces.")
+    parser.add_argument("--file", type=Path, default=Path(os.getenv("TRACE_FILE", str(DEFAULT_TRACE_FILE))))
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="Print the critical path of a turn.")
+    summary.add_argument("trace_id", nargs="?", help="Trace to summarize (default: the most recent turn).")
+    listing = commands.add_parser("list", help="List recent turns.")
+    listing.add_argument("-n", type=int, default=20, help="Number of turns to list.")
+    args = parser.parse_args()
+
+    if not args.file.exists():
+        print(f"Trace file not found: {args.file}")
+        return
+    if args.command == "summary":
+        print_summary(args.file, args.trace_id)
+    else:
+        print_traces(args.file, args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import OpenAIFile, VectorStore
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_FILE = Path(__file__).parent / ".cache" / "uploads.json"
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def vector_store_key(name: str, file_ids: list[str]) -> str:
+    """
+    The same files in a store of the same name give the same key, whatever their order. Unchanged files keep
+    their remote IDs, and a file uploaded again gets a new ID and so a new store.
+    """
+    return hashlib.sha256(json.dumps([name, sorted(file_ids)]).encode("utf-8")).hexdigest()
+
+
+class UploadManifest:
+    """
+    Local record of uploaded files and vector stores by content hash, so unchanged files are not uploaded again.
+
+    A recorded remote ID is checked with one cheap GET before it is reused; a file or store that no longer
+    exists is uploaded or created again.
+    """
+
+    def __init__(self, path: Path = DEFAULT_MANIFEST_FILE) -> None:
+        self.path = Path(path)
+        self._entries: dict[str, dict[str, Any]] = self._load()
+        self._entries.setdefault("files", {})
+        self._entries.setdefault("vector_stores", {})
+
+    async def upload_file(
+        self, project_client: AIProjectClient, file_path: Path, purpose: str = "assistants"
+    ) -> tuple[OpenAIFile, str]:
+        """
+        Return the uploaded file with this content, uploading it if there is none.
+
+        Returns:
+            The file and how it was obtained: "reused" or "uploaded".
+        """
+        content_hash = await asyncio.to_thread(file_hash, file_path)
+        key = f"{purpose}:{content_hash}"
+        entry = self._entries["files"].get(key)
+        if entry:
+            try:
+                return await project_client.agents.get_file(entry["file_id"]), "reused"
+            except ResourceNotFoundError:
+                logger.info("Uploaded file %s no longer exists", entry["file_id"])
+
+        file_info = await project_client.agents.upload_file(file_path=file_path, purpose=purpose)
+        self._entries["files"][key] = {"file_id": file_info.id, "name": Path(file_path).name, "uploaded": time.time()}
+        self._save()
+        return file_info, "uploaded"
+
+    async def get_vector_store(
+        self, project_client: AIProjectClient, name: str, file_ids: list[str]
+    ) -> Optional[VectorStore]:
+        """Return the recorded vector store of these files if it still exists and is ready, otherwise None."""
+        entry = self._entries["vector_stores"].get(vector_store_key(name, file_ids))
+        if not entry:
+            return None
+        try:
+            vector_store = await project_client.agents.get_vector_store(entry["vector_store_id"])
+        except ResourceNotFoundError:
+            logger.info("Vector store %s no longer exists", entry["vector_store_id"])
+            return None
+        if vector_store.status != "completed" or vector_store.file_counts.failed:
+            logger.info("Vector store %s is %s, creating a new one", vector_store.id, vector_store.status)
+            return None
+        return vector_store
+
+    def record_vector_store(self, name: str, file_ids: list[str], vector_store: VectorStore) -> None:
+        self._entries["vector_stores"][vector_store_key(name, file_ids)] = {
+            "vector_store_id": vector_store.id,
+            "name": name,
+            "created": time.time(),
+        }
+        self._save()
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable upload manifest %s: %s", self.path, e)
+            return {}
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self._entries, indent=2), encoding="utf-8")
@@ -1,14 +1,41 @@
+import asyncio
+import inspect
+import logging
+import os
+import uuid
 from pathlib import Path
+from typing import Optional
 
 from azure.ai.projects.aio import AIProjectClient
 from azure.ai.projects.models import ThreadMessage
 
 from terminal_colors import TerminalColors as tc
+from upload_manifest import UploadManifest
 
-import inspect, uuid
+logger = logging.getLogger(__name__)
+
+# Files of one message downloaded at once
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+# Downloaded chunks are written to disk once this much has been received
+WRITE_BUFFER_BYTES = 1024 * 1024
+# Remote files downloaded within this window are deleted together
+DELETE_BATCH_DELAY_S = 0.5
 
 
 class Utilities:
+    def __init__(self, max_downloads: int = DOWNLOAD_CONCURRENCY) -> None:
+        self._downloads = asyncio.Semaphore(max_downloads)
+        self._pending_deletes: list[str] = []
+        self._delete_task: Optional[asyncio.Task] = None
+        self._uploads: Optional[UploadManifest] = None
+
+    @property
+    def uploads(self) -> UploadManifest:
+        """Record of the files uploaded by content hash, loaded on first use."""
+        if self._uploads is None:
+            self._uploads = UploadManifest()
+        return self._uploads
+
     # propert to get the relative path of shared files
     @property
     def shared_files_path(self) -> Path:
@@ -38,10 +65,13 @@ class Utilities:
         """Generate a unique identifier."""
         return str(uuid.uuid4())
 
-    async def get_file(self, project_client: AIProjectClient, file_id: str, attachment_name: str) -> None:
-        """Retrieve the file and save it to the local disk."""
-        self.log_msg_green(f"Getting file with ID: {file_id}")
+    async def get_file(self, project_client: AIProjectClient, file_id: str, attachment_name: str) -> Path:
+        """
+        Retrieve the file and save it to the local disk.
 
+        Disk writes run on a worker thread, so the event loop keeps streaming tokens meanwhile, and the
+        remote file is deleted in the background.
+        """
         attachment_part = attachment_name.split(":")[-1]
         file_name = Path(attachment_part).stem
         file_extension = Path(attachment_part).suffix
@@ -51,17 +81,34 @@ class Utilities:
         folder_path.mkdir(parents=True, exist_ok=True)
         file_path = folder_path / file_name
 
-        # Save the file using a synchronous context manager
-        with file_path.open("wb") as file:
-            async for chunk in await project_client.agents.get_file_content(file_id):
-                file.write(chunk)
+        async with self._downloads:
+            self.log_msg_green(f"Getting file with ID: {file_id}")
+            # Written under a temporary name, so a failed download leaves no truncated file behind
+            part_path = file_path.with_name(file_path.name + ".part")
+            file = await asyncio.to_thread(part_path.open, "wb")
+            try:
+                buffer = bytearray()
+                async for chunk in await project_client.agents.get_file_content(file_id):
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_BYTES:
+                        data, buffer = buffer, bytearray()
+                        await asyncio.to_thread(file.write, data)
+                await asyncio.to_thread(file.write, buffer)
+            except BaseException:
+                await asyncio.to_thread(file.close)
+                part_path.unlink(missing_ok=True)
+                raise
+            await asyncio.to_thread(file.close)
+            await asyncio.to_thread(part_path.replace, file_path)
 
         self.log_msg_green(f"File saved to {file_path}")
         # Cleanup the remote file
-        await project_client.agents.delete_file(file_id)
+        self._delete_later(project_client, file_id)
+        return file_path
 
-    async def get_files(self, message: ThreadMessage, project_client: AIProjectClient) -> None:
-        """Get the image files from the message and kickoff download."""
+    async def get_files(self, message: ThreadMessage, project_client: AIProjectClient) -> list[Path]:
+        """Download the image files and attachments of the message concurrently."""
+        downloads = []
         if message.image_contents:
             for index, image in enumerate(message.image_contents, start=0):
                 attachment_name = (
@@ -69,34 +116,75 @@ class Utilities:
                     if not message.file_path_annotations
                     else message.file_path_annotations[index].text + ".png"
                 )
-                await self.get_file(project_client, image.image_file.file_id, attachment_name)
+                downloads.append((image.image_file.file_id, attachment_name))
         elif message.attachments:
             for index, attachment in enumerate(message.attachments, start=0):
                 attachment_name = (
                     "unknown" if not message.file_path_annotations else message.file_path_annotations[index].text
                 )
-                await self.get_file(project_client, attachment.file_id, attachment_name)
+                downloads.append((attachment.file_id, attachment_name))
+
+        results = await asyncio.gather(
+            *(self.get_file(project_client, file_id, name) for file_id, name in downloads), return_exceptions=True
+        )
+        saved = []
+        for (file_id, _), result in zip(downloads, results, strict=True):
+            if isinstance(result, Exception):
+                logger.error("Failed to download file %s: %s", file_id, result)
+            else:
+                saved.append(result)
+        return saved
+
+    def _delete_later(self, project_client: AIProjectClient, file_id: str) -> None:
+        """Queue a remote file for deletion; queued files are deleted together by one background task."""
+        self._pending_deletes.append(file_id)
+        if self._delete_task is None or self._delete_task.done():
+            self._delete_task = asyncio.create_task(self._delete_files(project_client))
+
+    async def _delete_files(self, project_client: AIProjectClient) -> None:
+        await asyncio.sleep(DELETE_BATCH_DELAY_S)
+        while self._pending_deletes:
+            file_ids, self._pending_deletes = self._pending_deletes, []
+            results = await asyncio.gather(
+                *(project_client.agents.delete_file(file_id) for file_id in file_ids), return_exceptions=True
+            )
+            for file_id, result in zip(file_ids, results, strict=True):
+                if isinstance(result, Exception):
+                    logger.error("Failed to delete remote file %s: %s", file_id, result)
+
+    async def wait_for_deletes(self) -> None:
+        """Wait until the downloaded files have been deleted from the project."""
+        if self._delete_task:
+            await self._delete_task
 
     async def upload_file(self, project_client: AIProjectClient, file_path: Path, purpose: str = "assistants") -> None:
-        """Upload a file to the project."""
-        self.log_msg_purple(f"Uploading file: {file_path}")
-        file_info = await project_client.agents.upload_file(file_path=file_path, purpose=purpose)
-        self.log_msg_purple(f"File uploaded with ID: {file_info.id}")
+        """Upload a file to the project, unless a file with the same content was uploaded before."""
+        file_info, outcome = await self.uploads.upload_file(project_client, file_path, purpose)
+        self.log_msg_purple(f"File {file_path.name} {outcome}, ID: {file_info.id}")
         return file_info
 
     async def create_vector_store(
         self, project_client: AIProjectClient, files: list[str], vector_store_name: str
     ) -> None:
-        """Upload a file to the project."""
+        """
+        Upload files to the project and add them to a vector store.
 
-        file_ids = []
+        Unchanged files and a vector store of the same files are reused; new files are uploaded in parallel.
+        """
         prefix = self.shared_files_path
 
         # Upload the files
-        for file in files:
-            file_path = prefix / file
-            file_info = await self.upload_file(project_client, file_path=file_path, purpose="assistants")
-            file_ids.append(file_info.id)
+        uploads = await asyncio.gather(
+            *(self.uploads.upload_file(project_client, prefix / file, "assistants") for file in files)
+        )
+        for file, (file_info, outcome) in zip(files, uploads, strict=True):
+            self.log_msg_purple(f"File {file} {outcome}, ID: {file_info.id}")
+        file_ids = [file_info.id for file_info, _ in uploads]
+
+        vector_store = await self.uploads.get_vector_store(project_client, vector_store_name, file_ids)
+        if vector_store:
+            self.log_msg_purple(f"Vector store reused, ID: {vector_store.id}")
+            return vector_store
 
         self.log_msg_purple("Creating the vector store")
 
@@ -104,6 +192,7 @@ class Utilities:
         vector_store = await project_client.agents.create_vector_store_and_poll(
             file_ids=file_ids, name=vector_store_name
         )
+        self.uploads.record_vector_store(vector_store_name, file_ids, vector_store)
 
         self.log_msg_purple(f"Vector store created and files added.")
         return vector_store